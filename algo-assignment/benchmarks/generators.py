@@ -0,0 +1,111 @@
+import random
+from models.models import Node, Edge
+from utils import setup_sample
+
+
+class GraphSpec:
+    """
+    Shape of a synthetic graph, independent of the model it is built into.
+    Nodes are `n0`, `n1`, ... and every edge maps `out` of its src node to `in` of its dst node.
+    """
+    __slots__ = ("name", "node_count", "edges")
+
+    def __init__(self, name, node_count, edges):
+        self.name = name
+        self.node_count = node_count
+        self.edges = edges  # list of (src index, dst index), src always comes before dst
+
+    @property
+    def node_ids(self):
+        return [f"n{i}" for i in range(self.node_count)]
+
+
+def chain(size, seed=0):
+    """
+    n0 -> n1 -> ... -> n{size-1}, as deep as a graph of this size can be
+    """
+    return GraphSpec("chain", size, [(i, i + 1) for i in range(size - 1)])
+
+
+def fan_out_in(size, seed=0):
+    """
+    n0 feeds every middle node and every middle node feeds the last node, two very wide levels
+    """
+    if size < 3:
+        return chain(size)
+    sink = size - 1
+    edges = [(0, i) for i in range(1, sink)] + [(i, sink) for i in range(1, sink)]
+    return GraphSpec("fan_out_in", size, edges)
+
+
+def layered_random(size, seed=0, width=None, max_parents=3):
+    """
+    Random DAG of about sqrt(size) levels of about sqrt(size) nodes, all sources of a node are in the previous level.
+    Each node has the node above it as a source (and the one above-left of it, so the graph is one island),
+    plus random sources up to max_parents.
+    """
+    rng = random.Random(seed)
+    width = width or max(1, int(size ** 0.5))
+    edges = []
+    for i in range(width, size):
+        level_start = i // width * width
+        sources = {i - width}
+        if i > level_start:
+            sources.add(i - width - 1)
+        extra = rng.randint(0, max_parents - len(sources)) if max_parents > len(sources) else 0
+        sources.update(rng.sample(range(level_start - width, level_start), min(extra, width)))
+        edges.extend((src, i) for src in sorted(sources))
+    return GraphSpec("layered_random", size, edges)
+
+
+def forest(size, seed=0, tree_size=10):
+    """
+    Many small random trees, size // tree_size islands
+    """
+    rng = random.Random(seed)
+    edges = []
+    for root in range(0, size, tree_size):
+        for i in range(root + 1, min(root + tree_size, size)):
+            edges.append((rng.randrange(root, i), i))
+    return GraphSpec("forest", size, edges)
+
+
+GENERATORS = {
+    "chain": chain,
+    "fan_out_in": fan_out_in,
+    "layered_random": layered_random,
+    "forest": forest,
+}
+
+
+def to_graph(spec: GraphSpec):
+    """
+    Build the pydantic graph of the algo engine, see `setup_sample.get_sample_graph`
+    """
+    ids = spec.node_ids
+    nodes = [Node(id=id, data_in={"in": 0}, data_out={"out": i}) for i, id in enumerate(ids)]
+    edges = [Edge(src_node=ids[src], dst_node=ids[dst], src_to_dst_data_keys={"out": "in"}) for src, dst in spec.edges]
+    return setup_sample.get_sample_graph(nodes=nodes, edges=edges)
+
+
+def to_backend_graph(spec: GraphSpec):
+    """
+    Build the graph model of the backend, whose nodes refer to their edges by id.
+    Needs backend-assignment on sys.path.
+    """
+    from app.models import Graph as BackendGraph, Node as BackendNode, Edge as BackendEdge
+
+    ids = spec.node_ids
+    paths_in = [[] for _ in ids]
+    paths_out = [[] for _ in ids]
+    edges = []
+    for e, (src, dst) in enumerate(spec.edges):
+        edge_id = f"e{e}"
+        paths_out[src].append(edge_id)
+        paths_in[dst].append(edge_id)
+        edges.append(BackendEdge(id=edge_id, src_node=ids[src], dst_node=ids[dst], src_to_dst_data_keys={"out": "in"}))
+    nodes = [
+        BackendNode(id=id, data_in={"in": "0"}, data_out={"out": str(i)}, paths_in=paths_in[i], paths_out=paths_out[i])
+        for i, id in enumerate(ids)
+    ]
+    return BackendGraph(id=spec.name, nodes=nodes, edges=edges)
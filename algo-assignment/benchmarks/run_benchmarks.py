@@ -0,0 +1,186 @@
+"""
+Scaling benchmarks of the graph engine on synthetic graphs.
+
+Run from algo-assignment:
+    python -m benchmarks.run_benchmarks --sizes 10 1000 100000 --output results.json
+    python -m benchmarks.run_benchmarks --compare results.json
+
+Results are saved as JSON with the commit they were measured on, `--compare` prints the ratio of every
+timing to the same timing in an earlier results file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from benchmarks.generators import GENERATORS, to_graph, to_backend_graph
+from models.compact_graph import CompactGraph
+from utils import setup_sample
+from utils.graph_runner import GraphRunner
+from utils.graph_validators import GraphValidator
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "backend-assignment")
+
+
+def time_operation(setup, operation, repeat):
+    """
+    Time `operation(setup())` `repeat` times, setup is not timed.
+    A ValueError raised by the operation (e.g. islands in a forest) is recorded, the timing still counts.
+
+    Returns:
+        dict: best and median seconds, and the error message if the operation raised
+    """
+    timings = []
+    error = None
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        try:
+            operation(arg)
+        except ValueError as e:
+            error = str(e)
+        timings.append(time.perf_counter() - start)
+    return {"best": min(timings), "median": statistics.median(timings), "error": error}
+
+
+def get_operations(graph, backend_graph=None):
+    """
+    (name, setup, operation) of everything that is timed on one graph.
+    Runners and validators are set up fresh for every repeat, so cached plans and compact graphs
+    are only reused where the operation normally reuses them.
+    """
+    config = setup_sample.get_sample_config()
+
+    def runner():
+        return GraphRunner(graph=graph, config=config)
+
+    def compiled_runner():
+        graph_runner = runner()
+        graph_runner.compile()
+        return graph_runner
+
+    def validator():
+        graph_validator = GraphValidator(graph=graph)
+        graph_validator.compact  # converted once, like a validator running all of its checks
+        return graph_validator
+
+    operations = [
+        ("compact_graph.from_graph", lambda: graph, CompactGraph.from_graph),
+        ("runner.toposort", runner, lambda graph_runner: graph_runner.toposort()),
+        ("runner.execute", compiled_runner, lambda graph_runner: graph_runner.execute()),
+        ("runner.check_islands", compiled_runner, lambda graph_runner: graph_runner.check_islands()),
+        ("validator.validate_edge_compatibility", validator, lambda graph_validator: graph_validator.validate_edge_compatibility()),
+        ("validator.detect_cycle", validator, lambda graph_validator: graph_validator.detect_cycle()),
+        ("validator.check_islands", validator, lambda graph_validator: graph_validator.check_islands()),
+        ("validator.validate", validator, lambda graph_validator: graph_validator.validate()),
+    ]
+    if backend_graph is not None:
+        from app.models import RunConfig
+        from app.utils.graph_operations import run_graph
+
+        backend_config = RunConfig(root_inputs={})
+        operations.append(("backend.run_graph", lambda: backend_graph, lambda graph: asyncio.run(run_graph(graph, backend_config))))
+    return operations
+
+
+def load_backend():
+    """
+    Make the backend importable, returns False if it or its dependencies are missing
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.append(BACKEND_DIR)
+    try:
+        import app.utils.graph_operations  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def run_benchmarks(sizes, generators, repeat=3, backend=True, log=print):
+    """
+    Time every operation on a graph of every generator and size.
+
+    Returns:
+        list: one record per (generator, size, operation)
+    """
+    backend = backend and load_backend()
+    records = []
+    for name in generators:
+        for size in sizes:
+            start = time.perf_counter()
+            spec = GENERATORS[name](size)
+            graph = to_graph(spec)
+            build_seconds = time.perf_counter() - start
+            backend_graph = to_backend_graph(spec) if backend else None
+
+            for operation, setup, call in get_operations(graph, backend_graph):
+                record = {
+                    "generator": name,
+                    "size": size,
+                    "edges": len(spec.edges),
+                    "operation": operation,
+                    "build_seconds": build_seconds,
+                    **time_operation(setup, call, repeat),
+                }
+                records.append(record)
+                log(f"{name:>15} {size:>8} {operation:<40} {record['best'] * 1000:12.3f} ms" + (" (raised)" if record["error"] else ""))
+    return records
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(records, baseline, log=print):
+    """
+    Print the ratio of each best timing to the same timing of a baseline results file, above 1 is slower
+    """
+    previous = {(r["generator"], r["size"], r["operation"]): r["best"] for r in baseline["results"]}
+    ratios = {}
+    for record in records:
+        key = (record["generator"], record["size"], record["operation"])
+        if previous.get(key):
+            ratios[key] = record["best"] / previous[key]
+            log(f"{key[0]:>15} {key[1]:>8} {key[2]:<40} {ratios[key]:8.2f}x")
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling benchmarks of the graph engine on synthetic graphs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="node counts, up to 10^6")
+    parser.add_argument("--generators", nargs="+", choices=list(GENERATORS), default=list(GENERATORS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-backend", action="store_true", help="skip the backend run_graph")
+    parser.add_argument("--output", help="save results to this JSON file")
+    parser.add_argument("--compare", help="results JSON file of an earlier commit to compare with")
+    args = parser.parse_args(argv)
+
+    records = run_benchmarks(args.sizes, args.generators, repeat=args.repeat, backend=not args.no_backend)
+    results = {
+        "commit": get_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": records,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(records, json.load(f))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -22,10 +22,8 @@ def validate_graph(graph, config):
         # make a validator object from validator class, providing graph as input
         validator = GraphValidator(graph=graph)
         
-        # calling validation methods, if any of the method fails, it will raise exception at that line and hence error will be raised
-        validator.validate_edge_compatibility()
-        validator.detect_cycle()
-        validator.check_islands()
+        # checks edge compatibility, cycles and islands in a single sweep, raises exception with all the problems found
+        validator.validate()
 
         return True
     except Exception as e:
@@ -49,6 +47,7 @@ def run_graph_operations(graph, config):
             islands: contains 2D array of islands of graph -> each entry in outer list -> different unique island
             toposort_order: topological execution order of graph based on src,dst key by using BFS for implementation
             level_map: contains level map for graph -> each key is a level index -> each value is a list of node_id in that respective level
+            executed_level_map: level map of the nodes actually executed, i.e. without the nodes pruned by enable/disable list
     """
     
     # create a runner object based on graph, config and execute the run operation on that object
@@ -58,6 +57,7 @@ def run_graph_operations(graph, config):
     # store the topological ordering and level map in different variables
     toposort_order = runner.execution_order
     level_map = runner.level_map
+    executed_level_map = runner.executed_level_map
     
     # get output for a specific node ("B" in this case)
     output_B = runner.get_node_output(run_id=run_id, id="B")
@@ -75,6 +75,7 @@ def run_graph_operations(graph, config):
         "islands": islands,
         "toposort_order": toposort_order,
         "level_map": dict(level_map),
+        "executed_level_map": executed_level_map,
     }
 
 
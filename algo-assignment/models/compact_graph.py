@@ -0,0 +1,132 @@
+import sys
+from array import array
+from collections import defaultdict, deque
+from models.models import Graph, Node, Edge
+
+
+class CompactNode:
+    """
+    Lightweight node holding only id and data, edges of a compact graph live in its arrays.
+    """
+    __slots__ = ("id", "data_in", "data_out")
+
+    def __init__(self, id, data_in, data_out):
+        self.id = id
+        self.data_in = data_in
+        self.data_out = data_out
+
+
+class CompactGraph:
+    """
+    Array-backed representation of a graph, an alternative to the pydantic `Graph` for very large graphs.
+    Every edge is stored once (instead of in both paths_in and paths_out) as entries of integer arrays,
+    node ids and data keys are interned, and identical src_to_dst_data_keys mappings share one table entry.
+
+    Edges are grouped by src node in the order of paths_out, so the outgoing edges of node `i` are
+    `out_offsets[i]:out_offsets[i + 1]`. `in_edges` lists edge indices grouped by dst node in the order
+    of paths_in, the incoming edges of node `i` are `in_edges[in_offsets[i]:in_offsets[i + 1]]`.
+    """
+    __slots__ = ("nodes", "node_ids", "edge_src", "edge_dst", "edge_keys", "key_maps", "out_offsets", "in_offsets", "in_edges")
+
+    def __init__(self, nodes, edge_src, edge_dst, edge_keys, key_maps, out_offsets, in_offsets, in_edges):
+        self.nodes = nodes
+        self.node_ids = [node.id for node in nodes]
+        self.edge_src = edge_src
+        self.edge_dst = edge_dst
+        self.edge_keys = edge_keys  # index of the key mapping of each edge in key_maps
+        self.key_maps = key_maps  # tuples of (src_key, dst_key) pairs
+        self.out_offsets = out_offsets
+        self.in_offsets = in_offsets
+        self.in_edges = in_edges
+
+    @property
+    def edge_count(self):
+        return len(self.edge_dst)
+
+    @classmethod
+    def from_graph(cls, graph: Graph):
+        """
+        Convert a pydantic graph into a compact graph.
+
+        Raises:
+            ValueError: If an edge in paths_in of a node has no matching edge in paths_out of its src node.
+        """
+        intern = sys.intern
+        nodes = [
+            CompactNode(
+                id=intern(node.id),
+                data_in={intern(key): value for key, value in node.data_in.items()},
+                data_out={intern(key): value for key, value in node.data_out.items()},
+            )
+            for node in graph.nodes
+        ]
+        index = {node.id: i for i, node in enumerate(nodes)}
+
+        key_tables = {}  # (src_key, dst_key) pairs -> index in key_maps
+        key_maps = []
+
+        def get_key_map(edge):
+            keys = tuple((intern(src_key), intern(dst_key)) for src_key, dst_key in edge.src_to_dst_data_keys.items())
+            if keys not in key_tables:
+                key_tables[keys] = len(key_maps)
+                key_maps.append(keys)
+            return key_tables[keys]
+
+        edge_src, edge_dst, edge_keys = array("i"), array("i"), array("i")
+        out_offsets = array("i", [0])
+        by_object = {}  # paths_in usually hold the same Edge objects as paths_out, so match them by identity first
+        for i, node in enumerate(graph.nodes):
+            for edge in node.paths_out:
+                by_object[id(edge)] = len(edge_dst)
+                edge_src.append(i)
+                edge_dst.append(index[edge.dst_node])
+                edge_keys.append(get_key_map(edge))
+            out_offsets.append(len(edge_dst))
+
+        matched = bytearray(len(edge_dst))
+        unmatched = None  # (src, dst, key map) -> edges not yet matched, built only if an identity match fails
+        in_offsets = array("i", [0])
+        in_edges = array("i")
+        for i, node in enumerate(graph.nodes):
+            for edge in node.paths_in:
+                e = by_object.get(id(edge)) if unmatched is None else None
+                if e is None or matched[e] or edge_dst[e] != i:
+                    if unmatched is None:
+                        unmatched = defaultdict(deque)
+                        for f in range(len(edge_dst)):
+                            if not matched[f]:
+                                unmatched[(edge_src[f], edge_dst[f], edge_keys[f])].append(f)
+                    matches = unmatched.get((index[edge.src_node], i, get_key_map(edge)))
+                    if not matches:
+                        raise ValueError(f"Edge from {edge.src_node} to {node.id} is missing in paths_out of {edge.src_node}")
+                    e = matches.popleft()
+                matched[e] = 1
+                in_edges.append(e)
+            in_offsets.append(len(in_edges))
+
+        return cls(nodes, edge_src, edge_dst, edge_keys, key_maps, out_offsets, in_offsets, in_edges)
+
+    def to_graph(self) -> Graph:
+        """
+        Convert back into a pydantic graph, each edge is shared by paths_out of its src and paths_in of its dst.
+        """
+        edges = [
+            Edge(
+                src_node=self.node_ids[src],
+                dst_node=self.node_ids[dst],
+                src_to_dst_data_keys=dict(self.key_maps[key_map]),
+            )
+            for src, dst, key_map in zip(self.edge_src, self.edge_dst, self.edge_keys)
+        ]
+        return Graph(
+            nodes=[
+                Node(
+                    id=node.id,
+                    data_in=dict(node.data_in),
+                    data_out=dict(node.data_out),
+                    paths_in=[edges[e] for e in self.in_edges[self.in_offsets[i]:self.in_offsets[i + 1]]],
+                    paths_out=edges[self.out_offsets[i]:self.out_offsets[i + 1]],
+                )
+                for i, node in enumerate(self.nodes)
+            ]
+        )
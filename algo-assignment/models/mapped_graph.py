@@ -0,0 +1,226 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import Union
+from models.models import Graph
+from models.compact_graph import CompactGraph, CompactNode
+
+MAGIC = b"GRAPHMM1"
+# sections of the file in order, with the array type code of their items
+SECTIONS = (
+    ("string_offsets", "q"),  # string_count + 1 byte offsets into strings
+    ("strings", "B"),  # utf-8 of node ids and data keys, each string is stored once
+    ("node_ids", "i"),  # string index of the id of each node
+    ("data_offsets", "i"),  # 2 * node_count + 1, data_in of node i is data_offsets[2i]:[2i + 1], data_out [2i + 1]:[2i + 2]
+    ("data_keys", "i"),  # string index of the key of each data entry
+    ("value_offsets", "q"),  # entry_count + 1 byte offsets into values
+    ("values", "B"),  # json of the value of each data entry
+    ("edge_src", "i"),
+    ("edge_dst", "i"),
+    ("edge_keys", "i"),
+    ("out_offsets", "i"),
+    ("in_offsets", "i"),
+    ("in_edges", "i"),
+    ("key_map_offsets", "i"),  # key_map_count + 1 offsets into key_map_keys, counted in pairs
+    ("key_map_keys", "i"),  # (src_key, dst_key) string index pairs
+)
+# magic, byte order of the arrays, then (offset, length in bytes) of every section
+HEADER = struct.Struct("<8s8s" + "QQ" * len(SECTIONS))
+ALIGNMENT = 8
+
+
+class LazySequence(Sequence):
+    """
+    Read-only sequence whose items are decoded from the mapped file on first access and then kept,
+    so nodes mutated by a run (data_in) keep their changes.
+    """
+    __slots__ = ("_load", "_items")
+
+    def __init__(self, length, load):
+        self._load = load
+        self._items = [None] * length
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        item = self._items[i]
+        if item is None:
+            item = self._items[i] = self._load(i if i >= 0 else i + len(self))
+        return item
+
+
+class MappedGraph(CompactGraph):
+    """
+    Compact graph read from a binary file through `mmap`, written by `MappedGraph.write`.
+    The edge and offset arrays are memoryviews over the mapped file, nothing is copied or parsed when opening,
+    so processes opening the same file share one page-cached copy. Node ids, key mappings and node data are
+    decoded from the string tables on first access only.
+
+    Runners, validators and execution plans take it like any `CompactGraph`. The file is read-only,
+    data_in updated by a run lives in the decoded nodes of this process.
+    """
+    __slots__ = ("path", "_mmap", "_views", "_strings")
+
+    @classmethod
+    def write(cls, graph: Union[Graph, CompactGraph], path):
+        """
+        Write a pydantic or compact graph into the binary format.
+
+        Raises:
+            ValueError: If a pydantic graph has an edge in paths_in which is missing in paths_out, see `CompactGraph.from_graph`.
+        """
+        if not isinstance(graph, CompactGraph):
+            graph = CompactGraph.from_graph(graph)
+
+        strings = {}  # string -> index in the string table
+
+        def intern(string):
+            if string not in strings:
+                strings[string] = len(strings)
+            return strings[string]
+
+        node_ids = array("i", (intern(id) for id in graph.node_ids))
+        data_offsets, data_keys = array("i", [0]), array("i")
+        value_offsets, values = array("q", [0]), bytearray()
+        for node in graph.nodes:
+            for data in (node.data_in, node.data_out):
+                for key, value in data.items():
+                    data_keys.append(intern(key))
+                    values += json.dumps(value, separators=(",", ":")).encode()
+                    value_offsets.append(len(values))
+                data_offsets.append(len(data_keys))
+
+        key_map_offsets, key_map_keys = array("i", [0]), array("i")
+        for key_map in graph.key_maps:
+            for src_key, dst_key in key_map:
+                key_map_keys.extend((intern(src_key), intern(dst_key)))
+            key_map_offsets.append(len(key_map_keys) // 2)
+
+        string_offsets, string_bytes = array("q", [0]), bytearray()
+        for string in strings:  # dicts keep insertion order, i.e. the order of indices
+            string_bytes += string.encode()
+            string_offsets.append(len(string_bytes))
+
+        sections = {
+            "string_offsets": string_offsets,
+            "strings": string_bytes,
+            "node_ids": node_ids,
+            "data_offsets": data_offsets,
+            "data_keys": data_keys,
+            "value_offsets": value_offsets,
+            "values": values,
+            "edge_src": graph.edge_src,
+            "edge_dst": graph.edge_dst,
+            "edge_keys": graph.edge_keys,
+            "out_offsets": graph.out_offsets,
+            "in_offsets": graph.in_offsets,
+            "in_edges": graph.in_edges,
+            "key_map_offsets": key_map_offsets,
+            "key_map_keys": key_map_keys,
+        }
+        with open(path, "wb") as f:
+            f.write(bytes(HEADER.size))  # written once the section offsets are known
+            layout = []
+            for name, typecode in SECTIONS:
+                data = memoryview(array(typecode, sections[name])).cast("B")
+                f.write(bytes(-f.tell() % ALIGNMENT))
+                layout.extend((f.tell(), data.nbytes))
+                f.write(data)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, sys.byteorder.encode(), *layout))
+
+    @classmethod
+    def open(cls, path):
+        """
+        Map a graph file written by `MappedGraph.write`.
+
+        Raises:
+            ValueError: If the file is not a graph file, or was written on a machine with another byte order.
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        views = {}
+        try:
+            if mapped.size() < HEADER.size:
+                raise ValueError(f"{path} is not a graph file")
+            magic, byteorder, *layout = HEADER.unpack_from(mapped)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a graph file")
+            byteorder = byteorder.rstrip(b"\0").decode()
+            if byteorder != sys.byteorder:
+                raise ValueError(f"{path} was written with {byteorder} byte order")
+
+            with memoryview(mapped) as buffer:  # section views stay valid once this one is released
+                for (name, typecode), offset, length in zip(SECTIONS, layout[::2], layout[1::2]):
+                    if offset + length > len(buffer) or length % array(typecode).itemsize:
+                        raise ValueError(f"{path} is truncated or corrupt, bad section {name}")
+                    views[name] = buffer[offset:offset + length].cast(typecode)
+        except BaseException:
+            for view in views.values():
+                view.release()
+            mapped.close()
+            raise
+        return cls(path, mapped, views)
+
+    def __init__(self, path, mapped, views):
+        self.path = path
+        self._mmap = mapped
+        self._views = views
+        self._strings = LazySequence(len(views["string_offsets"]) - 1, self._load_string)
+
+        node_count = len(views["node_ids"])
+        self.nodes = LazySequence(node_count, self._load_node)
+        self.node_ids = LazySequence(node_count, lambda i: self._strings[views["node_ids"][i]])
+        self.key_maps = LazySequence(len(views["key_map_offsets"]) - 1, self._load_key_map)
+        self.edge_src = views["edge_src"]
+        self.edge_dst = views["edge_dst"]
+        self.edge_keys = views["edge_keys"]
+        self.out_offsets = views["out_offsets"]
+        self.in_offsets = views["in_offsets"]
+        self.in_edges = views["in_edges"]
+
+    def _load_string(self, i):
+        offsets = self._views["string_offsets"]
+        return sys.intern(str(self._views["strings"][offsets[i]:offsets[i + 1]], "utf-8"))
+
+    def _load_data(self, start, end):
+        views = self._views
+        keys, offsets, values = views["data_keys"], views["value_offsets"], views["values"]
+        return {self._strings[keys[e]]: json.loads(bytes(values[offsets[e]:offsets[e + 1]])) for e in range(start, end)}
+
+    def _load_node(self, i):
+        offsets = self._views["data_offsets"]
+        return CompactNode(
+            id=self.node_ids[i],
+            data_in=self._load_data(offsets[2 * i], offsets[2 * i + 1]),
+            data_out=self._load_data(offsets[2 * i + 1], offsets[2 * i + 2]),
+        )
+
+    def _load_key_map(self, i):
+        offsets, keys = self._views["key_map_offsets"], self._views["key_map_keys"]
+        return tuple((self._strings[keys[2 * k]], self._strings[keys[2 * k + 1]]) for k in range(offsets[i], offsets[i + 1]))
+
+    def close(self):
+        """
+        Unmap the file. Arrays of the graph cannot be used afterwards, decoded nodes can.
+        Raises BufferError while other objects (e.g. numpy arrays of the vectorised backend) still use the arrays.
+        """
+        for view in self._views.values():
+            view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __reduce__(self):
+        # worker processes map the same file instead of receiving a copy of the graph
+        return MappedGraph.open, (self.path,)
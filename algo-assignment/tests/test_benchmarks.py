@@ -0,0 +1,62 @@
+import json
+import pytest
+from benchmarks import generators
+from benchmarks.run_benchmarks import run_benchmarks, main
+from utils import setup_sample
+from utils.graph_runner import GraphRunner
+from utils.graph_validators import GraphValidator
+
+
+@pytest.mark.parametrize("name", list(generators.GENERATORS))
+@pytest.mark.parametrize("size", [1, 2, 10, 101])
+def test_generators_build_dags(name, size):
+    """
+    Every generator should give a DAG with the requested number of nodes, a single island except for forests
+    """
+    spec = generators.GENERATORS[name](size)
+    graph = generators.to_graph(spec)
+    assert len(graph.nodes) == size
+    assert all(src < dst for src, dst in spec.edges)
+
+    validator = GraphValidator(graph=graph)
+    validator.validate_edge_compatibility()
+    validator.detect_cycle()
+    runner = GraphRunner(graph=graph, config=setup_sample.get_sample_config())
+    islands = runner.check_islands()
+    if name == "forest":
+        assert len(islands) == -(-size // 10)
+    else:
+        assert len(islands) == 1
+
+
+def test_generator_shapes():
+    """
+    Chains should be as deep as they are long and fan-out/fan-in should have two wide levels
+    """
+    runner = GraphRunner(graph=generators.to_graph(generators.chain(50)), config=setup_sample.get_sample_config())
+    runner.toposort()
+    assert len(runner.level_map) == 50
+
+    runner = GraphRunner(graph=generators.to_graph(generators.fan_out_in(50)), config=setup_sample.get_sample_config())
+    runner.toposort()
+    assert [len(runner.level_map[level]) for level in sorted(runner.level_map)] == [1, 48, 1]
+
+    spec = generators.layered_random(100, seed=1)
+    assert spec.edges == generators.layered_random(100, seed=1).edges
+
+
+def test_run_benchmarks_records(tmp_path):
+    """
+    A run should time every operation once per generator and size, save JSON and compare with an earlier file
+    """
+    records = run_benchmarks([10], ["chain", "forest"], repeat=1, backend=False, log=lambda line: None)
+    assert {record["operation"] for record in records} >= {"runner.toposort", "runner.execute", "validator.validate"}
+    assert all(record["best"] >= 0 for record in records)
+    forest_islands = [r for r in records if r["generator"] == "forest" and r["operation"] == "validator.check_islands"]
+    assert forest_islands[0]["error"] is None  # one tree of 10 nodes
+
+    output = tmp_path / "results.json"
+    results = main(["--sizes", "10", "--generators", "chain", "--repeat", "1", "--no-backend", "--output", str(output)])
+    saved = json.loads(output.read_text())
+    assert saved["results"] == json.loads(json.dumps(results["results"]))
+    main(["--sizes", "10", "--generators", "chain", "--repeat", "1", "--no-backend", "--compare", str(output)])
@@ -0,0 +1,116 @@
+import pytest
+from array import array
+from utils import setup_sample
+from utils.graph_runner import GraphRunner
+from utils.graph_validators import GraphValidator
+from utils.execution_plan import ExecutionPlan
+from models.compact_graph import CompactGraph
+from models.models import Node, Edge
+
+
+def get_graph():
+    """
+    A -> B -> D, A -> C -> D, E -> D, where A -> B and C -> D share the same key mapping
+    """
+    return setup_sample.get_sample_graph(
+        nodes=[
+            Node(id="A", data_out={"out": 1}),
+            Node(id="B", data_in={"in": None}, data_out={"out": 2}),
+            Node(id="C", data_in={"in_c": None}, data_out={"out": 3}),
+            Node(id="D", data_in={"in": None, "in_e": None}),
+            Node(id="E", data_out={"out_e": 5}),
+        ],
+        edges=[
+            Edge(src_node="A", dst_node="B", src_to_dst_data_keys={"out": "in"}),
+            Edge(src_node="A", dst_node="C", src_to_dst_data_keys={"out": "in_c"}),
+            Edge(src_node="C", dst_node="D", src_to_dst_data_keys={"out": "in"}),
+            Edge(src_node="B", dst_node="D", src_to_dst_data_keys={"out": "in"}),
+            Edge(src_node="E", dst_node="D", src_to_dst_data_keys={"out_e": "in_e"}),
+        ],
+    )
+
+
+def test_compact_graph_round_trip():
+    """
+    Edges are stored once with shared key mappings, and converting back gives the same graph
+    """
+    graph = get_graph()
+    compact = CompactGraph.from_graph(graph)
+
+    assert compact.edge_count == 5
+    assert len(compact.key_maps) == 3
+    assert compact.to_graph() == graph
+
+    # incoming edges of D keep the order of paths_in
+    d = compact.node_ids.index("D")
+    sources = [compact.node_ids[compact.edge_src[e]] for e in compact.in_edges[compact.in_offsets[d]:compact.in_offsets[d + 1]]]
+    assert sources == ["C", "B", "E"]
+
+
+def test_compact_graph_without_shared_edge_objects():
+    """
+    Edges in paths_in are matched with paths_out by value when they are not the same objects
+    """
+    graph = get_graph()
+    for node in graph.nodes:
+        node.paths_in = [
+            Edge(src_node=edge.src_node, dst_node=edge.dst_node, src_to_dst_data_keys=dict(edge.src_to_dst_data_keys))
+            for edge in node.paths_in
+        ]
+
+    assert CompactGraph.from_graph(graph).to_graph() == graph
+
+    graph.nodes[1].paths_in.append(Edge(src_node="E", dst_node="B", src_to_dst_data_keys={}))
+    with pytest.raises(ValueError):
+        CompactGraph.from_graph(graph)
+
+
+@pytest.mark.parametrize("scheduler", ["levels", "ready"])
+def test_runner_on_compact_graph(scheduler):
+    """
+    Runner should give the same outputs, islands and levels on a compact graph as on the pydantic graph
+    """
+    config = setup_sample.get_sample_config(root_inputs={"A": {"in_a": 1}}, disable_list=["E"])
+    runner = GraphRunner(graph=get_graph(), config=config)
+    run_id = runner.execute()
+    compact_runner = GraphRunner(graph=CompactGraph.from_graph(get_graph()), config=config)
+    compact_run_id = compact_runner.execute(scheduler=scheduler)
+
+    assert compact_runner.run_data[compact_run_id] == runner.run_data[run_id]
+    assert compact_runner.get_leaf_outputs(compact_run_id) == runner.get_leaf_outputs(run_id)
+    assert compact_runner.level_map == runner.level_map
+    assert compact_runner.check_islands() == runner.check_islands()
+    assert {id: node.data_in for id, node in compact_runner.node_map.items()} == {
+        id: node.data_in for id, node in runner.node_map.items()
+    }
+
+
+def test_validator_on_compact_graph():
+    """
+    Validator checks should run directly on a compact graph
+    """
+    validator = GraphValidator(graph=CompactGraph.from_graph(get_graph()))
+    with pytest.raises(ValueError, match="Data type mismatch between A:out and B:in"):
+        validator.validate_edge_compatibility()
+    validator.detect_cycle()
+    validator.check_islands()
+    with pytest.raises(ValueError, match="Data type mismatch"):
+        validator.validate()
+    assert validator.cycle == []
+    assert validator.islands == [["A", "B", "C", "D", "E"]]
+
+
+def test_plan_keeps_compact_arrays():
+    """
+    A plan compiled from a compact graph should use its arrays as they are instead of copying them into lists
+    """
+    compact = CompactGraph.from_graph(get_graph())
+    plan = ExecutionPlan(compact)
+
+    assert plan.out_targets is compact.edge_dst
+    assert plan.out_offsets is compact.out_offsets
+    assert plan.in_offsets is compact.in_offsets
+    assert isinstance(plan.in_sources, array) and isinstance(plan.in_key_maps, array)
+    assert plan.key_maps is compact.key_maps
+    d = plan.index["D"]
+    assert [plan.node_ids[plan.in_sources[e]] for e in range(plan.in_offsets[d], plan.in_offsets[d + 1])] == ["C", "B", "E"]
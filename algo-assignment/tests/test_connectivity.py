@@ -0,0 +1,145 @@
+import pytest
+from pathlib import Path
+from utils.connectivity import IslandTracker
+from utils.graph_runner import GraphRunner
+from utils.graph_validators import GraphValidator
+from utils import setup_sample
+from models.models import Node, Edge, GraphRunConfig
+
+
+def get_tracker():
+    """
+    Two islands, A - B - C and D - E, where A and C are also joined by a second edge
+    """
+    return IslandTracker.from_edges(
+        ["A", "B", "C", "D", "E"],
+        [("A", "B"), ("B", "C"), ("A", "C"), ("D", "E")],
+    )
+
+
+def test_islands_match_graph_runner():
+    """
+    Tracker built from a graph should find the same islands as GraphRunner.check_islands
+    """
+    graph = setup_sample.get_sample_graph(
+        nodes=[Node(id=id, data_in={"in": 0}, data_out={"out": 0}) for id in "ABCDEF"],
+        edges=[
+            Edge(src_node="A", dst_node="C", src_to_dst_data_keys={"out": "in"}),
+            Edge(src_node="B", dst_node="D", src_to_dst_data_keys={"out": "in"}),
+            Edge(src_node="E", dst_node="C", src_to_dst_data_keys={"out": "in"}),
+        ],
+    )
+    tracker = IslandTracker.from_graph(graph)
+    islands = GraphRunner(graph, GraphRunConfig(root_inputs={})).check_islands()
+
+    assert tracker.island_count == len(islands) == 3
+    assert sorted(map(sorted, tracker.islands())) == sorted(map(sorted, islands))
+    assert tracker.same_island("A", "E")
+    assert not tracker.same_island("A", "B")
+
+
+@pytest.mark.parametrize(
+    "removed, island_count",
+    [
+        ([("A", "B")], 2),  # A is still joined to B through C
+        ([("A", "B"), ("B", "C")], 3),
+        ([("D", "E")], 3),
+    ],
+)
+def test_remove_edge(removed, island_count):
+    """
+    Removing edges should only split an island once its nodes are no longer connected
+    """
+    tracker = get_tracker()
+    for src, dst in removed:
+        tracker.remove_edge(src, dst)
+
+    assert tracker.island_count == island_count
+    assert tracker.island_count == len(tracker.islands())
+    with pytest.raises(ValueError):
+        tracker.remove_edge(*removed[0])
+
+
+def test_add_and_remove_node():
+    """
+    Nodes joined and removed again should bring back the original islands
+    """
+    tracker = get_tracker()
+    tracker.add_edge("C", "F")
+    tracker.add_edge("F", "D")
+    assert tracker.island_count == 1
+
+    tracker.remove_node("F")
+    assert tracker.island_count == 2
+    assert sorted(map(sorted, tracker.islands())) == [["A", "B", "C"], ["D", "E"]]
+
+
+def test_remove_node_with_self_loop():
+    """
+    Self-loops should be removed alongside their node, also when restored from a persisted tracker
+    """
+    tracker = IslandTracker.from_edges(["A", "B", "C"], [("A", "B"), ("A", "A"), ("A", "A"), ("B", "C")])
+    tracker.remove_node("A")
+    assert tracker.island_count == 1
+    assert sorted(map(sorted, tracker.islands())) == [["B", "C"]]
+
+    restored = IslandTracker.from_dict(
+        IslandTracker.from_edges(["A", "B"], [("A", "B"), ("B", "B")]).to_dict(), [("A", "B"), ("B", "B")]
+    )
+    restored.remove_node("B")
+    assert restored.islands() == [["A"]]
+
+
+def test_remove_hub_node():
+    """
+    Removing a hub splits its island into one island per part left, the same as building the tracker again
+    """
+    edges = [("H", "A"), ("H", "B"), ("A", "B"), ("H", "C"), ("C", "D"), ("H", "D"), ("H", "E"), ("F", "G")]
+    tracker = IslandTracker.from_edges("HABCDEFG", edges)
+    tracker.remove_node("H")
+
+    rebuilt = IslandTracker.from_edges("ABCDEFG", [(src, dst) for src, dst in edges if "H" not in (src, dst)])
+    assert tracker.island_count == rebuilt.island_count == 4
+    assert sorted(map(sorted, tracker.islands())) == sorted(map(sorted, rebuilt.islands()))
+    assert "H" not in tracker.neighbors["A"]
+    tracker.add_edge("E", "F")
+    assert tracker.island_count == 3 and tracker.same_island("E", "G")
+
+
+def test_copies_match():
+    """
+    The backend keeps the same module, the two must not drift apart
+    """
+    backend = Path(__file__).parents[2] / "backend-assignment" / "app" / "utils" / "connectivity.py"
+    if not backend.exists():
+        pytest.skip("backend-assignment is not checked out")
+    assert backend.read_text() == (Path(__file__).parents[1] / "utils" / "connectivity.py").read_text()
+
+
+def test_persistence_round_trip():
+    """
+    Tracker restored from its serialized state should answer queries and handle deletions
+    """
+    tracker = get_tracker()
+    restored = IslandTracker.from_dict(tracker.to_dict(), edges=[("A", "B"), ("B", "C"), ("A", "C"), ("D", "E")])
+
+    assert restored.island_count == 2
+    assert restored.island_of("C") == restored.island_of("A")
+    restored.remove_edge("D", "E")
+    assert restored.island_count == 3
+
+
+def test_validator_uses_tracker():
+    """
+    GraphValidator should answer the islands check from a tracker kept alongside the graph
+    """
+    graph = setup_sample.get_sample_graph(
+        nodes=[Node(id=id, data_in={"in": 0}, data_out={"out": 0}) for id in "AB"],
+        edges=[Edge(src_node="A", dst_node="B", src_to_dst_data_keys={"out": "in"})],
+    )
+    tracker = IslandTracker.from_graph(graph)
+    GraphValidator(graph, island_tracker=tracker).check_islands()
+
+    tracker.remove_edge("A", "B")
+    with pytest.raises(ValueError):
+        GraphValidator(graph, island_tracker=tracker).check_islands()
@@ -0,0 +1,143 @@
+import pytest
+from utils import setup_sample
+from utils.execution_plan import ExecutionPlan
+from utils.graph_runner import GraphRunner
+from models.models import Node, Edge
+
+
+def get_diamond_graph():
+    """
+    A -> B, A -> C, B -> D, C -> D
+    """
+    return setup_sample.get_sample_graph(
+        nodes=[
+            Node(id="A", data_out={"out_a": 1}),
+            Node(id="C", data_in={"in_c": None}, data_out={"out_c": 3}),
+            Node(id="B", data_in={"in_b": None}, data_out={"out_b": 2}),
+            Node(id="D", data_in={"in_d": None}),
+        ],
+        edges=[
+            Edge(src_node="A", dst_node="B", src_to_dst_data_keys={"out_a": "in_b"}),
+            Edge(src_node="A", dst_node="C", src_to_dst_data_keys={"out_a": "in_c"}),
+            Edge(src_node="B", dst_node="D", src_to_dst_data_keys={"out_b": "in_d"}),
+            Edge(src_node="C", dst_node="D", src_to_dst_data_keys={"out_c": "in_d"}),
+        ],
+    )
+
+
+def test_plan_structure():
+    """
+    Plan should hold CSR adjacency, levels, roots and leaves of the graph
+    """
+    plan = ExecutionPlan(get_diamond_graph())
+
+    assert plan.node_ids == ["A", "C", "B", "D"]
+    assert plan.ordered_ids() == ["A", "B", "C", "D"]
+    assert plan.level_map() == {0: ["A"], 1: ["B", "C"], 2: ["D"]}
+    assert plan.level_of == [0, 1, 1, 2]
+    assert [plan.node_ids[i] for i in plan.level_slice(1)] == ["B", "C"]
+    assert plan.root_ids() == ["A"]
+    assert plan.leaf_ids() == ["D"]
+
+    # incoming edges of D come from B and C
+    d = plan.index["D"]
+    sources = plan.in_sources[plan.in_offsets[d]:plan.in_offsets[d + 1]]
+    assert [plan.node_ids[i] for i in sources] == ["B", "C"]
+
+
+def test_plan_is_reused_across_runs():
+    """
+    Repeated runs should reuse the same plan and not grow the execution order or level map
+    """
+    runner = GraphRunner(graph=get_diamond_graph(), config=setup_sample.get_sample_config())
+    first_run = runner.execute()
+    plan = runner.plan
+    second_run = runner.execute(config=setup_sample.get_sample_config(root_inputs={"A": {"in_a": 5}}))
+
+    assert runner.plan is plan
+    assert runner.execution_order == ["A", "B", "C", "D"]
+    assert runner.level_map == {0: ["A"], 1: ["B", "C"], 2: ["D"]}
+    assert runner.get_leaf_outputs(first_run) == runner.get_leaf_outputs(second_run)
+
+    # B and C both precede D lexicographically, so the last incoming edge wins
+    assert runner.node_map["D"].data_in == {"in_d": 3}
+
+
+@pytest.mark.parametrize("scheduler", ["levels", "ready"])
+@pytest.mark.parametrize("executor", ["serial", "thread", "process"])
+def test_parallel_runs_match_serial(executor, scheduler):
+    """
+    Running nodes in a pool, or as soon as their sources are done, should give the same data and outputs
+    as the serial level-wise run
+    """
+    config = setup_sample.get_sample_config(root_inputs={"A": {"in_a": 5}}, data_overwrites={"D": {"in_d": 0}})
+    serial = GraphRunner(graph=get_diamond_graph(), config=config)
+    serial_run = serial.execute()
+    runner = GraphRunner(graph=get_diamond_graph(), config=config)
+    run_id = runner.execute(executor=executor, max_workers=2, scheduler=scheduler)
+
+    assert list(runner.run_data[run_id].items()) == list(serial.run_data[serial_run].items())
+    assert {id: node.data_in for id, node in runner.node_map.items()} == {
+        id: node.data_in for id, node in serial.node_map.items()
+    }
+
+
+def test_critical_path():
+    """
+    Critical path is the number of nodes on the longest path from a node to a leaf
+    """
+    plan = ExecutionPlan(get_diamond_graph())
+    assert dict(zip(plan.node_ids, plan.critical_path())) == {"A": 3, "B": 2, "C": 2, "D": 1}
+
+
+def test_incremental_run_recomputes_only_dirty_nodes():
+    """
+    An incremental run should only recompute the changed node and its downstream nodes,
+    and end up with the same data as a full run
+    """
+    first_config = setup_sample.get_sample_config(root_inputs={"A": {"in_a": 1}})
+    second_config = setup_sample.get_sample_config(root_inputs={"A": {"in_a": 1}}, data_overwrites={"C": {"in_c": 7}})
+
+    full = GraphRunner(graph=get_diamond_graph(), config=first_config)
+    full.execute()
+    full_run = full.execute(config=second_config)
+
+    runner = GraphRunner(graph=get_diamond_graph(), config=first_config)
+    first_run = runner.execute()
+    run_id = runner.execute(config=second_config, incremental=True)
+
+    assert runner._dirty_nodes(runner._changed_nodes(runner._last_inputs, runner._snapshot_inputs())) == []
+    assert list(runner.run_data[run_id].items()) == list(full.run_data[full_run].items())
+    assert {id: node.data_in for id, node in runner.node_map.items()} == {
+        id: node.data_in for id, node in full.node_map.items()
+    }
+    # outputs of A and B are reused from the first run, C and D are recomputed
+    assert runner.run_data[run_id]["A"] is runner.run_data[first_run]["A"]
+    assert runner.run_data[run_id]["B"] is runner.run_data[first_run]["B"]
+    assert runner.run_data[run_id]["D"] is not runner.run_data[first_run]["D"]
+
+
+@pytest.mark.parametrize(
+    "config, expected_pruned, expected_leaves, expected_level_map",
+    [
+        # D is still fed by C
+        (setup_sample.get_sample_config(disable_list=["B"]), {"B"}, ["D"], {0: ["A"], 1: ["C"], 2: ["D"]}),
+        # D is only fed by disabled nodes
+        (setup_sample.get_sample_config(disable_list=["B", "C"]), {"B", "C", "D"}, ["A"], {0: ["A"]}),
+        # everything only A feeds is pruned
+        (setup_sample.get_sample_config(disable_list=["A"]), {"A", "B", "C", "D"}, [], {}),
+        (setup_sample.get_sample_config(enable_list=["A", "C", "D"]), {"B"}, ["D"], {0: ["A"], 1: ["C"], 2: ["D"]}),
+    ],
+)
+def test_disabled_nodes_are_pruned(config, expected_pruned, expected_leaves, expected_level_map):
+    """
+    Disabled nodes and everything that only they feed should not be executed
+    """
+    runner = GraphRunner(graph=get_diamond_graph(), config=config)
+    run_id = runner.execute()
+
+    assert {runner.plan.node_ids[i] for i in runner.plan.prune(runner._disabled_nodes())} == expected_pruned
+    assert set(runner.run_data[run_id]) == {"A", "B", "C", "D"} - expected_pruned
+    assert list(runner.get_leaf_outputs(run_id)) == expected_leaves
+    assert runner.executed_level_map == expected_level_map
+    assert runner.level_map == {0: ["A"], 1: ["B", "C"], 2: ["D"]}
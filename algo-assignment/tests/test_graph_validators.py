@@ -0,0 +1,72 @@
+import pytest
+from utils import setup_sample
+from utils.graph_validators import GraphValidator
+from models.models import Node, Edge
+
+
+def get_chain_graph(length):
+    """
+    Linear chain of nodes n0 -> n1 -> ... with data passed along each edge
+    """
+    return setup_sample.get_sample_graph(
+        nodes=[Node(id=f"n{i}", data_in={"in": 0}, data_out={"out": i}) for i in range(length)],
+        edges=[
+            Edge(src_node=f"n{i}", dst_node=f"n{i + 1}", src_to_dst_data_keys={"out": "in"})
+            for i in range(length - 1)
+        ],
+    )
+
+
+def test_validate_long_chain():
+    """
+    Validation of a chain longer than the recursion limit should not raise RecursionError
+    """
+    validator = GraphValidator(graph=get_chain_graph(5000))
+    validator.validate()
+    validator.detect_cycle()
+
+    assert validator.cycle == []
+    assert len(validator.islands) == 1
+
+
+def test_validate_reports_cycle_path():
+    """
+    Cycle path should be reported along the direction of edges
+    """
+    graph = get_chain_graph(4)
+    edge = Edge(src_node="n3", dst_node="n1", src_to_dst_data_keys={"out": "in"})
+    graph.nodes[3].paths_out.append(edge)
+    graph.nodes[1].paths_in.append(edge)
+    validator = GraphValidator(graph=graph)
+
+    with pytest.raises(ValueError, match="Cycle detected"):
+        validator.validate()
+    with pytest.raises(ValueError, match="Cycle detected"):
+        validator.detect_cycle()
+
+    # any rotation of n1 -> n2 -> n3 -> n1 is the same cycle
+    assert validator.cycle[0] == validator.cycle[-1]
+    assert set(validator.cycle) == {"n1", "n2", "n3"}
+    assert len(validator.cycle) == 4
+
+
+def test_validate_reports_islands_and_type_mismatch():
+    """
+    All the problems found should be reported at once
+    """
+    graph = setup_sample.get_sample_graph(
+        nodes=[
+            Node(id="A", data_out={"out_a": 10}),
+            Node(id="B", data_in={"in_b": "text"}),
+            Node(id="C"),
+        ],
+        edges=[Edge(src_node="A", dst_node="B", src_to_dst_data_keys={"out_a": "in_b"})],
+    )
+    validator = GraphValidator(graph=graph)
+
+    with pytest.raises(ValueError) as error:
+        validator.validate()
+
+    assert "Data type mismatch between A:out_a and B:in_b" in str(error.value)
+    assert "Graph contains islands" in str(error.value)
+    assert validator.islands == [["A", "B"], ["C"]]
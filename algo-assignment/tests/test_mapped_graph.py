@@ -0,0 +1,152 @@
+import pickle
+import pytest
+from utils import setup_sample
+from utils.graph_runner import GraphRunner
+from utils.graph_validators import GraphValidator
+from models.compact_graph import CompactGraph
+from models.mapped_graph import MappedGraph
+from models.models import Node, Edge
+
+
+def get_graph(cycle=False):
+    """
+    A -> B -> D, A -> C -> D, E -> D with json values of every type, and D -> A when cycle is set
+    """
+    edges = [
+        Edge(src_node="A", dst_node="B", src_to_dst_data_keys={"out": "in"}),
+        Edge(src_node="A", dst_node="C", src_to_dst_data_keys={"out": "in_c"}),
+        Edge(src_node="C", dst_node="D", src_to_dst_data_keys={"out": "in"}),
+        Edge(src_node="B", dst_node="D", src_to_dst_data_keys={"out": "in"}),
+        Edge(src_node="E", dst_node="D", src_to_dst_data_keys={"ünï": "in_e"}),
+    ]
+    if cycle:
+        edges.append(Edge(src_node="D", dst_node="A", src_to_dst_data_keys={}))
+    return setup_sample.get_sample_graph(
+        nodes=[
+            Node(id="A", data_in={"in_a": None}, data_out={"out": 1}),
+            Node(id="B", data_in={"in": 0}, data_out={"out": 2}),
+            Node(id="C", data_in={"in_c": 0}, data_out={"out": 3.5}),
+            Node(id="D", data_in={"in": 0, "in_e": "x"}),
+            Node(id="E", data_out={"ünï": "y", "nested": {"a": [1, True, None]}}),
+        ],
+        edges=edges,
+    )
+
+
+def test_mapped_graph_round_trip(tmp_path):
+    """
+    Arrays are views over the file, node data is decoded on first access and converting back gives the same graph
+    """
+    path = tmp_path / "graph.bin"
+    MappedGraph.write(get_graph(), path)
+
+    with MappedGraph.open(path) as mapped:
+        assert isinstance(mapped.edge_dst, memoryview)
+        assert mapped.edge_count == 5
+        assert list(mapped.edge_dst) == list(CompactGraph.from_graph(get_graph()).edge_dst)
+        assert len(mapped.key_maps) == 3
+        assert all(node is None for node in mapped.nodes._items)
+
+        assert mapped.node_ids.index("E") == 4
+        assert mapped.nodes[-1].data_out == {"ünï": "y", "nested": {"a": [1, True, None]}}
+        assert mapped.to_graph() == get_graph()
+
+        # a mapped graph can be written again, e.g. to copy it
+        MappedGraph.write(mapped, tmp_path / "copy.bin")
+    with MappedGraph.open(tmp_path / "copy.bin") as copy:
+        assert copy.to_graph() == get_graph()
+
+
+@pytest.mark.parametrize("scheduler", ["levels", "ready"])
+def test_runner_on_mapped_graph(tmp_path, scheduler):
+    """
+    Runner should give the same outputs, islands and levels on a mapped graph as on the pydantic graph
+    """
+    path = tmp_path / "graph.bin"
+    MappedGraph.write(get_graph(), path)
+    config = setup_sample.get_sample_config(root_inputs={"A": {"in_a": 1}}, data_overwrites={"D": {"in_e": "z"}})
+    runner = GraphRunner(graph=get_graph(), config=config)
+    run_id = runner.execute()
+
+    with MappedGraph.open(path) as mapped:
+        mapped_runner = GraphRunner(graph=mapped, config=config)
+        mapped_run_id = mapped_runner.execute(scheduler=scheduler)
+
+        assert mapped_runner.run_data[mapped_run_id] == runner.run_data[run_id]
+        assert mapped_runner.get_leaf_outputs(mapped_run_id) == runner.get_leaf_outputs(run_id)
+        assert mapped_runner.level_map == runner.level_map
+        assert mapped_runner.check_islands() == runner.check_islands()
+        assert mapped_runner.node_map["D"].data_in == runner.node_map["D"].data_in
+
+
+def test_runner_leaves_mapped_nodes_undecoded(tmp_path):
+    """
+    Constructing a runner and checking islands only use the mapped arrays, a run decodes the nodes it executes
+    """
+    MappedGraph.write(get_graph(), tmp_path / "graph.bin")
+    with MappedGraph.open(tmp_path / "graph.bin") as mapped:
+        runner = GraphRunner(graph=mapped, config=setup_sample.get_sample_config(root_inputs={"A": {"in_a": 1}}))
+        assert sorted(map(sorted, runner.check_islands())) == [["A", "B", "C", "D", "E"]]
+        assert all(node is None for node in mapped.nodes._items)
+        # the plan uses the arrays of the file as they are
+        assert runner.plan.out_targets is mapped.edge_dst and runner.plan.in_offsets is mapped.in_offsets
+
+        runner.execute()
+        assert all(node is not None for node in mapped.nodes._items)
+
+
+def test_validator_on_mapped_graph(tmp_path):
+    """
+    Structural checks run on the mapped arrays without decoding node data, problems are found as on a pydantic graph
+    """
+    MappedGraph.write(get_graph(), tmp_path / "graph.bin")
+    MappedGraph.write(get_graph(cycle=True), tmp_path / "cycle.bin")
+
+    with MappedGraph.open(tmp_path / "graph.bin") as mapped:
+        validator = GraphValidator(graph=mapped)
+        validator.detect_cycle()
+        validator.check_islands()
+        assert all(node is None for node in mapped.nodes._items)
+        with pytest.raises(ValueError, match="Data type mismatch between C:out and D:in"):
+            validator.validate_edge_compatibility()
+
+    with MappedGraph.open(tmp_path / "cycle.bin") as mapped:
+        validator = GraphValidator(graph=mapped)
+        with pytest.raises(ValueError, match="Cycle detected"):
+            validator.detect_cycle()
+        with pytest.raises(ValueError, match="Cycle detected in the graph: D -> A -> B -> D") as error:
+            validator.validate()
+
+    graph_validator = GraphValidator(graph=get_graph(cycle=True))
+    with pytest.raises(ValueError) as graph_error:
+        graph_validator.validate()
+    assert str(graph_error.value) == str(error.value)
+    assert graph_validator.cycle == validator.cycle
+
+
+def test_mapped_graph_pickles_by_path(tmp_path):
+    """
+    A pickled mapped graph maps the same file again instead of copying the graph
+    """
+    path = tmp_path / "graph.bin"
+    MappedGraph.write(get_graph(), path)
+    with MappedGraph.open(path) as mapped:
+        data = pickle.dumps(mapped)
+        assert b"nested" not in data
+        with pickle.loads(data) as reopened:
+            assert reopened.to_graph() == mapped.to_graph()
+
+
+def test_open_rejects_other_files(tmp_path):
+    """
+    Files which are not graph files, or are truncated, raise a ValueError
+    """
+    path = tmp_path / "graph.bin"
+    path.write_bytes(b"not a graph" * 100)
+    with pytest.raises(ValueError, match="not a graph file"):
+        MappedGraph.open(path)
+
+    MappedGraph.write(get_graph(), path)
+    path.write_bytes(path.read_bytes()[:-8])
+    with pytest.raises(ValueError, match="truncated"):
+        MappedGraph.open(path)
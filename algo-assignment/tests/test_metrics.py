@@ -0,0 +1,42 @@
+from utils import setup_sample
+from utils.graph_runner import GraphRunner
+from utils.metrics import MetricsRegistry, registry
+from models.models import Node, Edge
+
+
+def test_histogram_renders_prometheus_text():
+    """
+    Buckets should be cumulative and end with +Inf, label values escaped
+    """
+    metrics = MetricsRegistry()
+    histogram = metrics.histogram("phase_seconds", "Seconds per phase", labels=("phase",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, phase="toposort")
+    histogram.observe(0.5, phase="toposort")
+    histogram.observe(5, phase="toposort")
+    metrics.counter("runs_total", "Runs", labels=("graph",)).inc(graph='a"b')
+
+    lines = metrics.render().splitlines()
+    assert "# TYPE phase_seconds histogram" in lines
+    assert 'phase_seconds_bucket{phase="toposort",le="0.1"} 1' in lines
+    assert 'phase_seconds_bucket{phase="toposort",le="1.0"} 2' in lines
+    assert 'phase_seconds_bucket{phase="toposort",le="+Inf"} 3' in lines
+    assert 'phase_seconds_count{phase="toposort"} 3' in lines
+    assert 'runs_total{graph="a\\"b"} 1.0' in lines
+
+
+def test_execute_records_timings():
+    """
+    Each run should keep its timing breakdown and record it in the registry
+    """
+    graph = setup_sample.get_sample_graph(
+        nodes=[Node(id="A", data_out={"out": 1}), Node(id="B", data_in={"in": None})],
+        edges=[Edge(src_node="A", dst_node="B", src_to_dst_data_keys={"out": "in"})],
+    )
+    runner = GraphRunner(graph=graph, config=setup_sample.get_sample_config())
+    runs = registry.counter("graph_runner_runs_total", "Runs of GraphRunner.execute").values.get((), 0)
+    runner.execute()
+
+    assert set(runner.timings) == {"toposort", "prune", "inputs", "traverse", "store"}
+    assert all(seconds >= 0 for seconds in runner.timings.values())
+    assert registry.metrics["graph_runner_runs_total"].values[()] == runs + 1
+    assert 'graph_runner_phase_seconds_count{phase="traverse"}' in registry.render()
@@ -0,0 +1,58 @@
+import random
+import pytest
+from utils import setup_sample
+from utils.graph_runner import GraphRunner
+from utils.execution_plan import ExecutionPlan
+from models.compact_graph import CompactGraph
+from models.models import Node, Edge
+
+np = pytest.importorskip("numpy")
+from utils import vectorized
+
+
+def get_random_graph(seed, node_count=300, edge_count=600, cycle=False):
+    """
+    Random DAG with shuffled ids, optionally with a cycle, and a few islands
+    """
+    rng = random.Random(seed)
+    ids = [f"n{rng.randint(0, 999):03d}_{i}" for i in range(node_count)]
+    rng.shuffle(ids)
+    edges = []
+    for _ in range(edge_count):
+        src, dst = sorted(rng.sample(range(node_count - 10), 2))
+        edges.append(Edge(src_node=ids[src], dst_node=ids[dst], src_to_dst_data_keys={}))
+    if cycle:
+        edges.append(Edge(src_node=ids[node_count - 11], dst_node=ids[node_count // 2], src_to_dst_data_keys={}))
+    return setup_sample.get_sample_graph(nodes=[Node(id=id) for id in ids], edges=edges)
+
+
+@pytest.mark.parametrize("seed, cycle", [(0, False), (1, True), (2, False), (3, True)])
+def test_vectorized_matches_runner(seed, cycle):
+    """
+    Vectorised toposort, levels and islands should match the runner, for pydantic and compact graphs
+    """
+    graph = get_random_graph(seed, cycle=cycle)
+    runner = GraphRunner(graph=graph, config=setup_sample.get_sample_config())
+    runner.toposort()
+    islands = runner.check_islands()
+
+    for candidate in (graph, CompactGraph.from_graph(graph)):
+        execution_order, level_map = vectorized.toposort(candidate)
+        assert execution_order == runner.execution_order
+        assert level_map == dict(runner.level_map)
+
+        # same islands in the same order, members are listed in the order of graph nodes
+        vectorized_islands = vectorized.check_islands(candidate)
+        assert [set(island) for island in vectorized_islands] == [set(island) for island in islands]
+
+
+def test_numpy_plan_backend():
+    """
+    Plan compiled with the numpy backend should be the same as with the python backend
+    """
+    graph = get_random_graph(4, cycle=True)
+    python_plan = ExecutionPlan(graph)
+    numpy_plan = ExecutionPlan(graph, backend="numpy")
+
+    for attribute in ("in_degrees", "roots", "execution_order", "level_of", "levels", "level_order", "leaves"):
+        assert getattr(numpy_plan, attribute) == getattr(python_plan, attribute)
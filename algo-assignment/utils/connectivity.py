@@ -0,0 +1,184 @@
+from collections import Counter, defaultdict
+
+# the same module is in algo-assignment/utils and backend-assignment/app/utils, a test of each project checks they match
+
+
+class IslandTracker:
+    """
+    Incremental island (connected component) tracking with union-find, path compression and union by size.
+    It is maintained as nodes and edges are added or removed, so "which island is node X in" and
+    "how many islands" are answered in near-constant time instead of a DFS over the whole graph.
+
+    Adding an edge is a union. Removing the last edge between two nodes may split an island, so only
+    that island is rebuilt: a BFS from one end tells if the other end is still reachable, and if not
+    both parts get fresh roots. Removing a node rebuilds its island once, whatever the degree of the node.
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}  # island size, only valid for roots
+        self.island_count = 0
+        self.neighbors = defaultdict(Counter)  # undirected adjacency with edge multiplicity, used on deletions
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Build a tracker from a compact graph (edge arrays), a graph with an edge list (backend) or a graph
+        whose nodes hold their edges in paths_out (algo engine).
+        """
+        if hasattr(graph, "edge_src"):
+            ids = graph.node_ids
+            edges = ((ids[src], ids[dst]) for src, dst in zip(graph.edge_src, graph.edge_dst))
+        elif hasattr(graph, "edges"):
+            ids = [node.id for node in graph.nodes]
+            edges = ((edge.src_node, edge.dst_node) for edge in graph.edges)
+        else:
+            ids = [node.id for node in graph.nodes]
+            edges = ((edge.src_node, edge.dst_node) for node in graph.nodes for edge in node.paths_out)
+        return cls.from_edges(ids, edges)
+
+    @classmethod
+    def from_edges(cls, node_ids, edges):
+        """
+        Build a tracker from node IDs and edges given as (src, dst) pairs.
+        """
+        tracker = cls()
+        for id in node_ids:
+            tracker.add_node(id)
+        for src, dst in edges:
+            tracker.add_edge(src, dst)
+        return tracker
+
+    def add_node(self, id):
+        if id not in self.parent:
+            self.parent[id] = id
+            self.size[id] = 1
+            self.island_count += 1
+
+    def remove_node(self, id):
+        """
+        Remove a node alongside all of its edges.
+        All edges of the node are dropped first, then the rest of its island is walked once: each part is
+        reached from a neighbor not reached before and gets a fresh root.
+        """
+        root = self.find(id)
+        neighbors = self.neighbors.pop(id, {})
+        for neighbor in neighbors:
+            if neighbor != id:  # a self-loop went with the node's own entry
+                del self.neighbors[neighbor][id]
+
+        parts, reached = [], set()
+        for neighbor in neighbors:
+            if neighbor != id and neighbor not in reached:
+                part = self._reachable(neighbor)
+                reached |= part
+                parts.append((neighbor, part))
+        del self.parent[id]
+        self.size.pop(root)
+        for part_root, part in parts:
+            for node in part:
+                self.parent[node] = part_root
+            self.size[part_root] = len(part)
+        # the island of the node is replaced by its parts
+        self.island_count += len(parts) - 1
+
+    def find(self, id):
+        root = id
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # path compression
+        while self.parent[id] != root:
+            self.parent[id], id = root, self.parent[id]
+        return root
+
+    def add_edge(self, src, dst):
+        self.add_node(src)
+        self.add_node(dst)
+        self.neighbors[src][dst] += 1
+        self.neighbors[dst][src] += 1
+
+        root_src, root_dst = self.find(src), self.find(dst)
+        if root_src == root_dst:
+            return
+        # union by size
+        if self.size[root_src] < self.size[root_dst]:
+            root_src, root_dst = root_dst, root_src
+        self.parent[root_dst] = root_src
+        self.size[root_src] += self.size.pop(root_dst)
+        self.island_count -= 1
+
+    def remove_edge(self, src, dst):
+        """
+        Raises:
+            ValueError: If there is no edge between src and dst.
+        """
+        if not self.neighbors.get(src, {}).get(dst):
+            raise ValueError(f"No edge between {src} and {dst}")
+        for a, b in ((src, dst), (dst, src)):
+            self.neighbors[a][b] -= 1
+            if not self.neighbors[a][b]:
+                del self.neighbors[a][b]
+        if dst in self.neighbors[src] or src == dst:
+            return  # still connected through a parallel edge
+
+        src_part = self._reachable(src)
+        if dst in src_part:
+            return
+        # island is split, rebuild both parts with fresh roots
+        dst_part = self._reachable(dst)
+        self.size.pop(self.find(src))
+        for root, part in ((src, src_part), (dst, dst_part)):
+            for id in part:
+                self.parent[id] = root
+            self.size[root] = len(part)
+        self.island_count += 1
+
+    def _reachable(self, id):
+        visited = {id}
+        stack = [id]
+        while stack:
+            for neighbor in self.neighbors.get(stack.pop(), ()):
+                if neighbor not in visited:
+                    visited.add(neighbor)
+                    stack.append(neighbor)
+        return visited
+
+    def island_of(self, id):
+        """
+        Returns:
+            str: id of the root node of the island of the node, same for all nodes of an island.
+        """
+        return self.find(id)
+
+    def same_island(self, a, b):
+        return self.find(a) == self.find(b)
+
+    def islands(self):
+        """
+        Returns:
+            list: List of islands, each a list of node IDs in the order the nodes were added.
+        """
+        islands = {}
+        for id in self.parent:
+            islands.setdefault(self.find(id), []).append(id)
+        return list(islands.values())
+
+    def to_dict(self):
+        """
+        Serializable state, island roots of each node, which can be stored alongside the graph.
+        """
+        return {"roots": {id: self.find(id) for id in self.parent}, "island_count": self.island_count}
+
+    @classmethod
+    def from_dict(cls, data, edges=()):
+        """
+        Restore a tracker from `to_dict` output. Edges, as (src, dst) pairs, are only needed to handle later deletions.
+        """
+        tracker = cls()
+        tracker.parent = dict(data["roots"])
+        tracker.size = dict(Counter(tracker.parent.values()))
+        tracker.island_count = data["island_count"]
+        for src, dst in edges:
+            tracker.neighbors[src][dst] += 1
+            tracker.neighbors[dst][src] += 1
+        return tracker
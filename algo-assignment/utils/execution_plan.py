@@ -0,0 +1,254 @@
+from array import array
+from collections import deque
+from models.models import Graph
+from models.compact_graph import CompactGraph
+from utils import vectorized
+
+# Backends to compute the toposort of a plan
+PYTHON = "python"
+NUMPY = "numpy"
+BACKENDS = (PYTHON, NUMPY)
+
+
+class ExecutionPlan:
+    """
+    Compiled structure of a graph which can be reused across runs.
+    All the structural work (indexing, adjacency, toposort, levels, roots and leaves) is done once
+    here, so a run only has to walk the precomputed arrays.
+
+    A plan can be compiled from a pydantic `Graph` or a `CompactGraph`.
+    Nodes are referred by their integer index, i.e. their position in `graph.nodes`.
+    Adjacency is stored in CSR style: the incoming edges of node `i` are the entries
+    `in_offsets[i]:in_offsets[i + 1]` of the `in_*` arrays, similarly for outgoing edges.
+    """
+
+    def __init__(self, graph, backend=PYTHON):
+        """
+        Args:
+            graph: pydantic `Graph` or `CompactGraph`
+            backend: "python", or "numpy" to compute indegrees and levels with array operations (see `utils.vectorized`)
+        """
+        nodes = graph.nodes
+        # ids of compact graphs are read without touching the nodes, mapped graphs decode node data only when needed
+        self.node_ids = list(graph.node_ids) if isinstance(graph, CompactGraph) else [node.id for node in nodes]
+        self.index = {id: i for i, id in enumerate(self.node_ids)}
+        self.node_count = len(nodes)
+
+        if isinstance(graph, CompactGraph):
+            self._load_compact(graph)
+        else:
+            self._load_graph(graph)
+
+        self.roots = []
+        self.execution_order = []  # node indices in topological order
+        self.level_of = [-1] * self.node_count  # -1 for nodes never reached by toposort (cycles)
+        self.levels = []  # node indices of each level, in toposort order
+        if backend == NUMPY:
+            self._toposort_vectorized()
+        elif backend == PYTHON:
+            self._toposort()
+        else:
+            raise ValueError(f"Unknown backend {backend}, expected one of {BACKENDS}")
+
+        # Level slices sorted by node id, this is the order in which a run visits the nodes
+        self.level_order = []
+        self.level_offsets = [0]
+        for level_nodes in self.levels:
+            self.level_order.extend(sorted(level_nodes, key=lambda i: self.node_ids[i]))
+            self.level_offsets.append(len(self.level_order))
+
+        # position of each node in the sorted level slices, used as deterministic tie-break by schedulers
+        self.position = [-1] * self.node_count
+        for position, i in enumerate(self.level_order):
+            self.position[i] = position
+
+        self.leaves = [i for i in range(self.node_count) if self.out_offsets[i] == self.out_offsets[i + 1]]
+        self._critical_path = None
+        self._ordered_ids = None
+        self._level_map = None
+        self._pruned = {}  # disabled node indices -> pruned node indices, see `prune`
+
+    def _load_graph(self, graph: Graph):
+        """
+        Build CSR adjacency from paths_in/paths_out of the nodes.
+        """
+        # CSR incoming adjacency, along with the index of the key mapping of each incoming edge in key_maps
+        self.in_offsets = [0]
+        self.in_sources = []
+        self.key_maps = []  # tuples of (src_key, dst_key) pairs, identical mappings share one entry
+        self.in_key_maps = []
+        # whether the src of an incoming edge takes precedence over existing data_in of the dst
+        self.in_precedes = []
+        key_tables = {}
+        for node in graph.nodes:
+            for edge in node.paths_in:
+                keys = tuple(edge.src_to_dst_data_keys.items())
+                if keys not in key_tables:
+                    key_tables[keys] = len(self.key_maps)
+                    self.key_maps.append(keys)
+                self.in_sources.append(self.index[edge.src_node])
+                self.in_key_maps.append(key_tables[keys])
+                self.in_precedes.append(edge.src_node < node.id)
+            self.in_offsets.append(len(self.in_sources))
+
+        # CSR outgoing adjacency
+        self.out_offsets = [0]
+        self.out_targets = []
+        for node in graph.nodes:
+            for edge in node.paths_out:
+                self.out_targets.append(self.index[edge.dst_node])
+            self.out_offsets.append(len(self.out_targets))
+
+    def _load_compact(self, graph: CompactGraph):
+        """
+        Compact graphs already are in CSR form, their arrays are used as they are (views over the file for a `MappedGraph`).
+        Only the incoming side is resolved through in_edges, into int arrays rather than lists.
+        """
+        ids = self.node_ids
+        in_edges, edge_src, edge_dst = graph.in_edges, graph.edge_src, graph.edge_dst
+        self.in_offsets = graph.in_offsets
+        self.in_sources = array("i", (edge_src[e] for e in in_edges))
+        self.key_maps = graph.key_maps
+        self.in_key_maps = array("i", (graph.edge_keys[e] for e in in_edges))
+        self.in_precedes = bytearray(ids[edge_src[e]] < ids[edge_dst[e]] for e in in_edges)
+        self.out_offsets = graph.out_offsets
+        self.out_targets = edge_dst
+
+    def _toposort(self):
+        """
+        Standard topological sorting using indegree and BFS, same as `GraphRunner.toposort` used to do on every run.
+        """
+
+        self.in_degrees = [0] * self.node_count
+        for dst in self.out_targets:
+            self.in_degrees[dst] += 1
+        in_degrees = list(self.in_degrees)
+
+        self.roots = [i for i in range(self.node_count) if in_degrees[i] == 0]
+        queue = deque(self.roots)
+        level = 0
+        visited = [False] * self.node_count
+
+        # Process each node level by level
+        while queue:
+            level_size = len(queue)
+            current_level = []
+            while level_size > 0:
+                i = queue.popleft()
+                if not visited[i]:  # Process each node only once
+                    visited[i] = True
+                    self.execution_order.append(i)
+                    self.level_of[i] = level
+                    current_level.append(i)
+
+                    for e in range(self.out_offsets[i], self.out_offsets[i + 1]):
+                        dst = self.out_targets[e]
+                        in_degrees[dst] -= 1
+                        if in_degrees[dst] == 0:
+                            queue.append(dst)
+
+                level_size -= 1
+            if current_level:
+                self.levels.append(current_level)
+            level += 1
+
+    def _toposort_vectorized(self):
+        """
+        Same toposort as `_toposort`, with frontier-at-a-time array operations.
+        """
+        levels = vectorized.toposort_levels(self.node_count, self.out_offsets, self.out_targets)
+        self.in_degrees = vectorized.get_in_degrees(self.node_count, self.out_targets)
+        self.level_of = vectorized.assign_levels(self.node_count, levels)
+        self.levels = [level.tolist() for level in levels]
+        self.execution_order = [i for level in self.levels for i in level]
+        self.roots = list(self.levels[0]) if self.levels else []
+
+    @property
+    def level_count(self):
+        return len(self.levels)
+
+    def level_slice(self, level):
+        """
+        Node indices of a level, sorted by node id.
+        """
+        return self.level_order[self.level_offsets[level]:self.level_offsets[level + 1]]
+
+    def prune(self, disabled):
+        """
+        Find the nodes which are not executed when some nodes are disabled: the disabled nodes and
+        everything that only they feed. Only the region downstream of the disabled nodes is visited,
+        the precomputed indegrees tell when all the sources of a node are pruned.
+
+        Args:
+            disabled: iterable of disabled node indices
+
+        Returns:
+            frozenset: pruned node indices
+        """
+        disabled = frozenset(disabled)
+        if disabled in self._pruned:
+            return self._pruned[disabled]
+
+        pruned = set(disabled)
+        live_in_degrees = {}  # remaining unpruned sources, only for the nodes downstream of the disabled nodes
+        stack = list(disabled)
+        while stack:
+            i = stack.pop()
+            for e in range(self.out_offsets[i], self.out_offsets[i + 1]):
+                dst = self.out_targets[e]
+                if dst in pruned:
+                    continue
+                live_in_degrees[dst] = live_in_degrees.get(dst, self.in_degrees[dst]) - 1
+                if live_in_degrees[dst] == 0:  # every source of dst is pruned
+                    pruned.add(dst)
+                    stack.append(dst)
+
+        if len(self._pruned) >= 32:  # keep only the recently used disabled sets
+            self._pruned.clear()
+        self._pruned[disabled] = frozenset(pruned)
+        return self._pruned[disabled]
+
+    def critical_path(self):
+        """
+        Length (in nodes) of the longest path from each node to a leaf, computed once on first use.
+        Nodes with a longer remaining path are started first by the ready-queue scheduler.
+
+        Returns:
+            list: critical path length for each node index, 0 for nodes never reached by toposort.
+        """
+        if self._critical_path is None:
+            lengths = [0] * self.node_count
+            for i in reversed(self.execution_order):
+                longest = 0
+                for e in range(self.out_offsets[i], self.out_offsets[i + 1]):
+                    longest = max(longest, lengths[self.out_targets[e]])
+                lengths[i] = longest + 1
+            self._critical_path = lengths
+        return self._critical_path
+
+    def ordered_ids(self):
+        """
+        Returns:
+            list: node IDs in topological order (a copy, it is safe to modify).
+        """
+        if self._ordered_ids is None:
+            self._ordered_ids = [self.node_ids[i] for i in self.execution_order]
+        return list(self._ordered_ids)
+
+    def level_map(self):
+        """
+        Returns:
+            dict: level index -> list of node IDs in that level (in toposort order), a copy which is safe to modify.
+        """
+        if self._level_map is None:
+            self._level_map = {
+                level: [self.node_ids[i] for i in level_nodes]
+                for level, level_nodes in enumerate(self.levels)
+            }
+        return {level: list(ids) for level, ids in self._level_map.items()}
+
+    def leaf_ids(self):
+        return [self.node_ids[i] for i in self.leaves]
+
+    def root_ids(self):
+        return [self.node_ids[i] for i in self.roots]
@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+# Executor modes which can be chosen for each run
+SERIAL = "serial"
+THREAD = "thread"
+PROCESS = "process"
+EXECUTOR_MODES = (SERIAL, THREAD, PROCESS)
+
+
+def get_executor(mode=SERIAL, max_workers=None):
+    """
+    Create a pool for the given executor mode.
+
+    Args:
+        mode: one of `EXECUTOR_MODES`, or an existing `concurrent.futures.Executor` to reuse across runs
+        max_workers: number of workers for a new pool, defaults to the number of cpus
+
+    Returns:
+        tuple: (executor, owned) -> executor is None for serial mode, owned tells if the caller must shut it down
+    """
+    if isinstance(mode, Executor):
+        return mode, False
+    if mode == SERIAL:
+        return None, False
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if mode == THREAD:
+        return ThreadPoolExecutor(max_workers=max_workers), True
+    if mode == PROCESS:
+        return ProcessPoolExecutor(max_workers=max_workers), True
+    raise ValueError(f"Unknown executor mode {mode}, expected one of {EXECUTOR_MODES}")
+
+
+def get_worker_count(executor):
+    return getattr(executor, "_max_workers", None) or os.cpu_count() or 1
+
+
+def get_chunksize(task_count, executor):
+    """
+    Split tasks into a few chunks per worker, so process pools do not pay IPC per node.
+    """
+    return max(1, task_count // (get_worker_count(executor) * 4))
@@ -1,6 +1,41 @@
+import copy
 import uuid
+import heapq
+from itertools import groupby
 from collections import deque, defaultdict
+from concurrent.futures import wait, FIRST_COMPLETED
+from typing import Union
 from models.models import Graph, Node, Edge, GraphRunConfig
+from models.compact_graph import CompactGraph
+from utils.execution_plan import ExecutionPlan
+from utils.executors import SERIAL, get_executor, get_chunksize, get_worker_count
+from utils.metrics import registry, timed, SIZE_BUCKETS
+
+# Schedulers which can be chosen for each run
+LEVELS = "levels"  # run level by level, a level starts once the previous one is complete
+READY = "ready"  # start each node as soon as all of its sources are done
+SCHEDULERS = (LEVELS, READY)
+
+
+def resolve_inputs(data_in, paths_in):
+    """
+    Apply overwriting rules based on source and destination nodes, for the incoming edges of a node.
+    A dst_key not yet present in data_in is always written. An existing value is overwritten only when
+    the src node id is lexicographically smaller than the dst node id (precomputed in `ExecutionPlan.in_precedes`).
+    This is kept at module level so it can be shipped to worker processes as well.
+
+    Args:
+        data_in: data_in of the node, updated in place
+        paths_in: list of (src data_out, src_to_dst_data_keys items, precedes) for each incoming edge
+
+    Returns:
+        dict: the resolved data_in
+    """
+    for src_data_out, keys, precedes in paths_in:
+        for src_key, dst_key in keys:
+            if precedes or dst_key not in data_in:
+                data_in[dst_key] = src_data_out[src_key]
+    return data_in
 
 
 class GraphRunner:
@@ -9,117 +44,360 @@ class GraphRunner:
     including graph traversal, level-wise traversal, execution, and island detection.
     """
 
-    def __init__(self, graph: Graph, config: GraphRunConfig):
+    def __init__(self, graph: Union[Graph, CompactGraph], config: GraphRunConfig, plan: ExecutionPlan = None):
         self.graph = graph
         self.config = config
-        self.node_map = {node.id: node for node in graph.nodes}
+        self._node_map = None
+        self.plan = plan  # compiled structure of the graph, built once and reused by every run
         self.execution_order = []  # Hold nodes in execution order after toposort
         self.level_map = defaultdict(list)
         self.run_data = {}  # store outputs for each run_id
+        self.executed_level_map = {}  # level map of the subgraph executed by the last run, without pruned nodes
+        self.run_leaves = {}  # leaves of the executed subgraph, for runs where nodes were pruned
+        self.last_run_id = None
+        self._last_inputs = None  # root_inputs and data_overwrites of the last run, compared by incremental runs
+        self._pruned = frozenset()  # node indices pruned by enable_list/disable_list of the current run
+        self.timings = {}  # seconds spent in each phase of the last run
+
+    @property
+    def node_map(self):
+        # built on first use, so constructing a runner on a mapped graph and checking its islands decode no node data
+        if self._node_map is None:
+            self._node_map = {node.id: node for node in self.graph.nodes}
+        return self._node_map
 
     def generate_run_id(self):
         return str(uuid.uuid4())  # Generate a unique run ID for each graph execution.
 
+    def compile(self):
+        """
+        Compile the graph into an execution plan, this is done only once and reused by all later runs.
+
+        Returns:
+            ExecutionPlan: compiled plan of the graph.
+        """
+        if self.plan is None:
+            self.plan = ExecutionPlan(self.graph)
+        return self.plan
+
     def toposort(self):
         """
         Perform topological sort and level-wise organization for the nodes in the graph.
+        The sort itself is done once while compiling the plan, see `ExecutionPlan`.
 
         Returns:
             list: list of node IDs in topological order.
         """
 
-        # Following standard topological sorting algo using indegree and BFS
-
-        in_degrees = {node.id: 0 for node in self.graph.nodes}
-        for node in self.graph.nodes:
-            for edge in node.paths_out:
-                in_degrees[edge.dst_node] += 1
-
-        queue = deque(
-            [node.id for node in self.graph.nodes if in_degrees[node.id] == 0]
-        )
-        level = 0
-        visited = set()
-
-        # Process each node level by level
-        while queue:
-            level_size = len(queue)
-            while level_size > 0:
-                id = queue.popleft()
-                if id not in visited:  # Process each node only once
-                    visited.add(id)
-                    self.execution_order.append(id)  # Add to topological order
-                    self.level_map[level].append(id)  # Add to current level
-
-                    for edge in self.node_map[id].paths_out:
-                        dst_node = edge.dst_node
-                        in_degrees[dst_node] -= 1
-                        if in_degrees[dst_node] == 0:
-                            queue.append(dst_node)
-
-                level_size -= 1
-            level += 1
+        plan = self.compile()
+        self.execution_order = plan.ordered_ids()
+        self.level_map = defaultdict(list, plan.level_map())
         return self.execution_order
 
-    def execute(self):
+    def execute(self, config: GraphRunConfig = None, executor=SERIAL, max_workers=None, scheduler=LEVELS, incremental=False):
         """
         Execute the graph based on the provided config. This includes setting up initial inputs,
         applying data overwrites, and running level-wise traversal to process data flow.
+        Nodes of a level do not depend on each other, so with a thread or process executor
+        all nodes of a level are resolved at once.
+
+        Args:
+            config: config for this run, defaults to the config the runner was created with
+            executor: "serial", "thread", "process" or an existing `concurrent.futures.Executor`
+            max_workers: number of workers when a new pool is created for this run
+            scheduler: "levels" to wait for each level to complete, or "ready" to start a node as soon as
+                       its sources are done (prioritised by critical path). Both give the same outputs.
+            incremental: compare root_inputs and data_overwrites with the last run, and only recompute the
+                         changed nodes and their downstream nodes. Outputs of all other nodes are reused.
+
+        Nodes disabled through enable_list/disable_list of the config, and everything that only they feed,
+        are pruned before execution and get no output in this run.
 
         Returns:
             str: The generated run_id for this run.
         """
 
+        if scheduler not in SCHEDULERS:
+            raise ValueError(f"Unknown scheduler {scheduler}, expected one of {SCHEDULERS}")
+        if config is not None:
+            self.config = config
+
         # generate run_id for this run
         run_id = self.generate_run_id()
         self.run_data[run_id] = {}
+        timings = self.timings = {}
+
+        with timed(timings, "toposort"):
+            self.toposort()  # Determine execution order via topological sorting
+        plan = self.plan
+        nodes = self.graph.nodes
 
-        self.toposort()  # Determine execution order via topological sorting
-
-        # Initialize root nodes with provided root inputs
-        for id, inputs in self.config.root_inputs.items():
-            if id in self.node_map:
-                self.node_map[id].data_in.update(inputs)
-
-        # Apply data overwrites
-        for id, overwrites in self.config.data_overwrites.items():
-            if id in self.node_map:
-                self.node_map[id].data_in.update(overwrites)
-
-        # Overwriting Level wise traversal
-        for level in sorted(self.level_map.keys()):
-            nodes_at_level = sorted(self.level_map[level], key=lambda nid: nid)
-            for id in nodes_at_level:
-                node = self.node_map[id]
-
-                # Apply overwriting rules based on source and destination nodes
-                for edge in node.paths_in:
-                    src_node = self.node_map[edge.src_node]
-                    for src_key, dst_key in edge.src_to_dst_data_keys.items():
-                        if dst_key in node.data_in:
-                            # Current node has a value for dst_key, apply overwriting rules
-                            current_level = self.level_map[id]
-                            src_level = self.level_map[src_node.id]
-                            if src_level > current_level or (
-                                src_level == current_level and src_node.id < id
-                            ):
-                                node.data_in[dst_key] = src_node.data_out[src_key]
-                        else:
-                            node.data_in[dst_key] = src_node.data_out[src_key]
-
-                # Store data outputs for the node in the current run
-                # We can store data_in also, considering the tests, currently only out is stored
-                self.run_data[run_id][id] = {
-                    # "data_in": node.data_in,
-                    "data_out": node.data_out
-                }
-
-        # Remove empty levels from level_map for clarity
-        updated_level_wise = {k: v for k, v in self.level_map.items() if len(v)}
-        self.level_map = updated_level_wise
+        with timed(timings, "prune"):
+            last_pruned = self._pruned
+            self._pruned = plan.prune(self._disabled_nodes())
+            inputs = self._snapshot_inputs()
+            previous_outputs = self.run_data.get(self.last_run_id)
+
+            # outputs of the last run can be reused only if the same subgraph is executed
+            reuse_outputs = incremental and previous_outputs is not None and self._pruned == last_pruned
+            if reuse_outputs:
+                nodes_to_run = [i for i in self._dirty_nodes(self._changed_nodes(self._last_inputs, inputs)) if i not in self._pruned]
+            elif self._pruned:
+                nodes_to_run = [i for i in plan.level_order if i not in self._pruned]
+            else:
+                nodes_to_run = None  # all nodes
+            selected = None if nodes_to_run is None else set(nodes_to_run)
+
+        with timed(timings, "inputs"):
+            # Initialize root nodes with provided root inputs
+            # nodes are looked up through the plan, so only the nodes given inputs are decoded on a mapped graph
+            for id, node_inputs in self.config.root_inputs.items():
+                if id in plan.index and self._is_selected(id, selected):
+                    nodes[plan.index[id]].data_in.update(node_inputs)
+
+            # Apply data overwrites
+            for id, overwrites in self.config.data_overwrites.items():
+                if id in plan.index and self._is_selected(id, selected):
+                    nodes[plan.index[id]].data_in.update(overwrites)
+
+        with timed(timings, "traverse"):
+            pool, owned = get_executor(executor, max_workers)
+            try:
+                if scheduler == LEVELS:
+                    self._run_levels(pool, nodes_to_run)
+                else:
+                    self._run_ready_queue(pool, nodes_to_run)
+            finally:
+                if owned:
+                    pool.shutdown()
+
+        # Store data outputs for each node in the current run, in the level-wise order whatever the scheduler was
+        # We can store data_in also, considering the tests, currently only out is stored
+        with timed(timings, "store"):
+            if reuse_outputs:
+                # reuse outputs of the clean nodes, keys of the last run already are in the level-wise order
+                self.run_data[run_id] = dict(previous_outputs)
+                for i in nodes_to_run:
+                    node = nodes[i]
+                    self.run_data[run_id][node.id] = {"data_out": node.data_out}
+            else:
+                for i in plan.level_order if nodes_to_run is None else nodes_to_run:
+                    node = nodes[i]
+                    self.run_data[run_id][node.id] = {
+                        # "data_in": node.data_in,
+                        "data_out": node.data_out
+                    }
+        self._record_metrics(plan, plan.node_count if nodes_to_run is None else len(nodes_to_run))
+
+        self.level_map = plan.level_map()
+        if self._pruned:
+            self.executed_level_map = self._executed_level_map()
+            self.run_leaves[run_id] = self._executed_leaves()
+        else:
+            self.executed_level_map = plan.level_map()
+        self.last_run_id = run_id
+        self._last_inputs = inputs
 
         return run_id
 
+    def _record_metrics(self, plan, executed_count):
+        """
+        Record the timing breakdown and the size of the last run in the metrics registry, if it is enabled.
+        """
+        if not registry.enabled:
+            return
+        registry.observe_phases(registry.histogram(
+            "graph_runner_phase_seconds", "Seconds spent in each phase of GraphRunner.execute", labels=("phase",)
+        ), self.timings)
+        registry.counter("graph_runner_runs_total", "Runs of GraphRunner.execute").inc()
+        registry.histogram("graph_runner_nodes", "Nodes of the graphs run", buckets=SIZE_BUCKETS).observe(plan.node_count)
+        registry.histogram("graph_runner_edges", "Edges of the graphs run", buckets=SIZE_BUCKETS).observe(len(plan.out_targets))
+        registry.histogram("graph_runner_executed_nodes", "Nodes executed by each run", buckets=SIZE_BUCKETS).observe(executed_count)
+
+    def _disabled_nodes(self):
+        """
+        Node indices disabled by the current config. With an enable_list, every node not in it is disabled.
+        """
+        index = self.plan.index
+        if self.config.enable_list:
+            enabled = {index[id] for id in self.config.enable_list if id in index}
+            return [i for i in range(self.plan.node_count) if i not in enabled]
+        return [index[id] for id in self.config.disable_list or [] if id in index]
+
+    def _is_selected(self, id, selected):
+        i = self.plan.index[id]
+        return i not in self._pruned if selected is None else i in selected
+
+    def _executed_level_map(self):
+        """
+        Level map of the executed subgraph, i.e. without pruned nodes. Empty levels are removed.
+        """
+        executed = {}
+        for level, level_nodes in enumerate(self.plan.levels):
+            ids = [self.plan.node_ids[i] for i in level_nodes if i not in self._pruned]
+            if ids:
+                executed[level] = ids
+        return executed
+
+    def _executed_leaves(self):
+        """
+        Leaves of the executed subgraph: unpruned leaves of the graph, and unpruned nodes which only feed pruned nodes.
+        """
+        plan = self.plan
+        leaves = {i for i in plan.leaves if i not in self._pruned}
+        for i in self._pruned:
+            for e in range(plan.in_offsets[i], plan.in_offsets[i + 1]):
+                src = plan.in_sources[e]
+                if src not in self._pruned and all(
+                    plan.out_targets[o] in self._pruned for o in range(plan.out_offsets[src], plan.out_offsets[src + 1])
+                ):
+                    leaves.add(src)
+        return [plan.node_ids[i] for i in sorted(leaves)]
+
+    def _snapshot_inputs(self):
+        """
+        Copy of root_inputs and data_overwrites of the current config, to be compared by the next incremental run.
+        """
+        return copy.deepcopy((self.config.root_inputs, self.config.data_overwrites))
+
+    def _changed_nodes(self, old_inputs, new_inputs):
+        """
+        Node indices whose root_inputs or data_overwrites entry differs between two snapshots.
+        """
+        changed = set()
+        for old, new in zip(old_inputs, new_inputs):
+            for id in old.keys() | new.keys():
+                if id in self.plan.index and old.get(id) != new.get(id):
+                    changed.add(self.plan.index[id])
+        return changed
+
+    def _dirty_nodes(self, changed):
+        """
+        Mark changed nodes and everything downstream of them (through paths_out) as dirty.
+        Nodes never reached by toposort (cycles) are left out, same as in a full run.
+
+        Returns:
+            list: dirty node indices, in the level-wise order of the plan.
+        """
+        plan = self.plan
+        dirty = set(changed)
+        stack = list(changed)
+        while stack:
+            i = stack.pop()
+            for e in range(plan.out_offsets[i], plan.out_offsets[i + 1]):
+                dst = plan.out_targets[e]
+                if dst not in dirty:
+                    dirty.add(dst)
+                    stack.append(dst)
+        return sorted((i for i in dirty if plan.position[i] >= 0), key=plan.position.__getitem__)
+
+    def _run_levels(self, pool, nodes_to_run=None):
+        """
+        Overwriting Level wise traversal, levels are already sorted by node id in the plan
+
+        Args:
+            nodes_to_run: node indices in the level-wise order, defaults to all nodes
+        """
+        plan = self.plan
+        nodes = self.graph.nodes
+        if nodes_to_run is None:
+            levels = (plan.level_slice(level) for level in range(plan.level_count))
+        else:
+            levels = (list(group) for _, group in groupby(nodes_to_run, key=plan.level_of.__getitem__))
+
+        for level_nodes in levels:
+            if pool is None:
+                for i in level_nodes:
+                    resolve_inputs(nodes[i].data_in, self._paths_in(i))
+                continue
+
+            resolved = pool.map(
+                resolve_inputs,
+                [nodes[i].data_in for i in level_nodes],
+                [self._paths_in(i) for i in level_nodes],
+                chunksize=get_chunksize(len(level_nodes), pool),
+            )
+            for i, data_in in zip(level_nodes, resolved):
+                self._store_inputs(i, data_in)
+
+    def _run_ready_queue(self, pool, nodes_to_run=None):
+        """
+        Dependency driven traversal: a node becomes ready once the remaining indegree of it drops to 0.
+        Ready nodes are started by longest critical path first, ties broken by the level-wise order.
+        Each node only writes its own data_in, so the outcome is the same as the level-wise traversal.
+
+        Args:
+            nodes_to_run: node indices in the level-wise order, defaults to all nodes
+        """
+        plan = self.plan
+        nodes = self.graph.nodes
+        critical_path = plan.critical_path()
+        if nodes_to_run is None:
+            selected = None
+            remaining = list(plan.in_degrees)
+            ready = [(-critical_path[i], plan.position[i], i) for i in plan.roots]
+        else:
+            # only count the sources which are part of this run
+            selected = remaining = dict.fromkeys(nodes_to_run, 0)
+            for i in nodes_to_run:
+                for e in range(plan.out_offsets[i], plan.out_offsets[i + 1]):
+                    if plan.out_targets[e] in selected:
+                        remaining[plan.out_targets[e]] += 1
+            ready = [(-critical_path[i], plan.position[i], i) for i in nodes_to_run if remaining[i] == 0]
+        heapq.heapify(ready)
+
+        def release(i):
+            # mark node i as done and enqueue the successors which have all their sources done
+            for e in range(plan.out_offsets[i], plan.out_offsets[i + 1]):
+                dst = plan.out_targets[e]
+                if selected is not None and dst not in selected:
+                    continue
+                remaining[dst] -= 1
+                if remaining[dst] == 0:
+                    heapq.heappush(ready, (-critical_path[dst], plan.position[dst], dst))
+
+        if pool is None:
+            while ready:
+                i = heapq.heappop(ready)[2]
+                resolve_inputs(nodes[i].data_in, self._paths_in(i))
+                release(i)
+            return
+
+        # keep only as many nodes in flight as there are workers, so that priorities are honoured
+        limit = get_worker_count(pool)
+        in_flight = {}
+        try:
+            while ready or in_flight:
+                while ready and len(in_flight) < limit:
+                    i = heapq.heappop(ready)[2]
+                    in_flight[pool.submit(resolve_inputs, nodes[i].data_in, self._paths_in(i))] = i
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda f: plan.position[in_flight[f]]):
+                    i = in_flight.pop(future)
+                    self._store_inputs(i, future.result())
+                    release(i)
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def _store_inputs(self, i, data_in):
+        node = self.graph.nodes[i]
+        if data_in is not node.data_in:  # resolved in another process
+            node.data_in.update(data_in)
+
+    def _paths_in(self, i):
+        """
+        Incoming paths of node at index i, as expected by `resolve_inputs`.
+        """
+        plan = self.plan
+        nodes = self.graph.nodes
+        return [
+            (nodes[plan.in_sources[e]].data_out, plan.key_maps[plan.in_key_maps[e]], plan.in_precedes[e])
+            for e in range(plan.in_offsets[i], plan.in_offsets[i + 1])
+            if plan.in_sources[e] not in self._pruned  # pruned sources are not part of the executed subgraph
+        ]
+
     def get_node_output(self, id, run_id):
         # Get run ouput based on node_id
         return self.run_data.get(run_id, {}).get(id, None)
@@ -130,9 +408,10 @@ class GraphRunner:
         """
 
         leaf_outputs = {}
-        for id, node in self.node_map.items():
-            if len(node.paths_out) == 0:  # identify leaf nodes
-                leaf_outputs[id] = self.get_node_output(run_id=run_id, id=id)
+        # leaf nodes are identified once in the plan, or per run when nodes were pruned
+        leaves = self.run_leaves[run_id] if run_id in self.run_leaves else self.compile().leaf_ids()
+        for id in leaves:
+            leaf_outputs[id] = self.get_node_output(run_id=run_id, id=id)
         return leaf_outputs
 
     def check_islands(self):
@@ -143,34 +422,32 @@ class GraphRunner:
             list: List of islands, where each island is represented as a list of node IDs.
         """
         
-        visited = set()
+        plan = self.compile()
+        visited = [False] * plan.node_count
         islands = []
 
-        def dfs(id, current_island):
+        def dfs(i, current_island):
             """
             Perform DFS to explore all nodes in a connected component.
             """
             
-            # iterate over each neighbor of current node_id and maintain stack for iteration 
-            stack = [id]
+            # iterate over each neighbor of current node and maintain stack for iteration 
+            stack = [i]
             while stack:
                 current = stack.pop()
-                if current not in visited:
-                    visited.add(current)
-                    current_island.append(current)
-                    node = self.node_map[current]
+                if not visited[current]:
+                    visited[current] = True
+                    current_island.append(plan.node_ids[current])
 
-                    for edge in node.paths_in + node.paths_out:
-                        neighbor_id = (
-                            edge.src_node if edge.src_node != current else edge.dst_node
-                        )
-                        stack.append(neighbor_id)
+                    # sources of incoming edges followed by destinations of outgoing edges
+                    stack.extend(plan.in_sources[plan.in_offsets[current]:plan.in_offsets[current + 1]])
+                    stack.extend(plan.out_targets[plan.out_offsets[current]:plan.out_offsets[current + 1]])
 
         # Detect each disconnected component by DFS on unvisited nodes
-        for id in self.node_map:
-            if id not in visited:
+        for i in range(plan.node_count):
+            if not visited[i]:
                 current_island = []
-                dfs(id=id, current_island=current_island)
+                dfs(i=i, current_island=current_island)
                 if current_island:
                     islands.append(current_island)
 
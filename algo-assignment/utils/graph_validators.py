@@ -1,16 +1,39 @@
 import uuid
 from collections import deque, defaultdict
+from typing import Union
 from models.models import Graph, Node, Edge, GraphRunConfig
+from models.compact_graph import CompactGraph
+from utils.connectivity import IslandTracker
 
 class GraphValidator:
     """
     A class to validate a directed acyclic graph, including edge compatibility,
     cycle detection, and isolation of disconnected components (islands).
+    Checks run on the arrays of a `CompactGraph`, a pydantic graph is converted on first use.
+    An `IslandTracker` kept up to date alongside the graph answers the islands check without a DFS.
     """
-    def __init__(self, graph: Graph):
+    def __init__(self, graph: Union[Graph, CompactGraph], island_tracker: IslandTracker = None):
         self.graph = graph
+        self.island_tracker = island_tracker
+        self._node_map = None
+        self._compact = graph if isinstance(graph, CompactGraph) else None
+        # filled by `validate`: offending cycle path (first node repeated at the end) and members of each island
+        self.cycle = []
+        self.islands = []
+
+    @property
+    def node_map(self):
         # Create a mapping of node IDs to their respective Node objects for easy lookup
-        self.node_map = {node.id: node for node in graph.nodes}
+        # built on first use, so the structural checks of a mapped graph do not decode node data
+        if self._node_map is None:
+            self._node_map = {node.id: node for node in self.graph.nodes}
+        return self._node_map
+
+    @property
+    def compact(self) -> CompactGraph:
+        if self._compact is None:
+            self._compact = CompactGraph.from_graph(self.graph)
+        return self._compact
     
     def validate_edge_compatibility(self):
         """
@@ -20,55 +43,54 @@ class GraphValidator:
             ValueError: If there is a data type mismatch between `data_out` of the src node
                         and `data_in` of the dst node for any edge.
         """
-        for node in self.graph.nodes:
-            for edge in node.paths_out:
-                
-                src_node = self.node_map[edge.src_node]
-                dst_node = self.node_map[edge.dst_node]
-                
-                # Validate that data types match for each key in src_to_dst_data_keys
-                for src_key, dst_key in edge.src_to_dst_data_keys.items():
-                    if type(src_node.data_out.get(src_key)) != type(dst_node.data_in.get(dst_key)):
-                        raise ValueError(f"Data type mismatch between {src_node.id}:{src_key} and {dst_node.id}:{dst_key}")
-                    # assert type(src_node.data_out.get(src_key)) == type(dst_node.data_in.get(dst_key)), \
-                    #     "Incompatible data types for edge from {} to {}".format(src_node.id, dst_node.id)
+        graph = self.compact
+        for src, dst, key_map in zip(graph.edge_src, graph.edge_dst, graph.edge_keys):
+            src_node = graph.nodes[src]
+            dst_node = graph.nodes[dst]
+
+            # Validate that data types match for each key in src_to_dst_data_keys
+            for src_key, dst_key in graph.key_maps[key_map]:
+                if type(src_node.data_out.get(src_key)) != type(dst_node.data_in.get(dst_key)):
+                    raise ValueError(f"Data type mismatch between {src_node.id}:{src_key} and {dst_node.id}:{dst_key}")
+                # assert type(src_node.data_out.get(src_key)) == type(dst_node.data_in.get(dst_key)), \
+                #     "Incompatible data types for edge from {} to {}".format(src_node.id, dst_node.id)
     
     def detect_cycle(self):
         """
         Detect cycles using DFS. This method ensures that the graph is DAG.
+        DFS is iterative with an explicit stack, so long chains do not hit the recursion limit.
         
         Raises:
             ValueError: If a cycle is detected in the graph.
         """
         
-        visited = set()  # Track all visited nodes
-        stack = set()    # Track nodes in the current path to detect cycles
-        
-        def dfs(id):
-            """
-            Recursive helper function to perform DFS and detect cycles.
-            """
-            if id in stack:
-                return True # cycle detected
-            if id in visited:
-                return False # already visited, no cycle
-            
-            # Mark the node as visited and add it to the current path stack
-            visited.add(id)
-            stack.add(id)
-            for edge in self.node_map[id].paths_out:
-                if dfs(edge.dst_node):
-                    return True # cycle found in recursive path
-
-            # remove node form current path
-            stack.remove(id)
-            return False
+        graph = self.compact
+        visited = [False] * len(graph.nodes)  # Track all visited nodes
+        path = [False] * len(graph.nodes)    # Track nodes in the current path to detect cycles
         
         # Perform DFS from each unvisited node
-        for node in self.graph.nodes:
-            if node.id not in visited:
-                if dfs(node.id):
+        for i in range(len(graph.nodes)):
+            if visited[i]:
+                continue
+
+            # each stack entry is a node on the current path alongside the next of its outgoing edges to explore
+            visited[i] = path[i] = True
+            stack = [(i, graph.out_offsets[i])]
+            while stack:
+                current, e = stack[-1]
+                if e == graph.out_offsets[current + 1]:
+                    # all edges explored, remove node from current path
+                    stack.pop()
+                    path[current] = False
+                    continue
+
+                stack[-1] = (current, e + 1)
+                dst = graph.edge_dst[e]
+                if path[dst]:
                     raise ValueError("Cycle detected in the graph.")
+                if not visited[dst]:
+                    visited[dst] = path[dst] = True
+                    stack.append((dst, graph.out_offsets[dst]))
                 
     def check_islands(self):
         """
@@ -79,26 +101,124 @@ class GraphValidator:
             ValueError: If disconnected components are found in the graph.
         """
         
-        visited = set()
+        if self.island_tracker is not None:
+            if self.island_tracker.island_count > 1:
+                raise ValueError("Graph contains islands")
+            return
+
+        graph = self.compact
+        visited = [False] * len(graph.nodes)
         
-        def dfs(id):
+        def dfs(i):
             """
             Depth-First Search (DFS) to mark all nodes reachable from a starting node.
             """
             
-            stack = [id]  # Use a stack for DFS
+            stack = [i]  # Use a stack for DFS
             while stack:
                 current = stack.pop()
-                if current not in visited:
-                    visited.add(current)  # Mark the node as visited
-                    node = self.node_map[current]
+                if not visited[current]:
+                    visited[current] = True  # Mark the node as visited
                     
                     # Explore both incoming and outgoing edges to find all connected nodes
-                    for edge in node.paths_in + node.paths_out:
-                        neighbor_id = edge.src_node if edge.src_node != current else edge.dst_node
-                        stack.append(neighbor_id)
+                    for e in graph.in_edges[graph.in_offsets[current]:graph.in_offsets[current + 1]]:
+                        stack.append(graph.edge_src[e])
+                    stack.extend(graph.edge_dst[graph.out_offsets[current]:graph.out_offsets[current + 1]])
         
+        if not graph.nodes:
+            return
+
         # Start DFS from the first node and check if all nodes are connected               
-        dfs(self.graph.nodes[0].id)
-        if len(visited)!=len(self.graph.nodes):
+        dfs(0)
+        if not all(visited):
             raise ValueError("Graph contains islands")
+
+    def validate(self):
+        """
+        Run all the checks (edge compatibility, cycle, islands) in a single O(V+E) sweep over the compact adjacency.
+        Edges are scanned once to check data types and count indegrees, while a union-find groups the nodes into islands.
+        Cycles are then found by Kahn's indegree counting, nodes left with a nonzero indegree are on or downstream of a cycle.
+
+        The offending cycle path and the island members are kept in `self.cycle` and `self.islands`.
+
+        Raises:
+            ValueError: with all the problems found, if any of the checks fails.
+        """
+        graph = self.compact
+        ids = graph.node_ids
+        node_count = len(ids)
+
+        # single pass over the edges: data types, indegrees and union-find
+        errors = []
+        in_degrees = [0] * node_count
+        parent = list(range(node_count))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]  # path halving
+                i = parent[i]
+            return i
+
+        for src, dst, key_map in zip(graph.edge_src, graph.edge_dst, graph.edge_keys):
+            src_node = graph.nodes[src]
+            dst_node = graph.nodes[dst]
+            for src_key, dst_key in graph.key_maps[key_map]:
+                if type(src_node.data_out.get(src_key)) != type(dst_node.data_in.get(dst_key)):
+                    errors.append(f"Data type mismatch between {src_node.id}:{src_key} and {dst_node.id}:{dst_key}")
+
+            in_degrees[dst] += 1
+            root_src, root_dst = find(src), find(dst)
+            if root_src != root_dst:
+                parent[root_src] = root_dst
+
+        # Kahn's algorithm over the compact adjacency
+        out_offsets, out_targets = graph.out_offsets, graph.edge_dst
+        queue = [i for i in range(node_count) if in_degrees[i] == 0]
+        for i in queue:  # queue grows while iterating
+            for e in range(out_offsets[i], out_offsets[i + 1]):
+                dst = out_targets[e]
+                in_degrees[dst] -= 1
+                if in_degrees[dst] == 0:
+                    queue.append(dst)
+
+        self.cycle = []
+        if len(queue) != node_count:
+            self.cycle = self._find_cycle(ids, out_offsets, out_targets, in_degrees)
+            errors.append(f"Cycle detected in the graph: {' -> '.join(self.cycle)}")
+
+        # group nodes of each island, in the order of graph nodes
+        islands = {}
+        for i in range(node_count):
+            islands.setdefault(find(i), []).append(ids[i])
+        self.islands = list(islands.values())
+        if len(self.islands) > 1:
+            errors.append(f"Graph contains islands: {self.islands}")
+
+        if errors:
+            raise ValueError("; ".join(errors))
+
+    def _find_cycle(self, ids, out_offsets, out_targets, in_degrees):
+        """
+        Get a cycle path among the nodes left over by Kahn's algorithm.
+        Every left over node has a left over predecessor, so walking predecessors must come back to a visited node.
+        """
+        predecessor = {}
+        for src in range(len(ids)):
+            if in_degrees[src] == 0:  # processed nodes are not part of any cycle
+                continue
+            for e in range(out_offsets[src], out_offsets[src + 1]):
+                dst = out_targets[e]
+                if in_degrees[dst] and dst not in predecessor:
+                    predecessor[dst] = src
+
+        current = next(iter(predecessor))
+        seen = {}
+        while current not in seen:
+            seen[current] = len(seen)
+            current = predecessor[current]
+
+        # current is the first repeated node, the cycle is the walk from there, reversed to follow edge direction
+        walk = list(seen)
+        cycle = walk[seen[current]:][::-1]
+        cycle.append(cycle[0])
+        return [ids[i] for i in cycle]
@@ -0,0 +1,169 @@
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only the vectorised backend needs it
+    np = None
+
+from models.compact_graph import CompactGraph
+
+# frontiers up to this size are expanded with a plain loop, numpy call overhead dominates below it (e.g. long chains)
+SMALL_FRONTIER = 32
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("numpy is required for the vectorised backend, install it with `pip install numpy`")
+
+
+def get_edge_arrays(graph):
+    """
+    Get the outgoing adjacency of a graph as numpy arrays, edges are grouped by src in the order of paths_out.
+
+    Returns:
+        tuple: (node_ids, out_offsets, out_targets)
+    """
+    require_numpy()
+    if isinstance(graph, CompactGraph):
+        # compact graphs already hold int arrays, these are wrapped without copying
+        return graph.node_ids, np.frombuffer(graph.out_offsets, dtype=np.intc), np.frombuffer(graph.edge_dst, dtype=np.intc)
+
+    node_ids = [node.id for node in graph.nodes]
+    index = {id: i for i, id in enumerate(node_ids)}
+    out_targets = np.fromiter(
+        (index[edge.dst_node] for node in graph.nodes for edge in node.paths_out), dtype=np.int64
+    )
+    out_degrees = np.fromiter((len(node.paths_out) for node in graph.nodes), dtype=np.int64, count=len(node_ids))
+    out_offsets = np.concatenate(([0], np.cumsum(out_degrees)))
+    return node_ids, out_offsets, out_targets
+
+
+def toposort_levels(node_count, out_offsets, out_targets):
+    """
+    Frontier-at-a-time Kahn's algorithm. Each level is expanded with array operations, and the next level is ordered
+    by the position of the edge which brought the indegree of each node to 0, so the result is the same
+    as the BFS toposort of `ExecutionPlan`.
+
+    Returns:
+        list: numpy array of node indices for each level, nodes on or downstream of a cycle are never reached.
+    """
+    require_numpy()
+    out_offsets = np.asarray(out_offsets, dtype=np.int64)
+    out_targets = np.asarray(out_targets, dtype=np.int64)
+    in_degrees = np.bincount(out_targets, minlength=node_count)
+    frontier = np.flatnonzero(in_degrees == 0)
+
+    offsets_list, targets_list = None, None  # list copies for the plain loop, made on first use
+
+    levels = []
+    while len(frontier):
+        levels.append(frontier)
+        if len(frontier) <= SMALL_FRONTIER:
+            if offsets_list is None:
+                offsets_list, targets_list = out_offsets.tolist(), out_targets.tolist()
+            next_frontier = []
+            for i in frontier.tolist():
+                for e in range(offsets_list[i], offsets_list[i + 1]):
+                    dst = targets_list[e]
+                    in_degrees[dst] -= 1
+                    if in_degrees[dst] == 0:
+                        next_frontier.append(dst)
+            frontier = np.array(next_frontier, dtype=np.int64)
+            continue
+
+        # gather the outgoing edges of the frontier, in frontier order
+        starts = out_offsets[frontier]
+        lengths = out_offsets[frontier + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            break
+        edge_positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        dsts = out_targets[edge_positions]
+
+        nodes, counts = np.unique(dsts, return_counts=True)
+        in_degrees[nodes] -= counts
+        ready = nodes[in_degrees[nodes] == 0]
+
+        # position of the last edge into each ready node, i.e. when the BFS would have enqueued it
+        reversed_nodes, reversed_first = np.unique(dsts[::-1], return_index=True)
+        last_position = total - 1 - reversed_first[np.searchsorted(reversed_nodes, ready)]
+        frontier = ready[np.argsort(last_position, kind="stable")]
+    return levels
+
+
+def assign_levels(node_count, levels):
+    """
+    Returns:
+        list: level of each node index, -1 for nodes never reached by the toposort
+    """
+    level_of = np.full(node_count, -1, dtype=np.int64)
+    for level, nodes in enumerate(levels):
+        level_of[nodes] = level
+    return level_of.tolist()
+
+
+def get_in_degrees(node_count, out_targets):
+    return np.bincount(np.asarray(out_targets, dtype=np.int64), minlength=node_count).tolist()
+
+
+def toposort(graph):
+    """
+    Vectorised topological sort and level assignment of a graph.
+
+    Returns:
+        tuple: (execution_order, level_map) same as `GraphRunner.execution_order` and `GraphRunner.level_map`
+    """
+    node_ids, out_offsets, out_targets = get_edge_arrays(graph)
+    levels = toposort_levels(len(node_ids), out_offsets, out_targets)
+    level_map = {level: [node_ids[i] for i in nodes.tolist()] for level, nodes in enumerate(levels)}
+    execution_order = [id for level in level_map.values() for id in level]
+    return execution_order, level_map
+
+
+def component_labels(node_count, src, dst):
+    """
+    Connected components over undirected edges, by hooking roots onto the smaller root across every edge and
+    pointer jumping until all nodes point to their root. Each round at least halves the number of components
+    which still have a neighbour, so only O(log V) rounds of array operations are needed.
+
+    Returns:
+        numpy array: label of each node, the smallest node index of its component
+    """
+    require_numpy()
+    parent = np.arange(node_count)
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    while True:
+        src_root, dst_root = parent[src], parent[dst]
+        crossing = src_root != dst_root
+        if not crossing.any():
+            return parent
+        low = np.minimum(src_root, dst_root)[crossing]
+        high = np.maximum(src_root, dst_root)[crossing]
+        np.minimum.at(parent, high, low)
+
+        # pointer jumping
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def check_islands(graph):
+    """
+    Vectorised island detection. Islands come in the same order as `GraphRunner.check_islands`
+    (by their first node in the graph), members of an island are listed in the order of graph nodes.
+
+    Returns:
+        list: List of islands, where each island is represented as a list of node IDs.
+    """
+    node_ids, out_offsets, out_targets = get_edge_arrays(graph)
+    node_count = len(node_ids)
+    if node_count == 0:
+        return []
+    out_offsets = np.asarray(out_offsets, dtype=np.int64)
+    src = np.repeat(np.arange(node_count), np.diff(out_offsets))
+    labels = component_labels(node_count, src, out_targets)
+
+    order = np.argsort(labels, kind="stable")
+    _, starts = np.unique(labels[order], return_index=True)
+    return [[node_ids[i] for i in members.tolist()] for members in np.split(order, starts[1:])]
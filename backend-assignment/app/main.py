@@ -1,14 +1,58 @@
-from fastapi import FastAPI
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from app.routers import graph_router
 from app.routers import run_router
+from app.utils import database
+from app.utils.cache import compiled_graph_cache, run_result_cache
+from app.utils.jobs import run_job_queue
+from app.utils.metrics import registry
+from app.utils.api import ensure_indexes
+from app.utils.graph_operations import shutdown_process_pool
+from app.utils.responses import FastJSONResponse
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the worker only starts serving once its connection pool is warm and the indexes exist
+    await database.connect()
+    await ensure_indexes()
+    yield
+    run_job_queue.shutdown()
+    shutdown_process_pool()
+    database.close()
 
-@app.get("/test")
-def test_app():
-    return "App is up"
+# responses are encoded with orjson when it is installed
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+@app.get("/ready")
+async def ready():
+    """ readiness of the worker, 503 until its connection pool is up and answering pings """
+    health = await database.get_pool_health()
+    if not health["connected"]:
+        raise HTTPException(status_code=503, detail=health)
+    return {"status": "ready", "pool": health}
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    """ hit/miss counters of the compiled graph cache """
+    return compiled_graph_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    metrics of this worker in the Prometheus text format: phase timings of compiles and runs, graph sizes,
+    Mongo latency, cache counters and job queue depth
+    """
+    cache_metrics = {
+        stat: registry.gauge(f"cache_{stat}", f"{stat.capitalize()} of the in-process caches", labels=("cache",))
+        for stat in ("hits", "misses", "evictions", "size")
+    }
+    for name, cache in (("compiled_graph", compiled_graph_cache), ("run_result", run_result_cache)):
+        stats = cache.stats()
+        for stat, gauge in cache_metrics.items():
+            gauge.set(stats[stat], cache=name)
+    registry.gauge("run_queue_depth", "Runs waiting in the job queue").set(run_job_queue.depth)
+    return registry.render()
 
 # include graph and run routers
 app.include_router(graph_router.router)
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field
+from datetime import datetime
 from typing import List, Dict, Optional
 from bson import ObjectId
 
@@ -20,6 +21,24 @@ class Graph(BaseModel):
     nodes: List[Node]
     edges: List[Edge]
 
+class NodeUpdate(BaseModel):
+    id: str
+    data_in: Optional[Dict[str, str]] = None
+    data_out: Optional[Dict[str, str]] = None
+
+class EdgeUpdate(BaseModel):
+    id: str
+    src_to_dst_data_keys: Dict[str, str]
+
+class GraphPatch(BaseModel):
+    # edges are moved by removing and adding them, removing a node also removes its edges
+    add_nodes: List[Node] = []
+    remove_nodes: List[str] = []
+    update_nodes: List[NodeUpdate] = []
+    add_edges: List[Edge] = []
+    remove_edges: List[str] = []
+    update_edges: List[EdgeUpdate] = []
+
 class RunConfig(BaseModel):
     root_inputs: Dict[str, Dict[str, str]]
     data_overwrites: Optional[Dict[str, Dict[str, str]]] = None
@@ -29,4 +48,8 @@ class RunConfig(BaseModel):
 class RunOutput(BaseModel):
     run_id: str
     graph_id: str
-    node_outputs: Dict[str, Dict[str, str]]
+    version_hash: Optional[str] = None  # content hash of the version of the graph which was run
+    node_outputs: Dict[str, Dict[str, str]] = {}
+    status: str = "done"  # queued, running, done or failed for runs submitted to the job queue
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
@@ -1,7 +1,14 @@
-from fastapi import APIRouter, HTTPException
-from app.models import Graph, RunConfig
-from app.utils.api import create_graph, get_graph, update_graph, delete_graph
-from app.utils.graph_operations import run_graph
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from pydantic import ValidationError
+from pymongo.errors import PyMongoError
+from app.models import Graph, GraphPatch, RunConfig
+from app.utils.api import create_graph, ingest_graph, get_graph_data, update_graph, patch_graph, delete_graph, get_graph_islands, list_graph_runs, list_graph_versions, get_graph_version, GraphConflictError
+from app.utils.validator import GraphValidationError
+from app.utils.ingest import GraphTooLargeError, INGEST_MAX_BYTES
+from app.utils.serializers import pack_graph, unpack_graph
+from app.utils.responses import FastJSONResponse, MSGPACK_MEDIA_TYPE
 
 router = APIRouter()
 
@@ -13,27 +20,161 @@ async def create_new_graph(graph: Graph):
     graph_id = await create_graph(graph)
     return {"graph_id": str(graph_id)}
 
+@router.post("/graphs/binary")
+async def create_new_graph_binary(request: Request):
+    """
+    route to create new graph from its compact binary format (application/x-msgpack), see pack_graph
+    """
+    try:
+        graph = Graph(**unpack_graph(await request.body()))
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Binary graphs need the msgpack package")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    graph_id = await create_graph(graph)
+    return {"graph_id": str(graph_id)}
+
+@router.post("/graphs/{graph_id}/ingest")
+async def ingest_graph_by_id(graph_id: str, request: Request, allow_islands: bool = False):
+    """
+    route to create a graph from a NDJSON stream of node and edge records, for graphs too large to send as one body
+    each line is a node or an edge like in POST /graphs/ with "type": "node" or "edge", nodes come before their edges
+    records are checked as they arrive and written in batches, cycles and islands are checked once the stream ends
+    the graph is stored as one document, so streams over INGEST_MAX_BYTES are rejected with 413
+    """
+    try:
+        content_length = int(request.headers.get("content-length", 0))
+    except ValueError:
+        content_length = 0  # not checked up front, the stream is still stopped once it reaches the limit
+    if content_length > INGEST_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Graph is larger than the limit of {INGEST_MAX_BYTES} bytes for an ingested graph.")
+    try:
+        return await ingest_graph(graph_id, request.stream(), allow_islands=allow_islands)
+    except GraphValidationError as e:
+        raise HTTPException(status_code=400, detail=e.violations)
+    except GraphTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PyMongoError as e:
+        raise HTTPException(status_code=503, detail=f"Graph could not be stored: {e}")
+
 @router.get("/graphs/{graph_id}")
 async def get_graph_by_id(graph_id: str):
     """
     route to get a existing graph based on graph_id
+    the stored document is sent as it is, without building and encoding the Graph class
     """
-    graph = await get_graph(graph_id)
-    if not graph:
+    graph_data = await get_graph_data(graph_id)
+    if not graph_data:
+        raise HTTPException(status_code=404, detail="Graph not found")
+    return FastJSONResponse(graph_data)
+
+@router.get("/graphs/{graph_id}/binary")
+async def get_graph_binary_by_id(graph_id: str):
+    """
+    route to get a existing graph in its compact binary format (application/x-msgpack), see pack_graph
+    """
+    graph_data = await get_graph_data(graph_id)
+    if not graph_data:
         raise HTTPException(status_code=404, detail="Graph not found")
+    try:
+        return Response(content=pack_graph(graph_data), media_type=MSGPACK_MEDIA_TYPE)
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Binary graphs need the msgpack package")
+
+@router.get("/graphs/{graph_id}/islands")
+async def get_islands_by_id(graph_id: str, node_id: Optional[str] = None):
+    """
+    route to get islands of a graph, or the island of a node if node_id is given
+    islands are read from the tracker persisted alongside the graph, without traversing it
+    """
+    tracker = await get_graph_islands(graph_id)
+    if not tracker:
+        raise HTTPException(status_code=404, detail="Graph not found")
+    if node_id is None:
+        return {"island_count": tracker.island_count, "islands": tracker.islands()}
+    if node_id not in tracker.parent:
+        raise HTTPException(status_code=404, detail="Node not found")
+    return {"island_count": tracker.island_count, "node_id": node_id, "island": tracker.island_of(node_id)}
+
+@router.get("/graphs/{graph_id}/runs")
+async def get_graph_runs(
+    graph_id: str, before: Optional[datetime] = None, before_id: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    route to list runs of a graph, newest first and without node outputs
+    pass next_before and next_before_id of a page as before and before_id to get the next one, they are None on the last page
+    """
+    runs = await list_graph_runs(graph_id, before=before, before_id=before_id, limit=limit)
+    last = runs[-1] if len(runs) == limit else None
+    return {
+        "graph_id": graph_id,
+        "runs": runs,
+        "next_before": last and last.created_at,
+        "next_before_id": last and last.run_id,
+    }
+
+@router.get("/graphs/{graph_id}/versions")
+async def get_graph_versions(
+    graph_id: str, before: Optional[datetime] = None, before_id: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    route to list the version history of a graph, newest first
+    every create, update and patch saves an immutable version identified by the content hash of the graph
+    pass next_before and next_before_id of a page as before and before_id to get the next one, they are None on the last page
+    """
+    versions = await list_graph_versions(graph_id, before=before, before_id=before_id, limit=limit)
+    last = versions[-1] if len(versions) == limit else None
+    return {
+        "graph_id": graph_id,
+        "versions": versions,
+        "next_before": last and last["created_at"],
+        "next_before_id": last and last["version_hash"],
+    }
+
+@router.get("/graphs/{graph_id}/versions/{version_hash}")
+async def get_graph_by_version(graph_id: str, version_hash: str):
+    """
+    route to get a graph as it was at a version
+    """
+    graph = await get_graph_version(graph_id, version_hash)
+    if not graph:
+        raise HTTPException(status_code=404, detail="Graph version not found")
     return graph
 
 @router.put("/graphs/{graph_id}")
 async def update_graph_by_id(graph_id: str, graph_update: Graph):
     """
     Route to update data in an existing graph based on updated graph data and graph_id
+    409 is returned while a patch of the graph is being written
     """
     update_data = graph_update.dict(exclude_unset=True)
-    success = await update_graph(graph_id, update_data)
+    try:
+        success = await update_graph(graph_id, update_data)
+    except GraphConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not success:
         raise HTTPException(status_code=404, detail="Graph not found or update failed")
     return {"message": "Graph updated successfully"}
 
+@router.patch("/graphs/{graph_id}")
+async def patch_graph_by_id(graph_id: str, patch: GraphPatch):
+    """
+    Route to add, remove or modify nodes and edges of an existing graph without sending the whole graph
+    Only the nodes and edges touched by the patch are validated, a failing patch is not applied
+    409 is returned when another request changed the graph in the meantime, the patch can be retried as is
+    """
+    try:
+        tracker = await patch_graph(graph_id, patch)
+    except GraphValidationError as e:
+        raise HTTPException(status_code=400, detail=e.violations)
+    except GraphConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not tracker:
+        raise HTTPException(status_code=404, detail="Graph not found")
+    return {"message": "Graph patched successfully", "island_count": tracker.island_count}
+
 @router.delete("/graphs/{graph_id}")
 async def delete_graph_by_id(graph_id: str):
     """
@@ -1,32 +1,247 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from app.models import RunConfig, RunOutput
-from app.utils.graph_operations import run_graph
-from app.utils.api import get_graph, get_run_output, save_run_output
+from app.utils.graph_operations import run_compiled_batch, iter_compiled_run, get_run_leaves, record_run_metrics
+from app.utils.api import (
+    get_compiled_graph, get_run_output, save_run_output, save_run_outputs, get_node_output, list_leaf_outputs,
+    get_cached_run_result, get_cached_run_results, save_cached_run_results,
+)
+from app.utils.cache import run_cache_key
+from app.utils.validator import generate_unique_run_id
+from app.utils.jobs import run_job_queue, JobQueueFull, QUEUED, DONE
+from app.utils.validator import GraphValidationError
+from app.utils.serializers import run_output_to_dict
+from app.utils.responses import FastJSONResponse
+from app.utils.metrics import timed
 
 router = APIRouter()
 
+def to_milliseconds(timings: dict) -> dict:
+    """ timing breakdown as sent in responses """
+    return {phase: round(seconds * 1000, 3) for phase, seconds in timings.items()}
+
+async def reuse_run_result(compiled: dict, graph_id: str, cached: dict, fresh_run_id: bool) -> dict:
+    """ result of a cached run, saved again under a new run_id when fresh_run_id is set """
+    if not fresh_run_id:
+        return cached
+    result = dict(cached, run_id=generate_unique_run_id())
+    await save_run_output(
+        RunOutput(run_id=result["run_id"], graph_id=graph_id, version_hash=compiled.get("version_hash"), node_outputs=result["outputs"]),
+        leaves=result["leaves"],
+    )
+    return result
+
 @router.post("/run")
-async def execute_graph_run(config: RunConfig, graph_id: str):
+async def execute_graph_run(
+    config: RunConfig, graph_id: str, response: Response, wait: bool = False, use_cache: bool = True, fresh_run_id: bool = False,
+    timings: bool = False,
+):
     """
     run graph based on config provided in body and graph_id to get graph from db
+    compiled graph comes from the in-process cache when the graph was run recently
+    the run is queued on a process pool and 202 is returned with the run_id, its status and outputs are at /runs/{run_id}
+    with wait=true the response waits for the run and has its outputs, like a synchronous run
+    level_map in the response only has the executed nodes, i.e. without the ones pruned by enable/disable list
+    if the same version of the graph already ran with an equivalent config its result is returned right away with cached=true,
+    under the run_id of that run or under a new one with fresh_run_id=true, use_cache=false always runs the graph
+    with timings=true the response has the milliseconds spent in each phase, of the run itself only when it waited for it
+    """
+    breakdown = {}
+    try:
+        with timed(breakdown, "load"):
+            compiled = await get_compiled_graph(graph_id)
+    except GraphValidationError as e:
+        raise HTTPException(status_code=400, detail=e.violations)
+    if not compiled:
+        raise HTTPException(status_code=404, detail="Graph not found")
+
+    with timed(breakdown, "cache"):
+        cached = await get_cached_run_result(compiled, config) if use_cache else None
+    if cached:
+        result = await reuse_run_result(compiled, graph_id, cached, fresh_run_id)
+        content = {"run_id": result["run_id"], "status": DONE, "cached": True, "outputs": result["outputs"], "level_map": result["level_map"]}
+    else:
+        try:
+            with timed(breakdown, "submit"):
+                run_id, future = await run_job_queue.submit(compiled, config, graph_id, wait=wait)
+        except JobQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+        if not wait:
+            response.status_code = 202
+            content = {"run_id": run_id, "status": QUEUED}
+        else:
+            try:
+                results = await future
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+            breakdown.update(results["timings"])
+            content = {"run_id": run_id, "cached": False, "outputs": results["outputs"], "level_map": results["level_map"]}
+
+    if timings:
+        content["timings"] = to_milliseconds(breakdown)
+    return content
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def format_record(record: dict, format: str) -> str:
+    """ encode one streamed record as a line of NDJSON or as a server-sent event """
+    data = json.dumps(record)
+    if format == "sse":
+        return f"event: {record['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+@router.post("/run/stream")
+async def execute_graph_run_stream(config: RunConfig, graph_id: str, format: str = "ndjson", by: str = "level"):
+    """
+    run graph and stream results as soon as they are computed, as NDJSON (format=ndjson) or server-sent events (format=sse)
+    a record is sent for each completed level (by=level) or for each node (by=node), followed by a summary record
+    with run_id and level_map, the run output is saved once the stream is done
+    """
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {list(STREAM_MEDIA_TYPES)}")
+    if by not in ("level", "node"):
+        raise HTTPException(status_code=400, detail="by must be level or node")
+    try:
+        compiled = await get_compiled_graph(graph_id)
+    except GraphValidationError as e:
+        raise HTTPException(status_code=400, detail=e.violations)
+    if not compiled:
+        raise HTTPException(status_code=404, detail="Graph not found")
+
+    run_id = generate_unique_run_id()
+
+    async def stream():
+        node_outputs = {}
+        level_map = {}
+        try:
+            # levels are computed in a worker thread, each one is sent before the next is started
+            async for level, outputs in iterate_in_threadpool(iter_compiled_run(compiled, config)):
+                node_outputs.update(outputs)
+                level_map[level] = [id for id in compiled["level_map"][level] if id in outputs]
+                if by == "level":
+                    yield format_record({"type": "level", "level": level, "outputs": outputs}, format)
+                else:
+                    for id, data_out in outputs.items():
+                        yield format_record({"type": "node", "level": level, "node_id": id, "data_out": data_out}, format)
+        except Exception as e:
+            yield format_record({"type": "error", "run_id": run_id, "detail": str(e)}, format)
+            return
+
+        await save_run_output(
+            RunOutput(run_id=run_id, graph_id=graph_id, version_hash=compiled.get("version_hash"), node_outputs=node_outputs),
+            leaves=get_run_leaves(compiled, node_outputs),
+        )
+        yield format_record(
+            {"type": "summary", "run_id": run_id, "graph_id": graph_id, "node_count": len(node_outputs), "level_map": level_map},
+            format,
+        )
+
+    return StreamingResponse(stream(), media_type=STREAM_MEDIA_TYPES[format])
+
+@router.post("/run/batch")
+async def execute_graph_run_batch(
+    configs: List[RunConfig], graph_id: str, use_cache: bool = True, fresh_run_id: bool = False, timings: bool = False
+):
     """
-    graph = await get_graph(graph_id)
-    if not graph:
+    run graph once for each config provided in body, e.g. for parameter sweeps
+    graph is loaded, validated and compiled once for the whole batch, and all run outputs are saved with one bulk write
+    configs with a cached result are not run again, see /run for use_cache and fresh_run_id, the cache is read and written
+    with one query and one bulk write for the whole batch
+    equivalent configs missing from the cache run once, the others reuse that result like a cached one
+    with timings=true the response has the milliseconds spent in each phase of the batch and of each run
+    """
+    breakdown = {}
+    try:
+        with timed(breakdown, "load"):
+            compiled = await get_compiled_graph(graph_id)
+    except GraphValidationError as e:
+        raise HTTPException(status_code=400, detail=e.violations)
+    if not compiled:
         raise HTTPException(status_code=404, detail="Graph not found")
-    
-    results = await run_graph(graph, config)
-    run_output = RunOutput(run_id=results["run_id"], graph_id=graph_id, node_outputs=results["outputs"])
-    
-    # Save run_output in DB and return the result
-    await save_run_output(run_output)
-    return {"run_id": run_output.run_id, "outputs": run_output.node_outputs}
+
+    with timed(breakdown, "cache"):
+        cached = await get_cached_run_results(compiled, configs) if use_cache else [None] * len(configs)
+    # configs which run the same way share a key, without the cache every config is run
+    keys = [run_cache_key(compiled.get("version_hash"), config) for config in configs] if use_cache else range(len(configs))
+    misses = {}
+    for key, config, result in zip(keys, configs, cached):
+        if not result:
+            misses.setdefault(key, config)
+    with timed(breakdown, "run"):
+        results = await run_compiled_batch(compiled, list(misses.values()))
+    computed = dict(zip(misses, results))
+    for result in results:
+        record_run_metrics(result)
+
+    runs = []
+    saved = list(results)  # reused results get saved again alongside the new ones when fresh_run_id is set
+    returned = set()
+    for key, result in zip(keys, cached):
+        if result:
+            hit = True
+        elif key in returned:
+            result, hit = computed[key], True
+        else:
+            returned.add(key)
+            result, hit = computed[key], False
+        if hit and fresh_run_id:
+            result = dict(result, run_id=generate_unique_run_id())
+            saved.append(result)
+        run = {"run_id": result["run_id"], "cached": hit, "outputs": result["outputs"], "level_map": result["level_map"]}
+        if timings and not hit:
+            run["timings"] = to_milliseconds(result["timings"])
+        runs.append(run)
+
+    with timed(breakdown, "save"):
+        await save_run_outputs(
+            [
+                RunOutput(
+                    run_id=result["run_id"], graph_id=graph_id, version_hash=compiled.get("version_hash"), node_outputs=result["outputs"]
+                )
+                for result in saved
+            ],
+            leaves=[result["leaves"] for result in saved],
+        )
+        await save_cached_run_results(compiled, list(misses.values()), results)
+    content = {"graph_id": graph_id, "runs": runs}
+    if timings:
+        content["timings"] = to_milliseconds(breakdown)
+    return content
 
 @router.get("/runs/{run_id}")
-async def get_run(run_id: str):
+async def get_run(run_id: str, include_outputs: bool = True):
     """
-    get run entity based on run_id
+    get run entity based on run_id, status is queued/running/done/failed for runs in the job queue
+    with include_outputs=false only the run itself is read, without outputs of its nodes
     """
-    run_output = await get_run_output(run_id)
+    run_output = await get_run_output(run_id, include_outputs=include_outputs)
     if not run_output:
         raise HTTPException(status_code=404, detail="Run output not found")
-    return run_output
+    return FastJSONResponse(run_output_to_dict(run_output))
+
+@router.get("/runs/{run_id}/nodes/{node_id}")
+async def get_run_node(run_id: str, node_id: str):
+    """
+    get output of a single node of a run, without reading outputs of the other nodes
+    """
+    node_output = await get_node_output(run_id, node_id)
+    if not node_output:
+        raise HTTPException(status_code=404, detail="Node output not found")
+    return node_output
+
+@router.get("/runs/{run_id}/leaves")
+async def get_run_leaves_outputs(run_id: str, after: Optional[str] = None, limit: int = Query(100, ge=1, le=1000)):
+    """
+    get outputs of the leaves of a run ordered by node_id, a page at a time
+    pass next_after of a page as after to get the next one, next_after is None on the last page
+    """
+    leaves = await list_leaf_outputs(run_id, after=after, limit=limit)
+    return {
+        "run_id": run_id,
+        "leaves": leaves,
+        "next_after": leaves[-1]["node_id"] if len(leaves) == limit else None,
+    }
@@ -1,7 +1,7 @@
 import asyncio
 from app.models import Graph, Node, Edge
 from app.utils.api import create_graph
-from app.utils.database import db  # Import the db instance to initiate a connection
+from app.utils.database import db, connect, close
 
 async def setup_sample_data():
     """
@@ -23,6 +23,8 @@ async def setup_sample_data():
     print(f"Inserted sample graph with id: {graph_id}")
 
 async def main():
+    await connect()
+
     # Dropping existing data if needed for clean setup
     await db["graphs"].drop()
     print("Dropped existing data from graphs collection.")
@@ -30,6 +32,7 @@ async def main():
     # Populate the database with sample data
     await setup_sample_data()
     print("Database setup complete with sample data.")
+    close()
 
 if __name__ == "__main__":
     asyncio.run(main())
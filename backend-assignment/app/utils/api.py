@@ -1,8 +1,135 @@
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
-from app.models import Graph, RunOutput
-from app.utils.serializers import serialize_graph, deserialize_graph, serialize_run_output, deserialize_run_output
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import List
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError, DocumentTooLarge
+from app.models import Graph, GraphPatch, RunOutput
+from app.utils.serializers import (
+    serialize_graph, deserialize_graph, graph_document_to_dict, serialize_run_output, serialize_node_outputs, deserialize_run_output,
+)
 from app.utils.database import db
+from app.utils.connectivity import IslandTracker
+from app.utils.cache import compiled_graph_cache, run_result_cache, run_cache_key
+from app.utils.graph_operations import compile_graph
+from app.utils.graph_patch import PatchedGraph, get_patch_violations, get_patched_islands, get_patch_operations
+from app.utils.validator import GraphValidationError
+from app.utils.metrics import registry
+from app.utils.versions import build_manifest, hash_manifest, patch_manifest, assemble_graph, hash_block
+from app.utils.ingest import GraphIngest, GraphTooLargeError, iter_lines
+
+# node output documents written per bulk write
+NODE_OUTPUT_BATCH = 1000
+# node and edge records pushed per update while ingesting a graph
+INGEST_BATCH = int(os.getenv("INGEST_BATCH", 1000))
+# an ingestion which did not finish within this many seconds is left over from a crashed worker and is dropped
+INGEST_STALE_AFTER = int(os.getenv("INGEST_STALE_AFTER", 3600))
+# a patch which did not finish within this many seconds is left over from a crashed worker and no longer holds the graph
+PATCH_STALE_AFTER = int(os.getenv("PATCH_STALE_AFTER", 60))
+# compiled graphs checked against the stored version within this many seconds are served without reading the graph
+GRAPH_CACHE_CHECK_AFTER = float(os.getenv("GRAPH_CACHE_CHECK_AFTER", 1))
+# server error codes of a document over the size limit, when inserted and when grown by an update
+DOCUMENT_TOO_LARGE_CODES = (10334, 17419)
+
+
+class GraphConflictError(Exception):
+    """ Raised when a graph was changed by another request since it was read """
+
+
+# All queries build their filters with these helpers, so documents are always matched on their indexed keys
+def graph_key(graph_id: str) -> dict:
+    """ graphs are stored with their id as _id, see serialize_graph, graphs still being ingested are not matched """
+    return {"_id": str(graph_id), "ingest": {"$exists": False}}
+
+def run_key(run_id: str) -> dict:
+    return {"run_id": str(run_id)}
+
+def node_output_key(run_id: str, node_id: str) -> dict:
+    return {"run_id": str(run_id), "node_id": str(node_id)}
+
+def before_key(before: datetime, before_id: str, id_field: str) -> dict:
+    """
+    filter of the documents after the cursor (before, before_id) in newest first order, sorted on (created_at, id_field)
+    documents created at the same time are told apart by id_field, so none are skipped or repeated across pages
+    """
+    if before is None:
+        return {}
+    if before_id is None:
+        return {"created_at": {"$lt": before}}
+    return {"$or": [{"created_at": {"$lt": before}}, {"created_at": before, id_field: {"$lt": str(before_id)}}]}
+
+
+async def ensure_indexes():
+    """
+    Create the indexes every query relies on, called at startup
+    create_index is a no-op for indexes which already exist
+    """
+    await db["run_outputs"].create_index([("run_id", ASCENDING)], unique=True)
+    await db["run_outputs"].create_index([("graph_id", ASCENDING), ("created_at", DESCENDING), ("run_id", DESCENDING)])
+    await db["run_node_outputs"].create_index([("run_id", ASCENDING), ("node_id", ASCENDING)], unique=True)
+    await db["run_node_outputs"].create_index([("run_id", ASCENDING), ("leaf", ASCENDING), ("node_id", ASCENDING)])
+    await db["graph_versions"].create_index([("graph_id", ASCENDING), ("created_at", DESCENDING), ("version_hash", DESCENDING)])
+    # the server drops run results once their expires_at has passed, set from the ttl of the run result cache when saved
+    # so the ttl can be changed without rebuilding the index
+    await db["run_results"].create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    if "created_at_1" in await db["run_results"].index_information():
+        # left over from when run results expired a fixed time after created_at
+        await db["run_results"].drop_index("created_at_1")
+
+
+async def save_version_content(manifest: dict, blocks: dict) -> str:
+    """
+    Save the content of an immutable version of a graph and return its version hash
+    Blocks and manifests are keyed by their content hash, so each is stored once however many graphs or versions share it
+    The version only shows up in the history of the graph once append_graph_version is called after the graph is written
+    """
+    version_hash = hash_manifest(manifest)
+    await save_blocks(blocks)
+    await db["graph_manifests"].update_one({"_id": version_hash}, {"$setOnInsert": manifest}, upsert=True)
+    return version_hash
+
+async def append_graph_version(graph_id: str, version_hash: str, parent_hash: str = None):
+    """
+    Add a version to the history of a graph, called once the graph itself holds the version
+    so a failed or conflicting write never leaves an entry behind, a save which changes nothing adds no entry
+    """
+    if version_hash != parent_hash:
+        await db["graph_versions"].insert_one({
+            "graph_id": str(graph_id),
+            "version_hash": version_hash,
+            "parent_hash": parent_hash,
+            "created_at": datetime.now(timezone.utc),
+        })
+
+async def save_blocks(blocks: dict):
+    """ Save node/edge blocks keyed by their content hash, blocks which already exist are left as they are """
+    if blocks:
+        await db["graph_blocks"].bulk_write(
+            [UpdateOne({"_id": block_hash}, {"$setOnInsert": block}, upsert=True) for block_hash, block in blocks.items()],
+            ordered=False,
+        )
+
+async def get_manifest(version_hash: str):
+    return await db["graph_manifests"].find_one({"_id": version_hash}, {"_id": 0})
+
+async def get_graph_version(graph_id: str, version_hash: str):
+    """ Get a graph as it was at a version, None if the graph never had that version """
+    if not await db["graph_versions"].find_one({"graph_id": str(graph_id), "version_hash": version_hash}, {"_id": 1}):
+        return None
+    manifest = await get_manifest(version_hash)
+    hashes = list({block_hash for kind in ("nodes", "edges") for _, block_hash in manifest[kind]})
+    blocks = {block["_id"]: block async for block in db["graph_blocks"].find({"_id": {"$in": hashes}})}
+    return assemble_graph(graph_id, manifest, blocks)
+
+async def list_graph_versions(graph_id: str, before: datetime = None, before_id: str = None, limit: int = 100):
+    """
+    Version history of a graph, newest first, a page at a time
+    Pages continue after (created_at, version_hash) of the last version of the previous page, see before_key
+    """
+    query = {"graph_id": str(graph_id), **before_key(before, before_id, "version_hash")}
+    cursor = db["graph_versions"].find(query, {"_id": 0}).sort([("created_at", DESCENDING), ("version_hash", DESCENDING)]).limit(limit)
+    return [version async for version in cursor]
 
 
 async def create_graph(graph: Graph):
@@ -11,38 +138,406 @@ async def create_graph(graph: Graph):
     Inserting is done, assuming graph body will be deserialized version, we will store serialize verion in DB
     Because we are using MongoDB as database, JSON are better choice to store in DB
     """
-    result = await db["graphs"].insert_one(serialize_graph(graph))
+    graph_data = serialize_graph(graph)
+    manifest, blocks = build_manifest(graph_data["nodes"], graph_data["edges"])
+    graph_data["version_hash"] = await save_version_content(manifest, blocks)
+    result = await db["graphs"].insert_one(graph_data)
+    await append_graph_version(graph.id, graph_data["version_hash"])
     return result.inserted_id
 
+async def ingest_graph(graph_id: str, chunks, allow_islands: bool = False) -> dict:
+    """
+    Create a graph from a NDJSON stream of node and edge records without holding the graph in memory, see GraphIngest
+    Records are validated as they arrive and pushed to the graph document INGEST_BATCH at a time, together with their
+    version blocks. The document is hidden from every other query until the cycle and island checks pass at the end
+    of the stream, a failing ingestion removes it again.
+
+    Raises:
+        GraphValidationError: if the graph exists or any record, cycle or island check fails
+        GraphTooLargeError: if the graph does not fit into one document, see INGEST_MAX_BYTES
+    """
+    ingest_id = str(uuid.uuid4())
+    key = {"_id": str(graph_id), "ingest": ingest_id}
+    now = datetime.now(timezone.utc)
+    await db["graphs"].delete_one({"_id": str(graph_id), "ingest_started_at": {"$lt": now - timedelta(seconds=INGEST_STALE_AFTER)}})
+    try:
+        await db["graphs"].insert_one({"_id": str(graph_id), "nodes": [], "edges": [], "ingest": ingest_id, "ingest_started_at": now})
+    except DuplicateKeyError:
+        raise GraphValidationError([f"Graph {graph_id} already exists."])
+
+    ingest = GraphIngest()
+    manifest = {"nodes": [], "edges": []}
+    batch = {"nodes": [], "edges": []}
+    blocks = {}
+
+    async def flush():
+        push = {kind: {"$each": documents} for kind, documents in batch.items() if documents}
+        if push:
+            await save_blocks(blocks)
+            await db["graphs"].update_one(key, {"$push": push})
+        batch["nodes"], batch["edges"] = [], []
+        blocks.clear()
+
+    try:
+        line_number = 0
+        async for line in iter_lines(chunks):
+            line_number += 1
+            if not line.strip():
+                continue
+            record = ingest.add_line(line_number, line)
+            if ingest.violations:
+                # nothing is written after the first violation, the rest of the stream is only checked
+                if ingest.done:
+                    break
+                continue
+            kind, data = record
+            block_hash = hash_block(kind, data)
+            blocks[block_hash] = {"kind": kind, "data": data}
+            manifest[f"{kind}s"].append([data["id"], block_hash])
+            batch[f"{kind}s"].append(data)
+            if len(batch["nodes"]) + len(batch["edges"]) >= INGEST_BATCH:
+                await flush()
+
+        if not ingest.violations:
+            ingest.check_structure(allow_islands)
+        if ingest.violations:
+            raise GraphValidationError(ingest.violations)
+        await flush()
+        version_hash = await save_version_content(manifest, {})
+        await db["graphs"].update_one(key, {
+            "$set": {"islands": ingest.islands, "version": 1, "version_hash": version_hash},
+            "$unset": {"ingest": "", "ingest_started_at": ""},
+        })
+    except Exception as e:
+        await db["graphs"].delete_one(key)
+        if isinstance(e, DocumentTooLarge) or getattr(e, "code", None) in DOCUMENT_TOO_LARGE_CODES:
+            # the estimate of GraphIngest was below the actual size of the document
+            raise GraphTooLargeError(f"Graph {graph_id} is too large to be stored as one document.") from e
+        raise
+    await append_graph_version(graph_id, version_hash)
+    return {
+        "graph_id": str(graph_id),
+        "node_count": len(ingest.node_ids),
+        "edge_count": len(ingest.edge_ids),
+        "island_count": ingest.islands["island_count"],
+        "version_hash": version_hash,
+    }
+
 async def get_graph(graph_id: str):
     """
     Get a existing graph from DB based on graph_id
     It will return a deserialized version of graph
     """
-    graph_data = await db["graphs"].find_one({"_id": graph_id})
+    graph_data = await db["graphs"].find_one(graph_key(graph_id))
     return deserialize_graph(graph_data) if graph_data else None
 
+async def get_graph_data(graph_id: str):
+    """
+    Get a existing graph from DB as a plain dictionary, for responses which do not need the Graph class
+    """
+    graph_data = await db["graphs"].find_one(graph_key(graph_id), {"nodes": 1, "edges": 1})
+    return graph_document_to_dict(graph_data) if graph_data else None
+
+async def get_compiled_graph(graph_id: str):
+    """
+    Get a validated graph alongside its toposort and level map, see compile_graph
+    Hot graphs are served from the in-process cache without a database read. Entries are keyed by graph id and
+    checked against the version stored with the graph (a projection of one field on _id) once they are older than
+    GRAPH_CACHE_CHECK_AFTER seconds. Updates made through this worker invalidate the entry right away, updates made
+    through other workers are seen after at most GRAPH_CACHE_CHECK_AFTER seconds.
+    Raises GraphValidationError if the stored graph is invalid, invalid graphs are not cached
+    """
+    cached = compiled_graph_cache.get(graph_id)
+    if cached and compiled_graph_cache.age(graph_id) < GRAPH_CACHE_CHECK_AFTER:
+        return cached[1]
+    head = await db["graphs"].find_one(graph_key(graph_id), {"version": 1})
+    if not head:
+        compiled_graph_cache.invalidate(graph_id)
+        return None
+    if cached and cached[0] == head.get("version"):
+        compiled_graph_cache.put(graph_id, cached[0], cached[1])  # checked, served without a read again for a while
+        return cached[1]
+
+    graph_data = await db["graphs"].find_one(graph_key(graph_id))
+    if not graph_data:
+        return None
+    compiled = compile_graph(deserialize_graph(graph_data))
+    compiled["version_hash"] = graph_data.get("version_hash")  # runs of the compiled graph reference this exact version
+    compiled_graph_cache.put(graph_id, graph_data.get("version"), compiled)
+    return compiled
+
 async def update_graph(graph_id: str, update_data: dict) -> bool:
     """
     Update an existing graph based on graph_id and provided update_data
+    Islands stored with the graph are rebuilt and a new version is saved when nodes and edges are replaced
+    The version is added to the history after the graph is written, with the version the graph had right before as parent
+    Raises GraphConflictError if a patch holds the graph, a stale hold is cleared by the update
+    """
+    # the graph is matched on _id, its id is never rewritten by an update
+    update_data = {key: value for key, value in update_data.items() if key not in ("id", "_id")}
+    if "nodes" in update_data and "edges" in update_data:
+        update_data["islands"] = IslandTracker.from_edges(
+            [node["id"] for node in update_data["nodes"]],
+            [(edge["src_node"], edge["dst_node"]) for edge in update_data["edges"]],
+        ).to_dict()
+        manifest, blocks = build_manifest(update_data["nodes"], update_data["edges"])
+        update_data["version_hash"] = await save_version_content(manifest, blocks)
+    # the document as it was before the update, i.e. with the parent version
+    stale = datetime.now(timezone.utc) - timedelta(seconds=PATCH_STALE_AFTER)
+    previous = await db["graphs"].find_one_and_update(
+        {**graph_key(graph_id), "$or": [{"patch": {"$exists": False}}, {"patch_started_at": {"$lt": stale}}]},
+        {"$set": update_data, "$unset": {"patch": "", "patch_started_at": ""}, "$inc": {"version": 1}},
+        projection={"version_hash": 1},
+    )
+    compiled_graph_cache.invalidate(graph_id)
+    if not previous:
+        if await db["graphs"].find_one(graph_key(graph_id), {"_id": 1}):
+            raise GraphConflictError(f"Graph {graph_id} is being patched by another request, retry the update")
+        return False
+    if "version_hash" in update_data:
+        await append_graph_version(graph_id, update_data["version_hash"], previous.get("version_hash"))
+    return True
+
+async def patch_graph(graph_id: str, patch: GraphPatch):
+    """
+    Apply node/edge deltas to a graph, checking only the part of the graph the patch touches
+    A graph in the compiled graph cache is patched without reading its nodes and edges from the DB
+    Returns the persisted islands after the patch, or None if the graph does not exist
+    The patch holds the graph while it is written, only if its version is still the one the patch was checked against
+
+    Raises:
+        GraphValidationError: if the patch breaks data keys, adds a cycle or splits the graph into more islands
+        GraphConflictError: if the graph was changed or is being patched by another request
     """
-    result = await db["graphs"].update_one({"id": graph_id}, {"$set": update_data})
-    return result.modified_count > 0
+    cached = compiled_graph_cache.get(graph_id)
+    graph_data = await db["graphs"].find_one(graph_key(graph_id), {"islands": 1, "version": 1, "version_hash": 1}) if cached else None
+    if cached and graph_data and cached[0] == graph_data.get("version"):
+        compiled = cached[1]
+        graph, node_map, edge_map, edge_maps = compiled["graph"], compiled["node_map"], compiled["edge_map"], compiled["edge_maps"]
+    else:
+        graph_data = await db["graphs"].find_one(graph_key(graph_id))
+        if not graph_data:
+            return None
+        graph, node_map, edge_map, edge_maps = deserialize_graph(dict(graph_data)), None, None, None
+
+    view = PatchedGraph(graph, patch, node_map=node_map, edge_map=edge_map, edge_maps=edge_maps)
+    violations = get_patch_violations(view)
+    if violations:
+        raise GraphValidationError(violations)
+    islands = graph_data.get("islands") or IslandTracker.from_graph(graph).to_dict()
+    tracker = get_patched_islands(view, islands)
+    if tracker.island_count > max(islands["island_count"], 1):
+        raise GraphValidationError([f"Patch splits the graph into {tracker.island_count} islands."])
+
+    patch_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    claimed = await db["graphs"].update_one(
+        {
+            **graph_key(graph_id),
+            "version": graph_data.get("version"),
+            "$or": [{"patch": {"$exists": False}}, {"patch_started_at": {"$lt": now - timedelta(seconds=PATCH_STALE_AFTER)}}],
+        },
+        {"$set": {"patch": patch_id, "patch_started_at": now}},
+    )
+    if not claimed.matched_count:
+        raise GraphConflictError(f"Graph {graph_id} was changed by another request, read it again and retry the patch")
+
+    try:
+        # only the blocks touched by the patch are hashed and saved for the new version
+        parent_hash = graph_data.get("version_hash")
+        manifest = await get_manifest(parent_hash) if parent_hash else None
+        base_blocks = {}
+        if manifest is None:  # graph saved before versions, all its blocks are saved with the first version
+            manifest, base_blocks = build_manifest([node.model_dump() for node in graph.nodes], [edge.model_dump() for edge in graph.edges])
+        manifest, blocks = patch_manifest(manifest, view)
+        blocks.update((block_hash, base_blocks[block_hash]) for kind in ("nodes", "edges") for _, block_hash in manifest[kind] if block_hash in base_blocks)
+        version_hash = await save_version_content(manifest, blocks)
+
+        operations = get_patch_operations(graph_id, view, tracker, version_hash, patch_id)
+        result = await db["graphs"].bulk_write(operations, ordered=True)
+    except Exception:
+        await db["graphs"].update_one({"_id": str(graph_id), "patch": patch_id}, {"$unset": {"patch": "", "patch_started_at": ""}})
+        raise
+    finally:
+        compiled_graph_cache.invalidate(graph_id)
+    if result.matched_count < len(operations):
+        # the patch went stale and another request took the graph over while it was written
+        raise GraphConflictError(f"Graph {graph_id} was changed by another request while it was patched")
+    await append_graph_version(graph_id, version_hash, parent_hash)
+    return tracker
 
 async def delete_graph(graph_id: str) -> bool:
     """
     Delete an existing graph based on graph_id
     """
-    result = await db["graphs"].delete_one({"id": graph_id})
+    result = await db["graphs"].delete_one(graph_key(graph_id))
+    compiled_graph_cache.invalidate(graph_id)
     return result.deleted_count > 0
 
+async def get_graph_islands(graph_id: str):
+    """
+    Get the island tracker persisted alongside a graph, graphs stored without one get it built and saved
+    """
+    data = await db["graphs"].find_one(graph_key(graph_id), {"islands": 1})
+    if not data:
+        return None
+    if "islands" in data:
+        return IslandTracker.from_dict(data["islands"])
+
+    graph = await get_graph(graph_id)
+    tracker = IslandTracker.from_graph(graph)
+    await db["graphs"].update_one(graph_key(graph_id), {"$set": {"islands": tracker.to_dict()}})
+    return tracker
 
-async def save_run_output(run_output: RunOutput):
-    """ Saves RunOutput to the database """
+
+async def insert_node_outputs(documents: List[dict]):
+    """ Bulk writes node output documents, NODE_OUTPUT_BATCH at a time """
+    for i in range(0, len(documents), NODE_OUTPUT_BATCH):
+        await db["run_node_outputs"].insert_many(documents[i:i + NODE_OUTPUT_BATCH], ordered=False)
+
+async def save_node_outputs(run_id: str, node_outputs: dict, leaves=()):
+    """ Saves outputs of the nodes of a run, one document per node """
+    await insert_node_outputs(serialize_node_outputs(run_id, node_outputs, leaves))
+
+async def save_run_output(run_output: RunOutput, leaves=()):
+    """ Saves RunOutput to the database, node outputs go to run_node_outputs and leaves are flagged for listing """
     result = await db["run_outputs"].insert_one(serialize_run_output(run_output))
+    await save_node_outputs(run_output.run_id, run_output.node_outputs, leaves)
     return result.inserted_id
 
-async def get_run_output(run_id: str):
-    """ Retrieves a RunOutput from the database by run_id """
-    data = await db["run_outputs"].find_one({"run_id": run_id})
-    return deserialize_run_output(data) if data else None
+async def save_run_outputs(run_outputs: List[RunOutput], leaves: List[List[str]] = None):
+    """
+    Saves many RunOutputs with bulk writes, unordered so the server can insert them in parallel
+    leaves holds the leaves of each run, in the order of run_outputs
+    """
+    if not run_outputs:
+        return []
+    result = await db["run_outputs"].insert_many([serialize_run_output(run_output) for run_output in run_outputs], ordered=False)
+    await insert_node_outputs([
+        document
+        for run_output, run_leaves in zip(run_outputs, leaves or [()] * len(run_outputs))
+        for document in serialize_node_outputs(run_output.run_id, run_output.node_outputs, run_leaves)
+    ])
+    return result.inserted_ids
+
+async def update_run_output(run_id: str, update_data: dict):
+    """ Updates fields of a saved RunOutput, e.g. status of a queued run """
+    await db["run_outputs"].update_one(run_key(run_id), {"$set": update_data})
+
+async def get_run_output(run_id: str, include_outputs: bool = True):
+    """ Retrieves a RunOutput from the database by run_id, outputs of all its nodes are read only if include_outputs is set """
+    data = await db["run_outputs"].find_one(run_key(run_id))
+    if not data:
+        return None
+    if not include_outputs:
+        return deserialize_run_output(data, {})
+    if "node_outputs" in data:  # saved before node outputs were split into their own documents
+        return deserialize_run_output(data)
+    cursor = db["run_node_outputs"].find(run_key(run_id), {"_id": 0, "node_id": 1, "data_out": 1})
+    return deserialize_run_output(data, {document["node_id"]: document["data_out"] async for document in cursor})
+
+async def get_node_output(run_id: str, node_id: str):
+    """ Retrieves the output of one node of a run, only that node's document is read """
+    return await db["run_node_outputs"].find_one(
+        node_output_key(run_id, node_id), {"_id": 0, "node_id": 1, "leaf": 1, "data_out": 1}
+    )
+
+async def list_leaf_outputs(run_id: str, after: str = None, limit: int = 100):
+    """
+    Retrieves outputs of the leaves of a run ordered by node_id, a page at a time
+    Pages continue after the node_id of the last leaf of the previous page, so no documents are skipped over
+    """
+    query = {**run_key(run_id), "leaf": True}
+    if after is not None:
+        query["node_id"] = {"$gt": after}
+    cursor = db["run_node_outputs"].find(query, {"_id": 0, "node_id": 1, "data_out": 1}).sort("node_id", 1).limit(limit)
+    return [document async for document in cursor]
+
+async def list_graph_runs(graph_id: str, before: datetime = None, before_id: str = None, limit: int = 100):
+    """
+    Retrieves runs of a graph, newest first, a page at a time and without node outputs
+    Served by the (graph_id, created_at, run_id) index, pages continue after (created_at, run_id) of the last run of the previous page
+    """
+    query = {"graph_id": str(graph_id), **before_key(before, before_id, "run_id")}
+    cursor = db["run_outputs"].find(query, {"_id": 0}).sort([("created_at", DESCENDING), ("run_id", DESCENDING)]).limit(limit)
+    return [deserialize_run_output(data, {}) async for data in cursor]
+
+
+async def get_cached_run_result(compiled: dict, config) -> dict:
+    """ Result of an earlier run of the same graph version with an equivalent config, or None, see get_cached_run_results """
+    return (await get_cached_run_results(compiled, [config]))[0]
+
+async def get_cached_run_results(compiled: dict, configs: list) -> list:
+    """
+    Results of earlier runs of the same graph version with equivalent configs, in the order of configs (None if missing)
+    Looked up in the in-process cache first, the rest with one query on run_results and one on the node outputs of
+    the runs found there, whose hits are put in the in-process cache
+    Graphs saved before versions have no version_hash and are never cached
+    """
+    version_hash = compiled.get("version_hash")
+    if not version_hash:
+        return [None] * len(configs)
+    keys = [run_cache_key(version_hash, config) for config in configs]
+    lookups = registry.counter("run_cache_lookups_total", "Run result cache lookups by tier and result", labels=("tier", "result"))
+    results, missing = {}, []
+    for key in dict.fromkeys(keys):
+        cached = run_result_cache.get(key)
+        if cached:
+            lookups.inc(tier="memory", result="hit")
+            results[key] = cached[1]
+        else:
+            missing.append(key)
+    if not missing:
+        return [results.get(key) for key in keys]
+
+    # the server removes expired results only once a minute
+    cursor = db["run_results"].find({"_id": {"$in": missing}, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+    found = {data["run_id"]: data async for data in cursor}
+    # outputs are not copied into run_results, they are read from the node outputs of the cached runs
+    documents = defaultdict(list)
+    if found:
+        cursor = db["run_node_outputs"].find(
+            {"run_id": {"$in": list(found)}}, {"_id": 0, "run_id": 1, "node_id": 1, "leaf": 1, "data_out": 1}
+        )
+        async for document in cursor:
+            documents[document["run_id"]].append(document)
+    hits = 0
+    for run_id, data in found.items():
+        if len(documents[run_id]) != data["node_count"]:
+            continue
+        result = {
+            "run_id": run_id,
+            "outputs": {document["node_id"]: document["data_out"] for document in documents[run_id]},
+            "level_map": data["level_map"],
+            "leaves": [document["node_id"] for document in documents[run_id] if document.get("leaf")],
+        }
+        run_result_cache.put(data["_id"], version_hash, result)
+        results[data["_id"]] = result
+        hits += 1
+    lookups.inc(hits, tier="mongo", result="hit")
+    lookups.inc(len(missing) - hits, tier="mongo", result="miss")
+    return [results.get(key) for key in keys]
+
+async def save_cached_run_result(compiled: dict, config, result: dict):
+    """ Cache the result of a finished run, its node outputs must already be saved under its run_id """
+    await save_cached_run_results(compiled, [config], [result])
+
+async def save_cached_run_results(compiled: dict, configs: list, results: List[dict]):
+    """ Cache the results of finished runs with one bulk write, in the order of configs, their node outputs must already be saved """
+    version_hash = compiled.get("version_hash")
+    if not version_hash or not configs:
+        return
+    now = datetime.now(timezone.utc)
+    operations = []
+    for config, result in zip(configs, results):
+        key = run_cache_key(version_hash, config)
+        run_result_cache.put(key, version_hash, result)
+        operations.append(ReplaceOne({"_id": key}, {
+            "run_id": result["run_id"],
+            "version_hash": version_hash,
+            "node_count": len(result["outputs"]),
+            "level_map": {str(level): ids for level, ids in result["level_map"].items()},
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=run_result_cache.ttl),
+        }, upsert=True))
+    await db["run_results"].bulk_write(operations, ordered=False)
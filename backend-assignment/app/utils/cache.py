@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    In-process least recently used cache with a size limit and a time to live for entries
+    Entries are stored alongside a version, so callers can tell which version of an object they got
+    """
+    def __init__(self, max_size: int = 128, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expiry time, version, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """ Returns (version, value) of a live entry, or None """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, version, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return version, value
+
+    def put(self, key, version, value):
+        self.entries[key] = (time.monotonic() + self.ttl, version, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def age(self, key) -> float:
+        """ Seconds since the entry was put, infinite for a missing entry """
+        entry = self.entries.get(key)
+        return time.monotonic() - (entry[0] - self.ttl) if entry else float("inf")
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# compiled graphs (deserialized graph alongside its toposort and level map) keyed by graph_id
+compiled_graph_cache = LRUCache(
+    max_size=int(os.getenv("GRAPH_CACHE_SIZE", 128)),
+    ttl=float(os.getenv("GRAPH_CACHE_TTL", 300)),
+)
+
+
+def hash_run_config(config) -> str:
+    """
+    Canonical hash of a RunConfig, configs which run the same way get the same hash
+    Missing data_overwrites and empty lists count as not given, and enable/disable lists are sets, so they are sorted
+    """
+    normalized = {
+        "root_inputs": config.root_inputs,
+        "data_overwrites": config.data_overwrites or {},
+        "enable_list": sorted(set(config.enable_list or [])),
+        "disable_list": sorted(set(config.disable_list or [])),
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def run_cache_key(version_hash: str, config) -> str:
+    """ Key of a run result, a version of a graph run with a config always has the same outputs """
+    return f"{version_hash}:{hash_run_config(config)}"
+
+
+# results of runs (run_id, outputs, level map and leaves) keyed by run_cache_key, backed by the run_results collection
+run_result_cache = LRUCache(
+    max_size=int(os.getenv("RUN_CACHE_SIZE", 1024)),
+    ttl=float(os.getenv("RUN_CACHE_TTL", 3600)),
+)
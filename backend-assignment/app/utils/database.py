@@ -1,13 +1,199 @@
+import asyncio
+import inspect
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+import random
+import time
 from dotenv import load_dotenv
+from app.utils.metrics import registry
 
 # Load environment variables
 load_dotenv()
 
-# Get MongoDB URI from environment variable
-mongodb_uri = os.getenv("MONGO_URI")
-client = AsyncIOMotorClient(mongodb_uri)
+
+def get_settings() -> dict:
+    """
+    Connection settings from environment variables, everything but MONGO_URI has a default
+    """
+    return {
+        "uri": os.getenv("MONGO_URI"),
+        "db_name": os.getenv("MONGO_DB_NAME", "graph_db"),
+        "max_pool_size": int(os.getenv("MONGO_MAX_POOL_SIZE", 100)),
+        "min_pool_size": int(os.getenv("MONGO_MIN_POOL_SIZE", 10)),
+        "max_idle_time_ms": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000)),
+        "connect_timeout_ms": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        "server_selection_timeout_ms": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        "socket_timeout_ms": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+        # comma separated list out of zstd, snappy and zlib, zstd and snappy need their python packages
+        "compressors": os.getenv("MONGO_COMPRESSORS", "zlib"),
+        # upper bound of a random delay before connecting, spreads out connections of workers restarted together
+        "connect_jitter_ms": int(os.getenv("MONGO_CONNECT_JITTER_MS", 0)),
+    }
+
+
+# client and database of this worker, set by connect when the app starts and cleared by close when it stops
+client = None
+database = None
+settings = get_settings()
+
+
+async def connect():
+    """
+    Create the Mongo client and warm up its pool, called from the lifespan of the app
+    min_pool_size connections are opened by concurrent pings, so the first requests do not pay for connecting
+    """
+    # imported here, so importing the app does not need a Mongo driver until it actually connects
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    global client, database
+    if settings["connect_jitter_ms"]:
+        await asyncio.sleep(random.uniform(0, settings["connect_jitter_ms"]) / 1000)
+
+    client = AsyncIOMotorClient(
+        settings["uri"],
+        maxPoolSize=settings["max_pool_size"],
+        minPoolSize=settings["min_pool_size"],
+        maxIdleTimeMS=settings["max_idle_time_ms"],
+        connectTimeoutMS=settings["connect_timeout_ms"],
+        serverSelectionTimeoutMS=settings["server_selection_timeout_ms"],
+        socketTimeoutMS=settings["socket_timeout_ms"],
+        compressors=settings["compressors"],
+    )
+    database = client[settings["db_name"]]
+    await asyncio.gather(*(database.command("ping") for _ in range(max(settings["min_pool_size"], 1))))
+    return database
+
+
+def close():
+    global client, database
+    if client is not None:
+        client.close()
+    client = None
+    database = None
+
+
+def get_db():
+    """
+    Raises:
+        RuntimeError: if the app has not connected yet, see connect
+    """
+    if database is None:
+        raise RuntimeError("Database is not connected")
+    return database
+
+
+async def get_pool_health() -> dict:
+    """ Health of the connection pool, for the readiness endpoint """
+    health = {
+        "connected": database is not None,
+        "max_pool_size": settings["max_pool_size"],
+        "min_pool_size": settings["min_pool_size"],
+    }
+    if database is None:
+        return health
+    start = time.perf_counter()
+    try:
+        await database.command("ping")
+    except Exception as e:
+        health.update(connected=False, error=str(e))
+        return health
+    health["ping_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return health
+
+
+def observe_operation(collection, operation, seconds):
+    registry.histogram(
+        "mongo_operation_seconds", "Latency of MongoDB operations", labels=("collection", "operation")
+    ).observe(seconds, collection=collection, operation=operation)
+
+
+class TimedCollection:
+    """
+    Wraps a collection to record the latency of every awaited call (find_one, insert_many, bulk_write, ...)
+    Cursors returned by find/aggregate are wrapped too, see TimedCursor
+    """
+    def __init__(self, collection, name):
+        self.collection = collection
+        self.name = name
+
+    def __getattr__(self, operation):
+        attr = getattr(self.collection, operation)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if inspect.isawaitable(result):
+                return self._timed(operation, result)
+            if operation in ("find", "aggregate"):
+                return TimedCursor(result, self.name, operation)
+            return result
+        return call
+
+    async def _timed(self, operation, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            observe_operation(self.name, operation, time.perf_counter() - start)
+
+
+class TimedCursor:
+    """
+    Wraps a cursor to record the time spent fetching its documents, by to_list or by iterating over it
+    Only the time waiting for the server is counted, not the time the caller spends on each document
+    A cursor whose iteration is stopped early is not recorded
+    """
+    def __init__(self, cursor, collection, operation):
+        self.cursor = cursor
+        self.collection = collection
+        self.operation = operation
+        self.elapsed = 0.0
+
+    def __getattr__(self, name):
+        attr = getattr(self.cursor, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # sort, limit, skip, ... return the cursor itself for chaining
+            return self if result is self.cursor else result
+        return call
+
+    async def to_list(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self.cursor.to_list(*args, **kwargs)
+        finally:
+            observe_operation(self.collection, self.operation, time.perf_counter() - start)
+
+    def __aiter__(self):
+        self.iterator = self.cursor.__aiter__()
+        return self
+
+    async def __anext__(self):
+        start = time.perf_counter()
+        try:
+            return await self.iterator.__anext__()
+        except StopAsyncIteration:
+            observe_operation(self.collection, self.operation, self.elapsed + time.perf_counter() - start)
+            raise
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+
+class DatabaseProxy:
+    """
+    Stands in for the database of this worker, so modules can import db before the app has connected
+    Collections record the latency of their operations when metrics are enabled, see TimedCollection
+    """
+    def __getitem__(self, name):
+        collection = get_db()[name]
+        return TimedCollection(collection, name) if registry.enabled else collection
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
 
 # Reference to the MongoDB database
-db = client["graph_db"]
\ No newline at end of file
+db = DatabaseProxy()
@@ -1,6 +1,35 @@
+import asyncio
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import List
 from app.models import Graph, RunConfig, RunOutput
 from app.utils.validator import validate_graph_structure, generate_unique_run_id
-from app.utils.graph_runner import toposort, overwrite_traversals
+from app.utils.graph_runner import toposort, overwrite_traversals, iter_level_traversals, get_edge_maps
+from app.utils.metrics import registry, timed, SIZE_BUCKETS
+
+# batches smaller than this run in the request process, a process pool only pays off for larger sweeps
+MIN_PARALLEL_BATCH = 64
+BATCH_WORKERS = os.cpu_count() or 1
+
+_process_pool = None
+
+
+def get_process_pool():
+    """ Process pool shared by batch runs, created on first use """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """ Shut down the batch process pool if it was created, called when the app stops """
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+    _process_pool = None
 
 
 async def run_graph(graph: Graph, config: RunConfig):
@@ -8,23 +37,153 @@ async def run_graph(graph: Graph, config: RunConfig):
     This is the function to traverse through the graph and return node_map
     The traversal methods are similar to algo assignment
     """
+    timings = {}
     # Validate graph and configuration
-    validate_graph_structure(graph)
+    with timed(timings, "validate"):
+        validate_graph_structure(graph)
     
     # generate run_id
     run_id = generate_unique_run_id()
     
     # call topological sort and store subsequent outputs
-    outputs = toposort(graph=graph)
+    with timed(timings, "toposort"):
+        outputs = toposort(graph=graph)
     execution_order = outputs[0]
     level_map = outputs[1]
     node_map = outputs[2]
     
     # overwrite traversal values based on config and overwrites
-    updated_outputs = overwrite_traversals(config=config, execution_order=execution_order, graph=graph, level_map=level_map, node_map=node_map)
+    with timed(timings, "traverse"):
+        updated_outputs = overwrite_traversals(config=config, execution_order=execution_order, graph=graph, level_map=level_map, node_map=node_map)
     updated_level_wise = updated_outputs[0]
     updated_node_map = updated_outputs[1]
     run_data = updated_outputs[2]
     
-    
-    return {"run_id": run_id, "outputs": run_data}
+    result = {"run_id": run_id, "outputs": run_data, "level_map": updated_level_wise, "timings": timings}
+    record_run_metrics(result)
+    return result
+
+
+def compile_graph(graph: Graph) -> dict:
+    """
+    Validate the graph and compute everything a run needs which does not depend on the config
+    (toposort, level map and edge maps), so it can be shared by many runs of the same graph
+    """
+    timings = {}
+    with timed(timings, "validate"):
+        validate_graph_structure(graph)
+    with timed(timings, "toposort"):
+        execution_order, level_map, node_map = toposort(graph=graph)
+    with timed(timings, "edge_maps"):
+        edge_map = {edge.id: edge for edge in graph.edges}
+        edge_maps = get_edge_maps(graph)
+    if registry.enabled:
+        registry.observe_phases(registry.histogram(
+            "graph_compile_phase_seconds", "Seconds spent in each phase of compiling a graph", labels=("phase",)
+        ), timings)
+        registry.histogram("graph_nodes", "Nodes of the graphs compiled", buckets=SIZE_BUCKETS).observe(len(graph.nodes))
+        registry.histogram("graph_edges", "Edges of the graphs compiled", buckets=SIZE_BUCKETS).observe(len(graph.edges))
+    return {
+        "graph": graph,
+        "execution_order": execution_order,
+        "level_map": level_map,
+        "node_map": node_map,
+        "edge_map": edge_map,
+        "edge_maps": edge_maps,
+        "timings": timings,
+    }
+
+
+def get_run_node_map(compiled: dict) -> dict:
+    """
+    Node map for one run of a compiled graph
+    Every run starts from the stored data_in of the nodes, so runs sharing a compiled graph do not see each other's inputs
+    """
+    return {
+        id: SimpleNamespace(id=id, data_in=dict(node.data_in), data_out=node.data_out)
+        for id, node in compiled["node_map"].items()
+    }
+
+
+def run_compiled(compiled: dict, config: RunConfig, run_id: str = None) -> dict:
+    """
+    Run a compiled graph with one config
+    The result has the timing breakdown of the run, it is recorded by the caller since this may run in a worker process
+    """
+    timings = {}
+    with timed(timings, "inputs"):
+        node_map = get_run_node_map(compiled)
+    with timed(timings, "traverse"):
+        updated_level_wise, _, run_data = overwrite_traversals(
+            graph=compiled["graph"],
+            config=config,
+            execution_order=compiled["execution_order"],
+            # overwrite_traversals looks up node ids in the level map, which adds keys to it
+            level_map=defaultdict(list, compiled["level_map"]),
+            node_map=node_map,
+            edge_maps=compiled["edge_maps"],
+        )
+    with timed(timings, "leaves"):
+        leaves = get_run_leaves(compiled, run_data)
+    return {
+        "run_id": run_id or generate_unique_run_id(),
+        "outputs": run_data,
+        "level_map": updated_level_wise,
+        "leaves": leaves,
+        "timings": timings,
+    }
+
+
+def record_run_metrics(result: dict):
+    """ Record the timing breakdown and the executed node count of a run in the metrics registry """
+    if not registry.enabled:
+        return
+    registry.observe_phases(registry.histogram(
+        "graph_run_phase_seconds", "Seconds spent in each phase of a graph run", labels=("phase",)
+    ), result["timings"])
+    registry.counter("graph_runs_total", "Graph runs executed").inc()
+    registry.histogram("graph_run_executed_nodes", "Nodes executed by each run", buckets=SIZE_BUCKETS).observe(len(result["outputs"]))
+
+
+def get_run_leaves(compiled: dict, outputs: dict) -> List[str]:
+    """ Leaves of the executed part of a graph, i.e. executed nodes without edges to other executed nodes """
+    edges_out = compiled["edge_maps"][1]
+    return [id for id in outputs if not any(edge.dst_node in outputs for edge in edges_out[id])]
+
+
+def iter_compiled_run(compiled: dict, config: RunConfig):
+    """
+    Run a compiled graph with one config, yielding (level, outputs) as soon as each level is computed
+    """
+    return iter_level_traversals(
+        graph=compiled["graph"],
+        config=config,
+        level_map=defaultdict(list, compiled["level_map"]),
+        node_map=get_run_node_map(compiled),
+        edge_maps=compiled["edge_maps"],
+    )
+
+
+def run_compiled_chunk(compiled: dict, configs: List[RunConfig]) -> List[dict]:
+    """ Run a chunk of configs in a worker process, the compiled graph is sent once per chunk """
+    return [run_compiled(compiled, config) for config in configs]
+
+
+async def run_compiled_batch(compiled: dict, configs: List[RunConfig]) -> List[dict]:
+    """
+    Run a compiled graph once for each config
+    Large batches are split into one chunk per worker and run in parallel on a process pool,
+    smaller ones run in a thread so the event loop keeps serving other requests
+    Results are in the order of configs
+    """
+    if len(configs) < MIN_PARALLEL_BATCH:
+        return await asyncio.to_thread(run_compiled_chunk, compiled, configs)
+
+    pool = get_process_pool()
+    chunk_size = -(-len(configs) // BATCH_WORKERS)
+    loop = asyncio.get_running_loop()
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(pool, run_compiled_chunk, compiled, configs[i:i + chunk_size])
+        for i in range(0, len(configs), chunk_size)
+    ))
+    return [result for chunk in chunks for result in chunk]
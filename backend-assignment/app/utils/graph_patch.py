@@ -0,0 +1,212 @@
+from collections import Counter, defaultdict
+from typing import List
+from pymongo import UpdateOne
+from app.models import Graph, GraphPatch
+from app.utils.connectivity import IslandTracker
+from app.utils.graph_runner import get_edge_maps
+
+
+class PatchedGraph:
+    """
+    View of a graph with a patch applied on top, the graph itself is left untouched (it may be shared by the cache)
+    Lookups go to the patch first and then to the graph, so nothing is copied and only touched nodes are visited
+    """
+    def __init__(self, graph: Graph, patch: GraphPatch, node_map: dict = None, edge_map: dict = None, edge_maps: tuple = None):
+        self.graph = graph
+        self.patch = patch
+        # lookups of a compiled graph are reused when given
+        self.node_map = node_map if node_map is not None else {node.id: node for node in graph.nodes}
+        self.edge_map = edge_map if edge_map is not None else {edge.id: edge for edge in graph.edges}
+        self.edges_in, self.edges_out = edge_maps or get_edge_maps(graph)
+
+        self.removed_nodes = set(patch.remove_nodes)
+        self.added_nodes = {node.id: node for node in patch.add_nodes}
+        self.updated_nodes = {update.id: update for update in patch.update_nodes}
+
+        # edges of removed nodes are removed alongside them
+        self.removed_edges = set(patch.remove_edges)
+        for id in self.removed_nodes:
+            self.removed_edges.update(edge.id for edge in self.edges_in.get(id, ()))
+            self.removed_edges.update(edge.id for edge in self.edges_out.get(id, ()))
+        self.added_edges = {edge.id: edge for edge in patch.add_edges}
+        self.updated_edges = {update.id: update for update in patch.update_edges}
+        self.added_in = defaultdict(list)
+        self.added_out = defaultdict(list)
+        for edge in patch.add_edges:
+            self.added_out[edge.src_node].append(edge)
+            self.added_in[edge.dst_node].append(edge)
+
+    def has_node(self, id) -> bool:
+        return id in self.added_nodes or (id in self.node_map and id not in self.removed_nodes)
+
+    def get_ports(self, id):
+        """ data_in and data_out of a node after the patch """
+        node = self.added_nodes.get(id) or self.node_map[id]
+        update = self.updated_nodes.get(id)
+        data_in = update.data_in if update and update.data_in is not None else node.data_in
+        data_out = update.data_out if update and update.data_out is not None else node.data_out
+        return data_in, data_out
+
+    def get_keys(self, edge):
+        update = self.updated_edges.get(edge.id)
+        return update.src_to_dst_data_keys if update else edge.src_to_dst_data_keys
+
+    def get_edges_out(self, id):
+        return [edge for edge in self.edges_out.get(id, ()) if edge.id not in self.removed_edges] + self.added_out.get(id, [])
+
+    def get_edges_in(self, id):
+        return [edge for edge in self.edges_in.get(id, ()) if edge.id not in self.removed_edges] + self.added_in.get(id, [])
+
+    def reaches(self, start, target) -> bool:
+        """ DFS along edges after the patch, only the part of the graph downstream of start is visited """
+        visited = {start}
+        stack = [start]
+        while stack:
+            for edge in self.get_edges_out(stack.pop()):
+                if edge.dst_node == target:
+                    return True
+                if edge.dst_node not in visited:
+                    visited.add(edge.dst_node)
+                    stack.append(edge.dst_node)
+        return False
+
+
+def get_patch_violations(view: PatchedGraph) -> List[str]:
+    """
+    Check the nodes and edges touched by a patch: ids, data keys of changed edges and of edges around changed nodes,
+    cycles through added edges. Nothing else can be affected, so the rest of the graph is not checked again
+    """
+    patch = view.patch
+    violations = []
+    # additions and updates are looked up by id, so a second one with the same id would be silently dropped
+    for kind, items, action in (
+        ("Node", patch.add_nodes, "added"), ("Edge", patch.add_edges, "added"),
+        ("Node", patch.update_nodes, "updated"), ("Edge", patch.update_edges, "updated"),
+    ):
+        counts = Counter(item.id for item in items)
+        violations.extend(f"{kind} {id} is {action} more than once." for id, count in counts.items() if count > 1)
+    for id in view.removed_nodes | set(view.updated_nodes):
+        if id not in view.node_map:
+            violations.append(f"Node {id} does not exist.")
+    for id in view.added_nodes:
+        if id in view.node_map and id not in view.removed_nodes:
+            violations.append(f"Node {id} already exists.")
+    for id in set(patch.remove_edges) | set(view.updated_edges):
+        if id not in view.edge_map:
+            violations.append(f"Edge {id} does not exist.")
+    for id in view.added_edges:
+        if id in view.edge_map and id not in view.removed_edges:
+            violations.append(f"Edge {id} already exists.")
+    if violations:
+        return violations
+
+    # edges whose data keys have to be checked again
+    touched_edges = {}
+    for edge in patch.add_edges:
+        touched_edges[edge.id] = edge
+    for id in view.updated_edges:
+        if id not in view.removed_edges:
+            touched_edges[id] = view.edge_map[id]
+    for id in view.updated_nodes:
+        if view.has_node(id):
+            touched_edges.update((edge.id, edge) for edge in view.get_edges_in(id) + view.get_edges_out(id))
+
+    for edge in touched_edges.values():
+        if not view.has_node(edge.src_node) or not view.has_node(edge.dst_node):
+            violations.append(f"Edge {edge.id} has invalid source or destination node.")
+            continue
+        data_out = view.get_ports(edge.src_node)[1]
+        data_in = view.get_ports(edge.dst_node)[0]
+        for src_key, dst_key in view.get_keys(edge).items():
+            if src_key not in data_out or dst_key not in data_in:
+                violations.append(f"Edge {edge.id} has incompatible data keys.")
+                break
+    if violations:
+        return violations
+
+    # every new cycle goes through an added edge, i.e. its dst reaches back to its src
+    for edge in patch.add_edges:
+        if edge.src_node == edge.dst_node or view.reaches(edge.dst_node, edge.src_node):
+            violations.append(f"Edge {edge.id} creates a cycle.")
+    return violations
+
+
+def get_patched_islands(view: PatchedGraph, islands: dict) -> IslandTracker:
+    """
+    Apply a patch to the island tracker persisted with the graph
+    Edges of the graph are only loaded into the tracker when the patch removes some, since only removals need them
+    """
+    if view.removed_edges or view.removed_nodes:
+        tracker = IslandTracker.from_dict(islands, ((edge.src_node, edge.dst_node) for edge in view.graph.edges))
+    else:
+        tracker = IslandTracker.from_dict(islands)
+
+    # removals first, a patch may remove a node and add it back
+    for id in view.removed_edges:
+        edge = view.edge_map[id]
+        tracker.remove_edge(edge.src_node, edge.dst_node)
+    for id in view.removed_nodes:
+        tracker.remove_node(id)
+    for id in view.added_nodes:
+        tracker.add_node(id)
+    for edge in view.patch.add_edges:
+        tracker.add_edge(edge.src_node, edge.dst_node)
+    return tracker
+
+
+def get_patch_operations(
+    graph_id: str, view: PatchedGraph, tracker: IslandTracker, version_hash: str = None, patch_id: str = None
+) -> List[UpdateOne]:
+    """
+    Targeted array updates applying a patch to a graph document, to be run in order with one bulk_write
+    Mongo does not allow pushing to and pulling from the same array in one update, so these are separate updates
+    With patch_id the updates only match the document while that patch holds it, and the last one releases it
+    """
+    patch = view.patch
+    key = {"_id": graph_id} if patch_id is None else {"_id": graph_id, "patch": patch_id}
+    operations = []
+    if view.removed_edges:
+        removed = list(view.removed_edges)
+        operations.append(UpdateOne(key, {"$pull": {
+            "edges": {"id": {"$in": removed}},
+            "nodes.$[].paths_in": {"$in": removed},
+            "nodes.$[].paths_out": {"$in": removed},
+        }}))
+    if view.removed_nodes:
+        operations.append(UpdateOne(key, {"$pull": {"nodes": {"id": {"$in": list(view.removed_nodes)}}}}))
+    if patch.add_nodes:
+        # paths of added nodes are filled from added edges below
+        nodes = [dict(node.model_dump(), paths_in=[], paths_out=[]) for node in patch.add_nodes]
+        operations.append(UpdateOne(key, {"$push": {"nodes": {"$each": nodes}}}))
+
+    updates, array_filters = {}, []
+    for i, update in enumerate(patch.update_nodes):
+        fields = [field for field in ("data_in", "data_out") if getattr(update, field) is not None]
+        # Mongo rejects array filters which no update uses, so an empty update adds none
+        if fields:
+            updates.update((f"nodes.$[n{i}].{field}", getattr(update, field)) for field in fields)
+            array_filters.append({f"n{i}.id": update.id})
+    for i, update in enumerate(patch.update_edges):
+        updates[f"edges.$[e{i}].src_to_dst_data_keys"] = update.src_to_dst_data_keys
+        array_filters.append({f"e{i}.id": update.id})
+    if updates:
+        operations.append(UpdateOne(key, {"$set": updates}, array_filters=array_filters))
+
+    if patch.add_edges:
+        pushes, array_filters, identifiers = defaultdict(list), [], {}
+        for edge in patch.add_edges:
+            for node_id, field in ((edge.src_node, "paths_out"), (edge.dst_node, "paths_in")):
+                if node_id not in identifiers:
+                    identifiers[node_id] = f"p{len(identifiers)}"
+                    array_filters.append({f"{identifiers[node_id]}.id": node_id})
+                pushes[f"nodes.$[{identifiers[node_id]}].{field}"].append(edge.id)
+        push = {field: {"$each": edge_ids} for field, edge_ids in pushes.items()}
+        push["edges"] = {"$each": [edge.model_dump() for edge in patch.add_edges]}
+        operations.append(UpdateOne(key, {"$push": push}, array_filters=array_filters))
+
+    operations.append(UpdateOne(key, {
+        "$set": {"islands": tracker.to_dict(), "version_hash": version_hash},
+        "$unset": {"patch": "", "patch_started_at": ""},
+        "$inc": {"version": 1},
+    }))
+    return operations
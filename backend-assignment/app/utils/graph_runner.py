@@ -1,5 +1,16 @@
 from collections import deque, defaultdict
 
+def get_edge_maps(graph):
+    """
+    Group edges of the graph by src and dst node, nodes only hold ids of their edges in paths_in/paths_out
+    """
+    edges_in = defaultdict(list)
+    edges_out = defaultdict(list)
+    for edge in graph.edges:
+        edges_out[edge.src_node].append(edge)
+        edges_in[edge.dst_node].append(edge)
+    return edges_in, edges_out
+
 # This is the same function from algo-assignment
 def toposort(graph):
     """
@@ -8,10 +19,11 @@ def toposort(graph):
     execution_order = []
     level_map = defaultdict(list)
     node_map = {node.id: node for node in graph.nodes}
+    edges_in, edges_out = get_edge_maps(graph)
     
     in_degrees = {node.id: 0 for node in graph.nodes}
     for node in graph.nodes:
-        for edge in node.paths_out:
+        for edge in edges_out[node.id]:
             in_degrees[edge.dst_node] += 1
             
     queue = deque(
@@ -31,7 +43,7 @@ def toposort(graph):
                 execution_order.append(id)  # Add to topological order
                 level_map[level].append(id)  # Add to current level
                 
-                for edge in node_map[id].paths_out:
+                for edge in edges_out[id]:
                     dst_node = edge.dst_node
                     in_degrees[dst_node] -= 1
                     if in_degrees[dst_node] == 0:
@@ -41,27 +53,67 @@ def toposort(graph):
         level += 1
     return [execution_order, level_map, node_map]
 
-# This is same function as algo assignment
-def overwrite_traversals(graph, config, execution_order, level_map, node_map):
+def prune_disabled(graph, config, edges_out=None):
     """
-    Generate run entity for graph and also overwrite existing level_wise, node_map based on overwrites in config
+    Get the nodes pruned by enable_list/disable_list of config: disabled nodes and everything that only they feed.
+    Indegrees are counted once, then only the region downstream of the disabled nodes is visited.
     """
-    
-    run_data = {}
+    node_ids = [node.id for node in graph.nodes]
+    if config.enable_list:
+        enabled = set(config.enable_list)
+        disabled = {id for id in node_ids if id not in enabled}
+    else:
+        disabled = set(config.disable_list or []) & set(node_ids)
+    if not disabled:
+        return set()
+
+    if edges_out is None:
+        edges_out = get_edge_maps(graph)[1]
+    in_degrees = defaultdict(int)
+    for edge in graph.edges:
+        in_degrees[edge.dst_node] += 1
+
+    pruned = set(disabled)
+    stack = list(disabled)
+    while stack:
+        id = stack.pop()
+        for edge in edges_out[id]:
+            dst_node = edge.dst_node
+            if dst_node in pruned:
+                continue
+            in_degrees[dst_node] -= 1
+            if in_degrees[dst_node] == 0:  # every source of dst_node is pruned
+                pruned.add(dst_node)
+                stack.append(dst_node)
+    return pruned
+
+def iter_level_traversals(graph, config, level_map, node_map, edge_maps=None):
+    """
+    Apply config to the graph and traverse it level by level, yielding (level, outputs) once each level is done
+    outputs maps the id of each executed node of the level to its data_out, levels with no executed nodes are skipped
+    Nodes pruned by enable_list/disable_list are not executed
+    """
+    edges_in, edges_out = edge_maps or get_edge_maps(graph)
+    pruned = prune_disabled(graph, config, edges_out)
     
     for id, inputs in config.root_inputs.items():
-            if id in node_map:
+            if id in node_map and id not in pruned:
                 node_map[id].data_in.update(inputs)
                 
-    for id, overwrites in config.data_overwrites.items():
-            if id in node_map:
+    for id, overwrites in (config.data_overwrites or {}).items():
+            if id in node_map and id not in pruned:
                 node_map[id].data_in.update(overwrites)
                 
     for level in sorted(level_map.keys()):
+            level_outputs = {}
             nodes_at_level = sorted(level_map[level], key=lambda nid: nid)
             for id in nodes_at_level:
+                if id in pruned:
+                    continue
                 node = node_map[id]
-                for edge in node.paths_in:
+                for edge in edges_in[id]:
+                    if edge.src_node in pruned:
+                        continue
                     src_node = node_map[edge.src_node]
                     for src_key, dst_key in edge.src_to_dst_data_keys.items():
                         if dst_key in node.data_in:
@@ -76,12 +128,27 @@ def overwrite_traversals(graph, config, execution_order, level_map, node_map):
                         else:
                             node.data_in[dst_key] = src_node.data_out[src_key]
 
-                run_data[id] = node.data_out
+                level_outputs[id] = node.data_out
+            if level_outputs:
+                yield level, level_outputs
+
+# This is same function as algo assignment
+def overwrite_traversals(graph, config, execution_order, level_map, node_map, edge_maps=None):
+    """
+    Generate run entity for graph and also overwrite existing level_wise, node_map based on overwrites in config
+    Nodes pruned by enable_list/disable_list are not executed, the returned level map only has the executed nodes
+    edge_maps from get_edge_maps can be passed in, so repeated runs of a graph do not rebuild them
+    """
+    
+    run_data = {}
+    for level, level_outputs in iter_level_traversals(graph, config, level_map, node_map, edge_maps):
+        run_data.update(level_outputs)
 
     updated_level_wise = {}
     for k, v in level_map.items():
-        if len(v):
-            updated_level_wise[k] = v
+        executed = [id for id in v if id in run_data]
+        if len(executed):
+            updated_level_wise[k] = executed
             
     level_map = updated_level_wise           
-    return [updated_level_wise, node_map, run_data]
\ No newline at end of file
+    return [updated_level_wise, node_map, run_data]
@@ -0,0 +1,187 @@
+import json
+import os
+from array import array
+from typing import List
+from pydantic import ValidationError
+from app.models import Node, Edge
+from app.utils.serializers import node_to_dict, edge_to_dict
+
+# ingestion stops reading once this many violations were found
+MAX_VIOLATIONS = 100
+# an ingested graph is stored as one document, Mongo rejects documents over 16MB, the rest is left for islands and fields
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", 15 * 1024 * 1024))
+
+
+class GraphTooLargeError(Exception):
+    """ Raised when an ingested graph would not fit into a single graph document """
+
+
+async def iter_lines(chunks):
+    """ Lines of a stream of byte chunks, e.g. request.stream(), a line may be split across chunks """
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+class GraphIngest:
+    """
+    Incremental validation of a graph streamed as node and edge records, see ingest_graph
+    Only what the checks need is kept in memory: an index of node ids, data keys of each node and edges as integer arrays,
+    so memory stays far below a parsed Graph. Nodes must come before the edges which use them.
+    The size of the graph document is estimated from the records, see add_line
+    """
+    def __init__(self, max_violations: int = MAX_VIOLATIONS, max_bytes: int = INGEST_MAX_BYTES):
+        self.max_violations = max_violations
+        self.max_bytes = max_bytes
+        self.size = 0  # estimated bytes of the graph document
+        self.node_index = {}  # node id -> index
+        self.node_ids = []
+        self.in_keys = []  # data_in keys of each node
+        self.out_keys = []  # data_out keys of each node
+        self._key_sets = {}  # nodes with the same keys share one frozenset
+        self.edge_ids = set()
+        self.edge_src = array("i")
+        self.edge_dst = array("i")
+        self.violations = []
+        self.islands = None  # islands of the graph in the format of IslandTracker.to_dict, set by check_structure
+
+    @property
+    def done(self) -> bool:
+        return len(self.violations) >= self.max_violations
+
+    def _keys(self, data: dict) -> frozenset:
+        keys = frozenset(data)
+        return self._key_sets.setdefault(keys, keys)
+
+    def add_line(self, line_number: int, line: bytes):
+        """
+        Validate one record of the stream
+
+        Returns:
+            (kind, data) with kind node or edge and data the dictionary to store, or None if the record is invalid
+        Raises:
+            GraphTooLargeError: once the records add up to more than max_bytes
+        """
+        # a stored record takes about as much as its json, node ids are stored again in the islands
+        self.size += len(line)
+        if self.size > self.max_bytes:
+            raise GraphTooLargeError(f"Graph is larger than the limit of {self.max_bytes} bytes for an ingested graph.")
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                self.violations.append(f"Line {line_number}: record must be an object.")
+                return None
+            kind = record.pop("type", None)
+            if kind == "node":
+                return self.add_node(Node(**record), line_number)
+            if kind == "edge":
+                return self.add_edge(Edge(**record), line_number)
+            self.violations.append(f"Line {line_number}: type must be node or edge.")
+        except (ValueError, TypeError, ValidationError) as e:
+            self.violations.append(f"Line {line_number}: invalid record, {e}".replace("\n", " "))
+        return None
+
+    def add_node(self, node: Node, line_number: int):
+        if node.id in self.node_index:
+            self.violations.append(f"Line {line_number}: Node {node.id} already exists.")
+            return None
+        self.node_index[node.id] = len(self.node_ids)
+        self.node_ids.append(node.id)
+        self.size += 2 * len(node.id.encode())
+        self.in_keys.append(self._keys(node.data_in))
+        self.out_keys.append(self._keys(node.data_out))
+        return "node", node_to_dict(node)
+
+    def add_edge(self, edge: Edge, line_number: int):
+        if edge.id in self.edge_ids:
+            self.violations.append(f"Line {line_number}: Edge {edge.id} already exists.")
+            return None
+        src = self.node_index.get(edge.src_node)
+        dst = self.node_index.get(edge.dst_node)
+        if src is None or dst is None:
+            self.violations.append(f"Line {line_number}: Edge {edge.id} has invalid source or destination node.")
+            return None
+        for src_key, dst_key in edge.src_to_dst_data_keys.items():
+            if src_key not in self.out_keys[src] or dst_key not in self.in_keys[dst]:
+                self.violations.append(f"Line {line_number}: Edge {edge.id} has incompatible data keys.")
+                return None
+        self.edge_ids.add(edge.id)
+        self.edge_src.append(src)
+        self.edge_dst.append(dst)
+        return "edge", edge_to_dict(edge)
+
+    def check_structure(self, allow_islands: bool = False) -> List[str]:
+        """
+        Cycle and island checks once all records are in, on a CSR adjacency built from the edge arrays
+        Islands are kept in self.islands, more than one island is a violation unless allow_islands is set
+        """
+        node_count = len(self.node_ids)
+        cycle_nodes = find_cycle_nodes(node_count, self.edge_src, self.edge_dst)
+        if cycle_nodes:
+            sample = ", ".join(self.node_ids[i] for i in cycle_nodes[:10])
+            self.violations.append(f"Graph contains a cycle through {len(cycle_nodes)} nodes, e.g. {sample}.")
+
+        roots = find_island_roots(node_count, self.edge_src, self.edge_dst)
+        island_count = sum(1 for i, root in enumerate(roots) if i == root)
+        self.islands = {"roots": {id: self.node_ids[roots[i]] for i, id in enumerate(self.node_ids)}, "island_count": island_count}
+        if island_count > 1 and not allow_islands:
+            self.violations.append(f"Graph has {island_count} islands.")
+        return self.violations
+
+
+def find_cycle_nodes(node_count: int, edge_src, edge_dst) -> List[int]:
+    """
+    Kahn's algorithm on a CSR adjacency, returns the nodes never reached (on or downstream of a cycle), empty for a DAG
+    """
+    out_offsets = array("i", [0]) * (node_count + 1)
+    in_degrees = array("i", [0]) * node_count
+    for src, dst in zip(edge_src, edge_dst):
+        out_offsets[src + 1] += 1
+        in_degrees[dst] += 1
+    for i in range(node_count):
+        out_offsets[i + 1] += out_offsets[i]
+    out_targets = array("i", [0]) * len(edge_dst)
+    position = array("i", out_offsets[:-1]) if node_count else array("i")
+    for src, dst in zip(edge_src, edge_dst):
+        out_targets[position[src]] = dst
+        position[src] += 1
+
+    stack = [i for i in range(node_count) if in_degrees[i] == 0]
+    visited = len(stack)
+    while stack:
+        i = stack.pop()
+        for e in range(out_offsets[i], out_offsets[i + 1]):
+            dst = out_targets[e]
+            in_degrees[dst] -= 1
+            if in_degrees[dst] == 0:
+                stack.append(dst)
+                visited += 1
+    if visited == node_count:
+        return []
+    return [i for i in range(node_count) if in_degrees[i] > 0]
+
+
+def find_island_roots(node_count: int, edge_src, edge_dst) -> array:
+    """ Union-find over the edge arrays, returns the root of the island of each node """
+    parent = array("i", range(node_count))
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    for src, dst in zip(edge_src, edge_dst):
+        src_root, dst_root = find(src), find(dst)
+        if src_root != dst_root:
+            parent[max(src_root, dst_root)] = min(src_root, dst_root)
+    for i in range(node_count):
+        parent[i] = find(i)
+    return parent
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from app.models import RunConfig, RunOutput
+from app.utils.api import save_run_output, save_node_outputs, update_run_output, save_cached_run_result
+from app.utils.cache import LRUCache
+from app.utils.graph_operations import run_compiled, record_run_metrics
+from app.utils.validator import generate_unique_run_id
+
+# status of a run submitted to the job queue, stored with its RunOutput
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+# compiled graphs kept in each worker process, keyed by (graph_id, version_hash), set up by init_worker
+_resident_graphs = None
+
+
+def init_worker(max_graphs: int, ttl: float):
+    """ Initializer of the worker processes, runs only ship the config to a worker which already has the graph """
+    global _resident_graphs
+    _resident_graphs = LRUCache(max_size=max_graphs, ttl=ttl)
+
+
+def run_resident(key: tuple, compiled: dict, config: RunConfig, run_id: str):
+    """
+    Run a compiled graph kept in the worker process, a compiled graph which is given is kept for the next runs
+    Returns None if no compiled graph is given and the worker does not have it yet
+    """
+    if compiled is not None:
+        _resident_graphs.put(key, None, compiled)
+    else:
+        cached = _resident_graphs.get(key)
+        if cached is None:
+            return None
+        compiled = cached[1]
+    return run_compiled(compiled, config, run_id)
+
+
+class JobQueueFull(Exception):
+    """ Raised when a run is submitted while the job queue is at its maximum depth """
+
+
+class RunJobQueue:
+    """
+    Queue of graph runs executed on a process pool, so CPU-bound runs never block the event loop
+    At most `concurrency` runs execute at once and at most `max_depth` runs wait in the queue
+    Workers keep the compiled graphs they ran, so runs of a graph a worker already has only send the config
+    Status of every run (queued, running, done, failed) is kept in its RunOutput in the DB
+    """
+    def __init__(self, concurrency: int, max_depth: int, worker_graphs: int = 16, worker_graph_ttl: float = 300.0):
+        self.concurrency = concurrency
+        self.max_depth = max_depth
+        self.worker_graphs = worker_graphs
+        self.worker_graph_ttl = worker_graph_ttl
+        self._queue = None
+        self._pool = None
+        self._workers = []
+
+    def _ensure_started(self):
+        # queue and worker tasks need a running event loop, so they are created on first submit
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_depth)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.concurrency, initializer=init_worker, initargs=(self.worker_graphs, self.worker_graph_ttl)
+            )
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def submit(self, compiled: dict, config: RunConfig, graph_id: str, wait: bool = False):
+        """
+        Enqueue a run of a compiled graph, its RunOutput is saved as queued right away
+
+        Returns:
+            (run_id, future), the future resolves to the run result and is only made when wait is set
+        Raises:
+            JobQueueFull: if max_depth runs are already waiting
+        """
+        self._ensure_started()
+        if self._queue.full():
+            raise JobQueueFull(f"Run queue is full ({self.max_depth} runs waiting)")
+
+        run_id = generate_unique_run_id()
+        await save_run_output(RunOutput(run_id=run_id, graph_id=graph_id, version_hash=compiled.get("version_hash"), status=QUEUED))
+        future = asyncio.get_running_loop().create_future() if wait else None
+        try:
+            self._queue.put_nowait((run_id, graph_id, compiled, config, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            # filled up while the run was being saved
+            await update_run_output(run_id, {"status": FAILED, "error": "Run queue is full"})
+            raise JobQueueFull(f"Run queue is full ({self.max_depth} runs waiting)")
+        return run_id, future
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            run_id, graph_id, compiled, config, future, queued_at = await self._queue.get()
+            try:
+                await self._run(loop, run_id, graph_id, compiled, config, future, queued_at)
+            except Exception:
+                # e.g. the failed status could not be saved, the worker carries on with the next run
+                logger.exception("Run %s could not be completed", run_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, loop, run_id, graph_id, compiled, config, future, queued_at):
+        try:
+            waited = time.perf_counter() - queued_at
+            await update_run_output(run_id, {"status": RUNNING})
+            start = time.perf_counter()
+            # the compiled graph is only sent to a worker which does not have this version of it yet
+            key = (graph_id, compiled.get("version_hash"))
+            result = await loop.run_in_executor(self._pool, run_resident, key, None, config, run_id) if key[1] else None
+            if result is None:
+                result = await loop.run_in_executor(self._pool, run_resident, key, compiled, config, run_id)
+            timings = result["timings"]
+            # time spent sending the config (and the compiled graph if needed) to the worker process and the result back
+            timings["dispatch"] = time.perf_counter() - start - sum(timings.values())
+            timings["queue"] = waited
+            record_run_metrics(result)
+            await save_node_outputs(run_id, result["outputs"], result["leaves"])
+            await update_run_output(run_id, {"status": DONE, "node_count": len(result["outputs"])})
+        except Exception as e:
+            settle(future, exception=e)
+            await update_run_output(run_id, {"status": FAILED, "error": str(e)})
+            return
+        settle(future, result=result)
+        await save_cached_run_result(compiled, config, result)
+
+    def shutdown(self):
+        """ Stop the workers and the process pool, called when the app stops """
+        for worker in self._workers:
+            worker.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+        self._queue, self._pool, self._workers = None, None, []
+
+
+def settle(future, result=None, exception=None):
+    """ Resolve the future of a run, unless its client stopped waiting (e.g. disconnected) and it was cancelled """
+    if future is None or future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+run_job_queue = RunJobQueue(
+    concurrency=int(os.getenv("RUN_QUEUE_CONCURRENCY", os.cpu_count() or 1)),
+    max_depth=int(os.getenv("RUN_QUEUE_DEPTH", 1000)),
+    worker_graphs=int(os.getenv("RUN_WORKER_GRAPHS", 16)),
+    worker_graph_ttl=float(os.getenv("GRAPH_CACHE_TTL", 300)),
+)
@@ -0,0 +1,35 @@
+import json
+from datetime import datetime
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, responses fall back to the json module
+    orjson = None
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """ JSON encoding of plain dicts/lists, with orjson when it is installed """
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response encoded by orjson when it is installed
+    Returning one from a route also skips jsonable_encoder, so content must already be plain dicts and lists
+    """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
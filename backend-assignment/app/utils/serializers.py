@@ -1,28 +1,127 @@
+from datetime import datetime, timezone
+from typing import List
 from bson import ObjectId
-from app.models import Graph, RunOutput
+from app.models import Graph, Node, Edge, RunOutput
+from app.utils.connectivity import IslandTracker
+
+def construct(model, data: dict):
+    # build a model from trusted data without validating it, e.g. documents which were validated before they were saved
+    return model.model_construct(**data) if hasattr(model, "model_construct") else model.construct(**data)
+
+def node_to_dict(node) -> dict:
+    # plain attribute access, a lot cheaper than .dict() for the many nodes and edges of a graph
+    return {"id": node.id, "data_in": node.data_in, "data_out": node.data_out, "paths_in": node.paths_in, "paths_out": node.paths_out}
+
+def edge_to_dict(edge) -> dict:
+    return {"id": edge.id, "src_node": edge.src_node, "dst_node": edge.dst_node, "src_to_dst_data_keys": edge.src_to_dst_data_keys}
 
 def serialize_graph(graph) -> dict:
     # serialize the graph class into a dictionary, which can be passed to MongoDB
     return {
         "_id": str(graph.id),
-        "nodes": [node.dict() for node in graph.nodes],
-        "edges": [edge.dict() for edge in graph.edges]
+        "nodes": [node_to_dict(node) for node in graph.nodes],
+        "edges": [edge_to_dict(edge) for edge in graph.edges],
+        # islands are persisted alongside the graph, so they can be queried without loading and traversing it
+        "islands": IslandTracker.from_graph(graph).to_dict(),
+        # bumped on every update, identifies the cached compiled graph
+        "version": 1
     }
 
-def deserialize_graph(data) -> Graph:
-    # deserialize the dictionary fetched from DB to graph class
+def graph_document_to_dict(data) -> dict:
+    # the graph part of a document fetched from DB, as it is sent to clients
     # mongo_db renames id to _id, but Graph class expects id as key
-    data["id"] = data.pop("_id")
-    return Graph(**data)
+    return {"id": data["_id"], "nodes": data["nodes"], "edges": data["edges"]}
+
+def deserialize_graph(data, validate: bool = False) -> Graph:
+    # deserialize the dictionary fetched from DB to graph class
+    # graphs are validated before they are saved, so documents from DB are trusted and not validated again by default
+    data = graph_document_to_dict(data)
+    if validate:
+        return Graph(**data)
+    return construct(Graph, {
+        "id": data["id"],
+        "nodes": [construct(Node, node) for node in data["nodes"]],
+        "edges": [construct(Edge, edge) for edge in data["edges"]],
+    })
 
 def serialize_run_output(run_output: RunOutput) -> dict:
     # serialize the run output class into a dictionary, which can be passed to MongoDB
+    # outputs of the nodes are not part of it, they are stored as separate documents, see serialize_node_outputs
     return {
         "run_id": run_output.run_id,
         "graph_id": run_output.graph_id,
-        "node_outputs": run_output.node_outputs
+        "version_hash": run_output.version_hash,
+        "node_count": len(run_output.node_outputs),
+        "status": run_output.status,
+        "error": run_output.error,
+        "created_at": run_output.created_at or datetime.now(timezone.utc)
     }
 
-def deserialize_run_output(data) -> RunOutput:
+def serialize_node_outputs(run_id: str, node_outputs: dict, leaves=()) -> List[dict]:
+    # one document per node, so a run is never limited by the document size and single nodes can be read alone
+    leaves = set(leaves)
+    return [
+        {"run_id": run_id, "node_id": node_id, "leaf": node_id in leaves, "data_out": data_out}
+        for node_id, data_out in node_outputs.items()
+    ]
+
+def deserialize_run_output(data, node_outputs: dict = None) -> RunOutput:
     # deserialize the dictionary fetched from DB to run output class
-    return RunOutput(**data)
\ No newline at end of file
+    # node_outputs are read from the per node documents, runs saved before them have node_outputs inline
+    if node_outputs is not None:
+        data["node_outputs"] = node_outputs
+    data.pop("_id", None)
+    data.pop("node_count", None)
+    return construct(RunOutput, data)
+
+def run_output_to_dict(run_output: RunOutput) -> dict:
+    return {
+        "run_id": run_output.run_id,
+        "graph_id": run_output.graph_id,
+        "version_hash": run_output.version_hash,
+        "node_outputs": run_output.node_outputs,
+        "status": run_output.status,
+        "error": run_output.error,
+        "created_at": run_output.created_at,
+    }
+
+def pack_graph(data: dict) -> bytes:
+    """
+    Compact binary format of a graph, msgpack of its nodes and edges as arrays instead of objects
+    paths_in/paths_out are left out, they are rebuilt from the edges by unpack_graph
+    Raises ImportError if msgpack is not installed
+    """
+    import msgpack
+    return msgpack.packb([
+        data["id"],
+        [[node["id"], node["data_in"], node["data_out"]] for node in data["nodes"]],
+        [[edge["id"], edge["src_node"], edge["dst_node"], edge["src_to_dst_data_keys"]] for edge in data["edges"]],
+    ])
+
+def unpack_graph(content: bytes) -> dict:
+    """
+    Graph dictionary from the binary format of pack_graph, it is not validated
+    Raises ImportError if msgpack is not installed and ValueError if content is not a packed graph
+    """
+    import msgpack
+    try:
+        graph_id, packed_nodes, edges = msgpack.unpackb(content)
+        nodes = {}
+        for id, data_in, data_out in packed_nodes:
+            # paths are rebuilt from the edges, a repeated id would silently merge two nodes
+            if id in nodes:
+                raise ValueError(f"duplicate node id {id}")
+            nodes[id] = {"id": id, "data_in": data_in, "data_out": data_out, "paths_in": [], "paths_out": []}
+        edges = [
+            {"id": id, "src_node": src_node, "dst_node": dst_node, "src_to_dst_data_keys": keys}
+            for id, src_node, dst_node, keys in edges
+        ]
+        # src_node/dst_node are only checked once the graph is validated, e.g. a list here raises TypeError
+        for edge in edges:
+            if edge["src_node"] in nodes:
+                nodes[edge["src_node"]]["paths_out"].append(edge["id"])
+            if edge["dst_node"] in nodes:
+                nodes[edge["dst_node"]]["paths_in"].append(edge["id"])
+    except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid binary graph: {e}")
+    return {"id": graph_id, "nodes": list(nodes.values()), "edges": edges}
\ No newline at end of file
@@ -1,20 +1,42 @@
-from typing import Dict
+from typing import Dict, List
 import uuid
 
-def validate_graph_structure(graph):
-    """ Validates that all nodes and edges in the graph follow correct rules """
+
+class GraphValidationError(ValueError):
+    """ Raised with all the violations found in a graph """
+    def __init__(self, violations: List[str]):
+        super().__init__("; ".join(violations))
+        self.violations = violations
+
+def get_graph_violations(graph) -> List[str]:
+    """
+    Check that all nodes and edges in the graph follow correct rules, and return every violation found
+    Lookup tables for node ids and data keys are built once, so this is O(V+E) instead of scanning nodes per edge
+    """
+    node_ids = {node.id for node in graph.nodes}
+    # port keys of each node, as (node_id, data_key)
+    out_ports = {(node.id, key) for node in graph.nodes for key in node.data_out}
+    in_ports = {(node.id, key) for node in graph.nodes for key in node.data_in}
+
+    violations = []
     for edge in graph.edges:
-        src_node = next((node for node in graph.nodes if node.id == edge.src_node), None)
-        dst_node = next((node for node in graph.nodes if node.id == edge.dst_node), None)
-        
         # Check if src and dst nodes exist
-        if not src_node or not dst_node:
-            raise ValueError(f"Edge {edge.id} has invalid source or destination node.")
-        
+        if edge.src_node not in node_ids or edge.dst_node not in node_ids:
+            violations.append(f"Edge {edge.id} has invalid source or destination node.")
+            continue
+
         # Check data type compatibility
         for src_key, dst_key in edge.src_to_dst_data_keys.items():
-            if src_key not in src_node.data_out or dst_key not in dst_node.data_in:
-                raise ValueError(f"Edge {edge.id} has incompatible data keys.")
+            if (edge.src_node, src_key) not in out_ports or (edge.dst_node, dst_key) not in in_ports:
+                violations.append(f"Edge {edge.id} has incompatible data keys.")
+                break
+    return violations
+
+def validate_graph_structure(graph):
+    """ Validates that all nodes and edges in the graph follow correct rules, raises with all the violations at once """
+    violations = get_graph_violations(graph)
+    if violations:
+        raise GraphValidationError(violations)
 
 def generate_unique_run_id():
     """ Generates a unique run ID for each graph execution """
@@ -0,0 +1,105 @@
+import hashlib
+import json
+from typing import List
+from app.models import Graph, Node, Edge
+from app.utils.graph_patch import PatchedGraph
+
+
+def hash_block(kind: str, data: dict) -> str:
+    """ Content hash of a node or edge, the same content always gets the same hash whichever graph it is in """
+    encoded = json.dumps([kind, data], sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def hash_manifest(manifest: dict) -> str:
+    """ Version hash of a graph, the hash of its ordered node and edge block hashes """
+    digest = hashlib.blake2b(digest_size=16)
+    for kind in ("nodes", "edges"):
+        digest.update(kind.encode())
+        for _, block_hash in manifest[kind]:
+            digest.update(block_hash.encode())
+    return digest.hexdigest()
+
+
+def build_manifest(nodes: List[dict], edges: List[dict]):
+    """
+    Split a graph into content addressed blocks
+
+    Returns:
+        (manifest, blocks), manifest lists [id, block hash] of nodes and edges in graph order, blocks maps hash -> block
+    """
+    manifest = {"nodes": [], "edges": []}
+    blocks = {}
+    for kind, items in (("node", nodes), ("edge", edges)):
+        for data in items:
+            block_hash = hash_block(kind, data)
+            blocks[block_hash] = {"kind": kind, "data": data}
+            manifest[f"{kind}s"].append([data["id"], block_hash])
+    return manifest, blocks
+
+
+def patch_manifest(manifest: dict, view: PatchedGraph):
+    """
+    Manifest of a graph after a patch, built from the manifest before it
+    Only nodes and edges touched by the patch are hashed again, the rest keep their block hashes
+
+    Returns:
+        (manifest, blocks) like build_manifest, blocks only has the new blocks
+    """
+    patch = view.patch
+    blocks = {}
+
+    def add_block(kind, data):
+        block_hash = hash_block(kind, data)
+        blocks[block_hash] = {"kind": kind, "data": data}
+        return [data["id"], block_hash]
+
+    # nodes whose paths change along with added or removed edges
+    touched_nodes = set(view.updated_nodes)
+    for id in view.removed_edges:
+        edge = view.edge_map[id]
+        touched_nodes.update((edge.src_node, edge.dst_node))
+    for edge in patch.add_edges:
+        touched_nodes.update((edge.src_node, edge.dst_node))
+
+    def get_node(id):
+        data_in, data_out = view.get_ports(id)
+        if id in view.added_nodes:
+            paths_in, paths_out = [], []
+        else:
+            node = view.node_map[id]
+            paths_in = [edge_id for edge_id in node.paths_in if edge_id not in view.removed_edges]
+            paths_out = [edge_id for edge_id in node.paths_out if edge_id not in view.removed_edges]
+        paths_in += [edge.id for edge in view.added_in.get(id, ())]
+        paths_out += [edge.id for edge in view.added_out.get(id, ())]
+        return Node(id=id, data_in=data_in, data_out=data_out, paths_in=paths_in, paths_out=paths_out).model_dump()
+
+    nodes = []
+    for id, block_hash in manifest["nodes"]:
+        if id in view.removed_nodes:
+            continue
+        nodes.append(add_block("node", get_node(id)) if id in touched_nodes else [id, block_hash])
+    nodes.extend(add_block("node", get_node(node.id)) for node in patch.add_nodes)
+
+    edges = []
+    for id, block_hash in manifest["edges"]:
+        if id in view.removed_edges:
+            continue
+        if id in view.updated_edges:
+            edge = view.edge_map[id]
+            edges.append(add_block("edge", Edge(
+                id=id, src_node=edge.src_node, dst_node=edge.dst_node, src_to_dst_data_keys=view.get_keys(edge)
+            ).model_dump()))
+        else:
+            edges.append([id, block_hash])
+    edges.extend(add_block("edge", edge.model_dump()) for edge in patch.add_edges)
+    return {"nodes": nodes, "edges": edges}, blocks
+
+
+def assemble_graph(graph_id: str, manifest: dict, blocks: dict) -> Graph:
+    """ Graph of a version from its manifest and the blocks it lists """
+    return Graph(
+        id=graph_id,
+        nodes=[blocks[block_hash]["data"] for _, block_hash in manifest["nodes"]],
+        edges=[blocks[block_hash]["data"] for _, block_hash in manifest["edges"]],
+    )
@@ -0,0 +1,187 @@
+import httpx
+import mongomock
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from app.main import app
+from app.utils import database, jobs
+from app.utils.cache import compiled_graph_cache, run_result_cache
+from app.utils.jobs import run_job_queue
+
+
+class FakeCursor:
+    """ Async cursor over a mongomock cursor """
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, limit):
+        self.cursor = self.cursor.limit(limit)
+        return self
+
+    def skip(self, skip):
+        self.cursor = self.cursor.skip(skip)
+        return self
+
+    def __aiter__(self):
+        self.iterator = iter(self.cursor)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length=None):
+        return list(self.cursor)[:length]
+
+
+def apply_positional_update(document, operator, path, value, filters):
+    """ Apply one update of a path with $[] or $[identifier] to a document, mongomock does not implement them """
+    segments = path.split(".")
+
+    def walk(target, i):
+        segment = segments[i]
+        if segment.startswith("$["):
+            identifier = segment[2:-1]
+            for element in target:
+                if not identifier or all(element.get(field) == expected for field, expected in filters[identifier].items()):
+                    walk(element, i + 1)
+        elif i < len(segments) - 1:
+            walk(target.setdefault(segment, {}), i + 1)
+        elif operator == "$set":
+            target[segment] = value
+        elif operator == "$push":
+            target.setdefault(segment, []).extend(value["$each"] if isinstance(value, dict) and "$each" in value else [value])
+        elif operator == "$pull":
+            removed = value["$in"] if isinstance(value, dict) and "$in" in value else [value]
+            target[segment] = [item for item in target.get(segment, []) if item not in removed]
+        else:
+            raise NotImplementedError(operator)
+
+    walk(document, 0)
+
+
+class FakeCollection:
+    """ Async collection like a motor one, over a mongomock collection """
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+    def find(self, *args, **kwargs):
+        return FakeCursor(self.collection.find(*args, **kwargs))
+
+    def aggregate(self, *args, **kwargs):
+        return FakeCursor(self.collection.aggregate(*args, **kwargs))
+
+    async def update_one(self, filter, update, upsert=False, array_filters=None):
+        positional = {
+            operator: {path: value for path, value in fields.items() if "$[" in path} for operator, fields in update.items()
+        }
+        if not any(positional.values()):
+            return self.collection.update_one(filter, update, upsert=upsert)
+
+        document = self.collection.find_one(filter)
+        if document is None:
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+        filters = {}
+        for array_filter in array_filters or []:
+            for key, expected in array_filter.items():
+                identifier, field = key.split(".", 1)
+                filters.setdefault(identifier, {})[field] = expected
+        for operator, fields in positional.items():
+            for path, value in fields.items():
+                apply_positional_update(document, operator, path, value, filters)
+        self.collection.replace_one({"_id": document["_id"]}, document)
+        plain = {operator: {path: value for path, value in fields.items() if "$[" not in path} for operator, fields in update.items()}
+        plain = {operator: fields for operator, fields in plain.items() if fields}
+        if plain:
+            self.collection.update_one({"_id": document["_id"]}, plain)
+        return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+
+    async def bulk_write(self, operations, ordered=True):
+        matched = modified = 0
+        for operation in operations:
+            kind = type(operation).__name__
+            if kind == "UpdateOne":
+                result = await self.update_one(
+                    operation._filter, operation._doc, upsert=operation._upsert, array_filters=operation._array_filters
+                )
+                matched += result.matched_count
+                modified += result.modified_count
+            elif kind == "InsertOne":
+                self.collection.insert_one(operation._doc)
+            elif kind == "ReplaceOne":
+                result = self.collection.replace_one(operation._filter, operation._doc, upsert=operation._upsert)
+                matched += result.matched_count
+            elif kind == "DeleteOne":
+                self.collection.delete_one(operation._filter)
+            else:
+                raise NotImplementedError(kind)
+        return SimpleNamespace(matched_count=matched, modified_count=modified)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.database = mongomock.MongoClient().db
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self.database[name])
+        return self.collections[name]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """ In-memory database in place of Mongo, with empty in-process caches """
+    fake = FakeDatabase()
+    monkeypatch.setattr(database, "database", fake)
+    compiled_graph_cache.clear()
+    run_result_cache.clear()
+    yield fake
+    compiled_graph_cache.clear()
+    run_result_cache.clear()
+
+
+@pytest.fixture
+async def client(db, monkeypatch):
+    """ Client of the app, queued runs execute on threads and the job queue is stopped after the test """
+    monkeypatch.setattr(jobs, "ProcessPoolExecutor", ThreadPoolExecutor)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    run_job_queue.shutdown()
+
+
+def get_graph(count=3, id="g"):
+    """ Graph of a chain of nodes n0 -> n1 -> ... as sent to POST /graphs/ """
+    nodes = [
+        {
+            "id": f"n{i}",
+            "data_in": {"in": "0"},
+            "data_out": {"out": str(i)},
+            "paths_in": [f"e{i - 1}"] if i else [],
+            "paths_out": [f"e{i}"] if i < count - 1 else [],
+        }
+        for i in range(count)
+    ]
+    edges = [
+        {"id": f"e{i}", "src_node": f"n{i}", "dst_node": f"n{i + 1}", "src_to_dst_data_keys": {"out": "in"}}
+        for i in range(count - 1)
+    ]
+    return {"id": id, "nodes": nodes, "edges": edges}
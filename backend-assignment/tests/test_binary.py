@@ -0,0 +1,31 @@
+import msgpack
+import pytest
+from app.utils.serializers import pack_graph
+from tests.conftest import get_graph
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_binary_round_trip(client):
+    content = pack_graph(get_graph())
+    response = await client.post("/graphs/binary", content=content)
+    assert response.status_code == 200
+
+    response = await client.get("/graphs/g/binary")
+    assert response.content == content
+    assert (await client.get("/graphs/g")).json()["nodes"][1]["paths_in"] == ["e0"]
+
+
+@pytest.mark.parametrize(
+    "content, detail",
+    [
+        (b"not msgpack", "Invalid binary graph"),
+        (msgpack.packb(["g", [["a", {}, {}], ["a", {}, {}]], []]), "duplicate node id a"),
+        (msgpack.packb(["g", [["a", {}, {}]], [["e", ["a"], "a", {}]]]), "Invalid binary graph"),
+        (msgpack.packb(["g", [[{}, {}, {}]], []]), "Invalid binary graph"),
+    ],
+)
+async def test_invalid_binary_graph_is_rejected(client, content, detail):
+    response = await client.post("/graphs/binary", content=content)
+    assert response.status_code == 400
+    assert detail in response.json()["detail"]
@@ -0,0 +1,24 @@
+import pytest
+from pathlib import Path
+from app.models import Graph
+from app.utils.connectivity import IslandTracker
+from tests.conftest import get_graph
+
+
+def test_tracker_from_graph_edges():
+    graph = Graph(**get_graph(count=4))
+    tracker = IslandTracker.from_graph(graph)
+    assert tracker.island_count == 1
+
+    tracker.remove_node("n1")
+    assert sorted(map(sorted, tracker.islands())) == [["n0"], ["n2", "n3"]]
+
+
+def test_copies_match():
+    """
+    The algo engine keeps the same module, the two must not drift apart
+    """
+    algo = Path(__file__).parents[2] / "algo-assignment" / "utils" / "connectivity.py"
+    if not algo.exists():
+        pytest.skip("algo-assignment is not checked out")
+    assert algo.read_text() == (Path(__file__).parents[1] / "app" / "utils" / "connectivity.py").read_text()
@@ -0,0 +1,131 @@
+import json
+import pytest
+from array import array
+from functools import partial
+from pymongo.errors import AutoReconnect, DocumentTooLarge
+from app.routers import graph_router
+from app.utils import api
+from app.utils.ingest import GraphIngest, GraphTooLargeError, iter_lines, find_cycle_nodes
+from tests.conftest import get_graph
+
+pytestmark = pytest.mark.anyio
+
+NODE = b'{"type": "node", "id": "%s", "data_in": {}, "data_out": {"out": "1"}}'
+
+
+def get_records(graph):
+    """ NDJSON records of a graph as sent to POST /graphs/{graph_id}/ingest """
+    records = [dict(node, type="node") for node in graph["nodes"]] + [dict(edge, type="edge") for edge in graph["edges"]]
+    return b"".join(json.dumps(record).encode() + b"\n" for record in records)
+
+
+async def chunked(content, size=7):
+    for i in range(0, len(content), size):
+        yield content[i:i + size]
+
+
+async def test_iter_lines_joins_lines_split_across_chunks():
+    lines = [line async for line in iter_lines(chunked(b"first\nsecond line\n\nlast", size=4))]
+    assert lines == [b"first", b"second line", b"", b"last"]
+    assert [line async for line in iter_lines(chunked(b""))] == []
+
+
+@pytest.mark.parametrize(
+    "edges, cycle_nodes",
+    [
+        ([(0, 1), (1, 2)], []),
+        ([(0, 1), (1, 2), (2, 1)], [1, 2]),
+        ([(0, 0), (1, 2)], [0]),
+        ([(0, 1), (1, 0), (1, 2)], [0, 1, 2]),  # downstream of the cycle
+    ],
+)
+def test_find_cycle_nodes(edges, cycle_nodes):
+    assert find_cycle_nodes(3, array("i", (src for src, _ in edges)), array("i", (dst for _, dst in edges))) == cycle_nodes
+    assert find_cycle_nodes(0, array("i"), array("i")) == []
+
+
+def test_graph_ingest_checks_records_and_structure():
+    ingest = GraphIngest()
+    lines = get_records(get_graph()).splitlines()
+    for line_number, line in enumerate(lines, 1):
+        kind, data = ingest.add_line(line_number, line)
+        assert "type" not in data
+    assert ingest.check_structure() == []
+    assert ingest.islands["island_count"] == 1 and ingest.node_ids == ["n0", "n1", "n2"]
+
+    ingest = GraphIngest(max_violations=3)
+    ingest.add_line(1, NODE % b"a")
+    ingest.add_line(2, NODE % b"a")
+    ingest.add_line(3, b'{"type": "edge", "id": "e", "src_node": "a", "dst_node": "b", "src_to_dst_data_keys": {}}')
+    ingest.add_line(4, b'["not an object"]')
+    assert ingest.violations == [
+        "Line 2: Node a already exists.",
+        "Line 3: Edge e has invalid source or destination node.",
+        "Line 4: record must be an object.",
+    ]
+    assert ingest.done
+
+    ingest = GraphIngest()
+    ingest.add_line(1, NODE % b"a")
+    ingest.add_line(2, NODE % b"b")
+    assert ingest.check_structure() == ["Graph has 2 islands."]
+    assert GraphIngest().check_structure(allow_islands=True) == []
+
+    ingest = GraphIngest(max_bytes=len(NODE) * 3 // 2)
+    ingest.add_line(1, NODE % b"a")
+    with pytest.raises(GraphTooLargeError):
+        ingest.add_line(2, NODE % b"b")
+
+
+async def test_ingest_creates_graph(client, monkeypatch):
+    monkeypatch.setattr(api, "INGEST_BATCH", 2)
+    response = await client.post("/graphs/g/ingest", content=chunked(get_records(get_graph(count=5))))
+    assert response.status_code == 200
+    assert response.json()["node_count"] == 5 and response.json()["island_count"] == 1
+
+    graph = (await client.get("/graphs/g")).json()
+    assert [node["id"] for node in graph["nodes"]] == [f"n{i}" for i in range(5)]
+    assert len((await client.get("/graphs/g/versions")).json()["versions"]) == 1
+    assert (await client.post("/run", params={"graph_id": "g", "wait": True}, json={"root_inputs": {}})).status_code == 200
+
+    response = await client.post("/graphs/g/ingest", content=chunked(get_records(get_graph())))
+    assert response.status_code == 400
+    assert response.json()["detail"] == ["Graph g already exists."]
+
+
+async def test_invalid_ingest_leaves_nothing(client, db):
+    graph = get_graph()
+    graph["edges"].append({"id": "back", "src_node": "n2", "dst_node": "n0", "src_to_dst_data_keys": {}})
+    response = await client.post("/graphs/g/ingest", content=chunked(get_records(graph)))
+    assert response.status_code == 400
+    assert "cycle" in response.json()["detail"][0]
+    assert db["graphs"].collection.count_documents({}) == 0
+    assert db["graph_versions"].collection.count_documents({}) == 0
+
+
+async def test_too_large_ingest_is_rejected(client, db, monkeypatch):
+    content = get_records(get_graph())
+    monkeypatch.setattr(graph_router, "INGEST_MAX_BYTES", len(content) - 1)
+    response = await client.post("/graphs/g/ingest", content=content)
+    assert response.status_code == 413
+
+    # streamed without a content length, the stream is stopped once the limit is reached
+    monkeypatch.setattr(api, "GraphIngest", partial(GraphIngest, max_bytes=len(content) // 2))
+    response = await client.post("/graphs/g/ingest", content=chunked(content))
+    assert response.status_code == 413
+    assert db["graphs"].collection.count_documents({}) == 0
+
+    # a malformed content length skips the check up front, it is not a server error
+    response = await client.post("/graphs/g/ingest", content=content, headers={"content-length": "many"})
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("error, status_code", [(DocumentTooLarge("too large"), 413), (AutoReconnect("connection lost"), 503)])
+async def test_database_errors_of_ingest(client, db, monkeypatch, error, status_code):
+    async def fail(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(db["graphs"], "update_one", fail)
+    response = await client.post("/graphs/g/ingest", content=chunked(get_records(get_graph())))
+    assert response.status_code == status_code
+    assert db["graphs"].collection.count_documents({}) == 0
@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from app.models import RunConfig
+from app.utils import jobs
+from app.utils.api import get_compiled_graph, get_run_output
+from app.utils.jobs import RunJobQueue, DONE, FAILED
+from tests.conftest import get_graph
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def queue(client):
+    """ Job queue with a single worker running on a thread, and a compiled graph saved through the api """
+    queue = RunJobQueue(concurrency=1, max_depth=10)
+    await client.post("/graphs/", json=get_graph())
+    yield queue, await get_compiled_graph("g")
+    queue.shutdown()
+
+
+async def test_queued_run_is_done(queue, client):
+    queue, compiled = queue
+    run_id, future = await queue.submit(compiled, RunConfig(root_inputs={"n0": {"in": "1"}}), "g", wait=True)
+    result = await future
+    run = await get_run_output(run_id)
+    assert run.status == DONE
+    assert run.node_outputs == result["outputs"]
+
+
+async def test_cancelled_wait_keeps_worker_running(queue):
+    """
+    A client which stopped waiting cancels its future, the run is still completed and the next run still runs
+    """
+    queue, compiled = queue
+    config = RunConfig(root_inputs={"n0": {"in": "1"}})
+    run_id, future = await queue.submit(compiled, config, "g", wait=True)
+    future.cancel()
+    await queue._queue.join()
+    assert (await get_run_output(run_id)).status == DONE
+
+    next_run_id, next_future = await queue.submit(compiled, config, "g", wait=True)
+    await asyncio.wait_for(next_future, timeout=10)
+    assert (await get_run_output(next_run_id)).status == DONE
+
+
+async def test_failed_runs_keep_worker_running(queue, monkeypatch):
+    """
+    A failing run is saved as failed, and a failure to save its status is logged without stopping the worker
+    """
+    queue, compiled = queue
+    config = RunConfig(root_inputs={"n0": {"in": "1"}})
+    run_compiled, update_run_output = jobs.run_compiled, jobs.update_run_output
+
+    def fail(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(jobs, "run_compiled", fail)
+    run_id, future = await queue.submit(compiled, config, "g", wait=True)
+    with pytest.raises(RuntimeError, match="boom"):
+        await future
+    await queue._queue.join()
+    run = await get_run_output(run_id)
+    assert (run.status, run.error) == (FAILED, "boom")
+
+    async def unavailable(*args):
+        raise ConnectionError("db unavailable")
+
+    monkeypatch.setattr(jobs, "update_run_output", unavailable)
+    await queue.submit(compiled, config, "g")
+    await queue._queue.join()
+
+    monkeypatch.setattr(jobs, "run_compiled", run_compiled)
+    monkeypatch.setattr(jobs, "update_run_output", update_run_output)
+    run_id, future = await queue.submit(compiled, config, "g", wait=True)
+    await asyncio.wait_for(future, timeout=10)
+    assert (await get_run_output(run_id)).status == DONE
+
+
+async def test_compiled_graph_is_sent_to_a_worker_once(queue, monkeypatch):
+    queue, compiled = queue
+    config = RunConfig(root_inputs={"n0": {"in": "1"}})
+    sent = []
+    run_resident = jobs.run_resident
+
+    def record_run_resident(key, compiled, config, run_id):
+        sent.append(compiled is not None)
+        return run_resident(key, compiled, config, run_id)
+
+    monkeypatch.setattr(jobs, "run_resident", record_run_resident)
+    for _ in range(2):
+        run_id, future = await queue.submit(compiled, config, "g", wait=True)
+        await asyncio.wait_for(future, timeout=10)
+    # the first run finds no graph in the worker and sends it, the second one only sends the config
+    assert sent == [False, True, False]
+    assert (await get_run_output(run_id)).status == DONE
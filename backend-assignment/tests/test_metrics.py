@@ -0,0 +1,37 @@
+import pytest
+from app.utils.database import db as proxy, TimedCursor
+from app.utils.metrics import registry
+from tests.conftest import get_graph
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(registry, "enabled", True)
+    registry.clear()
+    yield registry
+    registry.clear()
+
+
+def count_of(metrics, collection, operation):
+    line = f'mongo_operation_seconds_count{{collection="{collection}",operation="{operation}"}}'
+    return next((int(text.split()[-1]) for text in metrics.render().splitlines() if text.startswith(line)), 0)
+
+
+async def test_cursors_are_timed(client, metrics):
+    await client.post("/graphs/", json=get_graph())
+    cursor = proxy["graph_versions"].find({"graph_id": "g"}).sort("created_at", -1).limit(10)
+    assert isinstance(cursor, TimedCursor)
+    assert len([version async for version in cursor]) == 1
+    assert count_of(metrics, "graph_versions", "find") == 1
+
+    assert len(await proxy["graph_versions"].find({}).to_list(None)) == 1
+    assert len(await proxy["graph_versions"].aggregate([{"$match": {"graph_id": "g"}}]).to_list(None)) == 1
+    assert count_of(metrics, "graph_versions", "find") == 2
+    assert count_of(metrics, "graph_versions", "aggregate") == 1
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert 'operation="insert_one"' in response.text
+    assert 'cache_hits{cache="run_result"}' in response.text
@@ -0,0 +1,41 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from app.models import RunOutput
+from app.utils.api import save_run_outputs
+
+pytestmark = pytest.mark.anyio
+
+
+async def get_pages(client, url, items, limit=2):
+    """ Follow next_before/next_before_id from page to page and return the items of all pages """
+    found, params = [], {"limit": limit}
+    while True:
+        page = (await client.get(url, params=params)).json()
+        found += page[items]
+        if page["next_before"] is None:
+            return found
+        params = {"limit": limit, "before": page["next_before"], "before_id": page["next_before_id"]}
+
+
+async def test_runs_created_at_the_same_time_are_all_listed(client):
+    """
+    Runs sharing a created_at are ordered by run_id, so a page boundary between them skips or repeats none
+    """
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    created = [now] * 3 + [now - timedelta(seconds=1)] * 2
+    await save_run_outputs([
+        RunOutput(run_id=f"r{i}", graph_id="g", created_at=created_at) for i, created_at in enumerate(created)
+    ])
+
+    runs = await get_pages(client, "/graphs/g/runs", "runs")
+    assert [run["run_id"] for run in runs] == ["r2", "r1", "r0", "r4", "r3"]
+
+
+async def test_versions_created_at_the_same_time_are_all_listed(client, db):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    db["graph_versions"].collection.insert_many([
+        {"graph_id": "g", "version_hash": f"v{i}", "parent_hash": None, "created_at": now} for i in range(3)
+    ])
+
+    versions = await get_pages(client, "/graphs/g/versions", "versions")
+    assert [version["version_hash"] for version in versions] == ["v2", "v1", "v0"]
@@ -0,0 +1,131 @@
+import pytest
+from datetime import datetime, timezone
+from app.models import Graph, GraphPatch
+from app.utils import api
+from app.utils.connectivity import IslandTracker
+from app.utils.graph_patch import PatchedGraph, get_patch_operations
+from tests.conftest import get_graph
+
+pytestmark = pytest.mark.anyio
+
+ADD_NODE = {
+    "add_nodes": [{"id": "n3", "data_in": {"in": "0"}, "data_out": {"out": "3"}}],
+    "add_edges": [{"id": "e2", "src_node": "n2", "dst_node": "n3", "src_to_dst_data_keys": {"out": "in"}}],
+    "update_nodes": [{"id": "n1", "data_out": {"out": "x"}}],
+}
+
+
+async def test_patch_applies_and_saves_version(client, db):
+    await client.post("/graphs/", json=get_graph())
+    response = await client.patch("/graphs/g", json=ADD_NODE)
+    assert response.status_code == 200
+    assert response.json()["island_count"] == 1
+
+    graph = (await client.get("/graphs/g")).json()
+    nodes = {node["id"]: node for node in graph["nodes"]}
+    assert nodes["n3"]["paths_in"] == ["e2"]
+    assert nodes["n2"]["paths_out"] == ["e2"]
+    assert nodes["n1"]["data_out"] == {"out": "x"}
+
+    document = db["graphs"].collection.find_one({"_id": "g"})
+    assert document["version"] == 2 and "patch" not in document
+    versions = (await client.get("/graphs/g/versions")).json()["versions"]
+    assert [version["version_hash"] for version in versions][0] == document["version_hash"]
+    assert len(versions) == 2
+
+
+@pytest.mark.parametrize(
+    "patch, violation",
+    [
+        ({"update_nodes": [{"id": "n1", "data_out": {"out": "a"}}, {"id": "n1", "data_in": {"in": "b"}}]}, "Node n1 is updated more than once."),
+        (
+            {"update_edges": [{"id": "e0", "src_to_dst_data_keys": {"out": "in"}}] * 2},
+            "Edge e0 is updated more than once.",
+        ),
+        ({"add_nodes": [{"id": "n9", "data_in": {}, "data_out": {"out": "9"}}] * 2}, "Node n9 is added more than once."),
+        (
+            {"add_edges": [{"id": "e9", "src_node": "n0", "dst_node": "n2", "src_to_dst_data_keys": {"out": "in"}}] * 2},
+            "Edge e9 is added more than once.",
+        ),
+        ({"remove_nodes": ["n9"]}, "Node n9 does not exist."),
+        (
+            {"add_edges": [{"id": "e9", "src_node": "n2", "dst_node": "n0", "src_to_dst_data_keys": {"out": "in"}}]},
+            "Edge e9 creates a cycle.",
+        ),
+    ],
+)
+async def test_invalid_patch_is_rejected(client, db, patch, violation):
+    await client.post("/graphs/", json=get_graph())
+    response = await client.patch("/graphs/g", json=patch)
+    assert response.status_code == 400
+    assert violation in response.json()["detail"]
+    assert db["graphs"].collection.find_one({"_id": "g"})["version"] == 1
+
+
+def test_empty_update_adds_no_array_filter():
+    """ Mongo rejects an update with an array filter it does not use """
+    graph = Graph(**get_graph())
+    patch = GraphPatch(update_nodes=[{"id": "n0"}, {"id": "n1", "data_out": {"out": "x"}}])
+    operations = get_patch_operations("g", PatchedGraph(graph, patch), IslandTracker.from_graph(graph))
+    assert operations[0]._doc == {"$set": {"nodes.$[n1].data_out": {"out": "x"}}}
+    assert operations[0]._array_filters == [{"n1.id": "n1"}]
+
+    operations = get_patch_operations("g", PatchedGraph(graph, GraphPatch(update_nodes=[{"id": "n0"}])), IslandTracker.from_graph(graph))
+    assert len(operations) == 1  # only the version bump
+
+
+async def test_patch_of_changed_graph_conflicts(client, db, monkeypatch):
+    """
+    A graph changed between reading and writing it is left as the other request wrote it, and 409 is returned
+    """
+    await client.post("/graphs/", json=get_graph())
+    get_patch_violations = api.get_patch_violations
+
+    def change_graph(view):
+        db["graphs"].collection.update_one({"_id": "g"}, {"$inc": {"version": 1}})
+        return get_patch_violations(view)
+
+    monkeypatch.setattr(api, "get_patch_violations", change_graph)
+    response = await client.patch("/graphs/g", json=ADD_NODE)
+    assert response.status_code == 409
+    document = db["graphs"].collection.find_one({"_id": "g"})
+    assert len(document["nodes"]) == 3 and "patch" not in document
+    # the version of the rejected patch is not in the history
+    assert len((await client.get("/graphs/g/versions")).json()["versions"]) == 1
+
+    # the graph is held while another patch writes it
+    monkeypatch.setattr(api, "get_patch_violations", get_patch_violations)
+    db["graphs"].collection.update_one({"_id": "g"}, {"$set": {"patch": "other", "patch_started_at": datetime.now(timezone.utc)}})
+    assert (await client.patch("/graphs/g", json=ADD_NODE)).status_code == 409
+
+    db["graphs"].collection.update_one({"_id": "g"}, {"$unset": {"patch": "", "patch_started_at": ""}})
+    assert (await client.patch("/graphs/g", json=ADD_NODE)).status_code == 200
+
+
+async def test_update_of_held_graph_conflicts(client, db):
+    """
+    A PUT does not overwrite a graph while a patch writes it, a stale hold is cleared by the PUT
+    """
+    await client.post("/graphs/", json=get_graph())
+    db["graphs"].collection.update_one({"_id": "g"}, {"$set": {"patch": "other", "patch_started_at": datetime.now(timezone.utc)}})
+    assert (await client.put("/graphs/g", json=get_graph(count=4))).status_code == 409
+    assert len(db["graphs"].collection.find_one({"_id": "g"})["nodes"]) == 3
+
+    db["graphs"].collection.update_one({"_id": "g"}, {"$set": {"patch_started_at": datetime(2000, 1, 1, tzinfo=timezone.utc)}})
+    assert (await client.put("/graphs/g", json=get_graph(count=4))).status_code == 200
+    document = db["graphs"].collection.find_one({"_id": "g"})
+    assert len(document["nodes"]) == 4 and "patch" not in document
+
+
+async def test_update_appends_version_with_parent(client):
+    await client.post("/graphs/", json=get_graph())
+    created = (await client.get("/graphs/g/versions")).json()["versions"][0]["version_hash"]
+    assert (await client.put("/graphs/g", json=get_graph(count=4))).status_code == 200
+    # saving the same graph again adds no version
+    assert (await client.put("/graphs/g", json=get_graph(count=4))).status_code == 200
+    assert (await client.put("/graphs/missing", json=get_graph(count=4, id="missing"))).status_code == 404
+
+    versions = (await client.get("/graphs/g/versions")).json()["versions"]
+    assert [version["parent_hash"] for version in versions] == [created, None]
+    assert (await client.get(f"/graphs/g/versions/{created}")).json()["nodes"][-1]["id"] == "n2"
+    assert (await client.get("/graphs/missing/versions")).json()["versions"] == []
@@ -0,0 +1,128 @@
+import pytest
+from datetime import datetime, timedelta
+from app.routers import run_router
+from app.utils import api
+from app.utils.api import ensure_indexes, get_compiled_graph
+from app.utils.cache import run_result_cache
+from tests.conftest import get_graph
+
+pytestmark = pytest.mark.anyio
+
+CONFIG = {"root_inputs": {"n0": {"in": "1"}}}
+
+
+async def run(client, config=CONFIG, **params):
+    response = await client.post("/run", params={"graph_id": "g", "wait": True, **params}, json=config)
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_equivalent_run_is_served_from_cache(client):
+    await client.post("/graphs/", json=get_graph())
+    first = await run(client)
+    assert not first["cached"]
+
+    again = await run(client, config={**CONFIG, "enable_list": []})
+    assert again["cached"] and again["run_id"] == first["run_id"]
+    assert again["outputs"] == first["outputs"]
+
+    fresh = await run(client, fresh_run_id=True)
+    assert fresh["cached"] and fresh["run_id"] != first["run_id"]
+    assert (await client.get(f"/runs/{fresh['run_id']}")).json()["node_outputs"] == first["outputs"]
+    assert not (await run(client, use_cache=False))["cached"]
+
+    # a change of the graph is a new version, runs of the old one are not reused
+    await client.put("/graphs/g", json=get_graph(count=4))
+    assert not (await run(client))["cached"]
+
+
+async def test_run_results_expire(client, db):
+    """
+    Run results carry their own expiry, the TTL index only removes them once it has passed
+    """
+    await ensure_indexes()
+    indexes = db["run_results"].collection.index_information()
+    assert indexes["expires_at_1"]["expireAfterSeconds"] == 0
+    assert "created_at_1" not in indexes
+
+    await client.post("/graphs/", json=get_graph())
+    await run(client)
+    result = db["run_results"].collection.find_one()
+    assert result["expires_at"] - result["created_at"] == timedelta(seconds=run_result_cache.ttl)
+
+    # expired but not removed yet by the server
+    db["run_results"].collection.update_one({}, {"$set": {"expires_at": datetime(2000, 1, 1)}})
+    run_result_cache.clear()
+    assert not (await run(client))["cached"]
+
+
+async def test_batch_runs_equivalent_configs_once(client, monkeypatch):
+    await client.post("/graphs/", json=get_graph())
+    batches = []
+    run_compiled_batch = run_router.run_compiled_batch
+
+    async def record_batch(compiled, configs):
+        batches.append(len(configs))
+        return await run_compiled_batch(compiled, configs)
+
+    monkeypatch.setattr(run_router, "run_compiled_batch", record_batch)
+    other = {"root_inputs": {"n0": {"in": "2"}}}
+    response = await client.post("/run/batch", params={"graph_id": "g"}, json=[CONFIG, other, CONFIG])
+    runs = response.json()["runs"]
+    assert batches == [2]
+    assert [run["cached"] for run in runs] == [False, False, True]
+    assert runs[2]["run_id"] == runs[0]["run_id"] and runs[2]["outputs"] == runs[0]["outputs"]
+    assert runs[1]["run_id"] != runs[0]["run_id"]
+
+    response = await client.post("/run/batch", params={"graph_id": "g", "use_cache": False}, json=[CONFIG, CONFIG])
+    assert batches == [2, 2]
+    assert [run["cached"] for run in response.json()["runs"]] == [False, False]
+
+
+async def test_compiled_graph_is_served_without_reading_the_graph(client, db, monkeypatch):
+    await client.post("/graphs/", json=get_graph())
+    reads = []
+    find_one = db["graphs"].find_one
+
+    async def record_find_one(*args, **kwargs):
+        reads.append(args)
+        return await find_one(*args, **kwargs)
+
+    monkeypatch.setattr(db["graphs"], "find_one", record_find_one)
+    compiled = await get_compiled_graph("g")
+    assert await get_compiled_graph("g") is compiled
+    assert len(reads) == 2  # version check and the graph itself, the second call reads nothing
+
+    # checked against the stored version once the entry is older than GRAPH_CACHE_CHECK_AFTER
+    monkeypatch.setattr(api, "GRAPH_CACHE_CHECK_AFTER", 0)
+    db["graphs"].collection.update_one({}, {"$inc": {"version": 1}})
+    assert await get_compiled_graph("g") is not compiled
+    assert len(reads) == 4
+
+
+async def test_batch_reads_and_writes_the_cache_in_bulk(client, db, monkeypatch):
+    await client.post("/graphs/", json=get_graph())
+    configs = [{"root_inputs": {"n0": {"in": str(i)}}} for i in range(3)]
+    await client.post("/run/batch", params={"graph_id": "g"}, json=configs)
+    run_result_cache.clear()
+
+    calls = []
+    for name in ("run_results", "run_node_outputs", "run_outputs"):
+        collection = db[name]
+        for method in ("find", "find_one", "replace_one", "bulk_write", "insert_one", "insert_many"):
+            original = getattr(collection, method)
+
+            def record(*args, original=original, name=name, method=method, **kwargs):
+                calls.append((name, method))
+                return original(*args, **kwargs)
+            monkeypatch.setattr(collection, method, record)
+
+    response = await client.post("/run/batch", params={"graph_id": "g", "fresh_run_id": True}, json=configs + [{"root_inputs": {"n0": {"in": "new"}}}])
+    runs = response.json()["runs"]
+    assert [run["cached"] for run in runs] == [True, True, True, False]
+    assert sorted(calls) == sorted([
+        ("run_results", "find"), ("run_node_outputs", "find"),  # results of the cached runs
+        ("run_outputs", "insert_many"), ("run_node_outputs", "insert_many"),  # the new run and the copies of the cached ones
+        ("run_results", "bulk_write"),
+    ])
+    assert (await client.get(f"/runs/{runs[0]['run_id']}")).json()["node_outputs"] == runs[0]["outputs"]